@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from datetime import datetime
 from database import init_database, execute_query
+from dashboard_stats import get_dashboard_stats
 from utils.styles import apply_custom_styles, navbar_component, card_metric_v5
 from ai_assistant import get_crm_context, chat_with_llm
 
@@ -59,18 +59,12 @@ navbar_component("Dashboard")
 # --- DASHBOARD SECTION ---
 
 def get_stats():
-    clients = execute_query("SELECT COUNT(*) as c FROM customers")[0]['c']
-    services = execute_query("SELECT COUNT(*) as c FROM services")[0]['c']
-    employees = execute_query("SELECT COUNT(*) as c FROM employees")[0]['c']
-    
-    today = datetime.now().strftime("%Y-%m-%d")
-    appointments = execute_query("SELECT COUNT(*) as c FROM appointments")[0]['c'] 
-    
+    stats = get_dashboard_stats()
     return {
-        "clients": clients,
-        "services": services,
-        "employees": employees,
-        "appointments": appointments
+        "clients": stats['customers'],
+        "services": stats['services'],
+        "employees": stats['employees'],
+        "appointments": stats['appointments_total']
     }
 
 stats = get_stats()
@@ -147,12 +141,10 @@ with c_list:
 # --- CHAT HISTORY & INPUT (Remains at Bottom) ---
 st.markdown("<hr style='border: 0; height: 1px; background-image: linear-gradient(to right, rgba(0, 0, 0, 0), rgba(0, 0, 0, 0.1), rgba(0, 0, 0, 0)); margin-top: 2rem; margin-bottom: 2rem;'>", unsafe_allow_html=True)
 
-for msg in st.session_state.chat_history:
-    role = msg["role"]
-    content = msg["content"]
-    
+def render_chat_message(role, content, target=st):
+    """Zeichnet eine Chat-Nachricht (target: st oder ein st.empty()-Platzhalter)"""
     if role == "user":
-        st.markdown(f"""
+        target.markdown(f"""
             <div style="display: flex; justify-content: flex-end; margin-bottom: 1rem;">
                 <div style="background: #ffffff; color: #4a403a; padding: 0.8rem 1.2rem; border-radius: 12px; max-width: 80%; border: 1px solid #e6e2dd; box-shadow: 0 1px 4px rgba(0,0,0,0.05);">
                     {content}
@@ -160,7 +152,7 @@ for msg in st.session_state.chat_history:
             </div>
         """, unsafe_allow_html=True)
     else:
-        st.markdown(f"""
+        target.markdown(f"""
             <div style="display: flex; justify-content: flex-start; margin-bottom: 1rem; gap: 0.5rem;">
                 <div style="min-width: 28px; height: 28px; background: #b08968; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-size: 0.8rem; color: white;">AI</div>
                 <div style="color: #4a403a; line-height: 1.5; padding-top: 0.2rem;">
@@ -169,6 +161,9 @@ for msg in st.session_state.chat_history:
             </div>
         """, unsafe_allow_html=True)
 
+for msg in st.session_state.chat_history:
+    render_chat_message(msg["role"], msg["content"])
+
 # Add spacing for fixed input
 st.markdown("<div style='margin-bottom: 100px;'></div>", unsafe_allow_html=True)
 
@@ -233,10 +228,15 @@ if prompt:
     # Render User Message
     st.session_state.chat_history.append({"role": "user", "content": prompt})
     
-    # LLM Interaction
+    render_chat_message("user", prompt)
+    
+    # LLM Interaction: Antwort wird Stück für Stück angezeigt, sobald Ollama Tokens liefert
+    answer_placeholder = st.empty()
+    response_content = ""
     try:
-        import requests
         import os
+        from ai_assistant import stream_ollama
+        from response_cache import response_cache, make_key
         
         # Determine Ollama URL
         try:
@@ -244,38 +244,47 @@ if prompt:
         except:
             ollama_url = os.getenv("OLLAMA_HOST", "http://localhost:11434")
             
-        # Ensure API endpoint path
-        if not ollama_url.endswith("/api/chat"):
-             ollama_url = f"{ollama_url.rstrip('/')}/api/chat"
+        # Basis-URL (ältere Konfigurationen enthalten noch den /api/chat-Pfad)
+        ollama_url = ollama_url.rstrip('/')
+        if ollama_url.endswith("/api/chat"):
+            ollama_url = ollama_url[:-len("/api/chat")]
         
         # Prepare Context
         context = "" 
         try:
             from ai_assistant import get_crm_context
-            context = get_crm_context()
+            context = get_crm_context(prompt)
         except:
             pass
 
-        payload = {
-            "model": "llama3.2",
-            "messages": [
-                {"role": "system", "content": f"Du bist der BeautyAI Salon Manager. CRM Context: {context}. Antworte freundlich und kurz auf Deutsch."},
-                {"role": "user", "content": prompt}
-            ],
-            "stream": False
-        }
+        system = f"Du bist der BeautyAI Salon Manager. CRM Context: {context}. Antworte freundlich und kurz auf Deutsch."
         
-        with st.spinner("BeautyAI denkt nach..."):
-            res = requests.post(ollama_url, json=payload, timeout=30) 
-            
-        if res.status_code == 200:
-            response_content = res.json()['message']['content']
-            st.session_state.chat_history.append({"role": "assistant", "content": response_content})
+        # Wiederholte Frage bei unveränderten CRM-Daten: Antwort aus dem Cache
+        cache_key = make_key(prompt, "llama3.2", system)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            response_content = cached
         else:
-            err_msg = f"Fehler: {res.status_code} - Der AI Server hat ein Problem."
-            st.session_state.chat_history.append({"role": "assistant", "content": err_msg})
+            with st.spinner("BeautyAI denkt nach..."):
+                tokens = stream_ollama(prompt, "llama3.2", system=system, base_url=ollama_url)
+                # Spinner nur bis zum ersten Token
+                response_content = next(tokens, "")
+            render_chat_message("assistant", response_content + " ▌", answer_placeholder)
+            for token in tokens:
+                response_content += token
+                render_chat_message("assistant", response_content + " ▌", answer_placeholder)
+            if response_content:
+                response_cache.put(cache_key, response_content)
+        
+        if not response_content:
+            response_content = "Fehler: Der AI Server hat keine Antwort geliefert."
+        st.session_state.chat_history.append({"role": "assistant", "content": response_content})
             
     except Exception as e:
-        st.session_state.chat_history.append({"role": "assistant", "content": f"Verbindungsfehler: {str(e)}"})
+        if response_content:
+            response_content += f"\n\nVerbindungsfehler: {str(e)}"
+        else:
+            response_content = f"Verbindungsfehler: {str(e)}"
+        st.session_state.chat_history.append({"role": "assistant", "content": response_content})
     
     st.rerun()
@@ -2,11 +2,16 @@
 AI Assistant für das CRM-System
 Unterstützt Ollama (lokal/Cloud) und Cloud-LLM-APIs als Fallback
 """
+import asyncio
 import requests
+import httpx
 import json
-from typing import Optional, List, Dict
-from datetime import datetime
+import threading
+import time
+from typing import Optional, List, Dict, Iterator, Tuple
 import os
+from requests.adapters import HTTPAdapter
+from llm_router import LLMRouter, Provider, NoProviderAvailableError, AllProvidersFailedError
 
 # Ollama URL - kann über Environment-Variable konfiguriert werden
 # Für lokale Entwicklung: http://localhost:11434
@@ -19,102 +24,204 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 USE_CLOUD_API = os.getenv("USE_CLOUD_API", "false").lower() == "true"
 
-def check_ollama_available() -> bool:
-    """Prüft ob Ollama läuft"""
+# HTTP-Verbindungen: getrennte Timeouts für Verbindungsaufbau und Antwort (Sekunden)
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "3"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))  # gleichzeitige Async-Anfragen pro Provider
+OLLAMA_READ_TIMEOUT = 8  # Vercel Hobby Plan hat 10s Limit
+CLOUD_READ_TIMEOUT = 30
+# Erhöhter Timeout für Hugging Face Spaces (Cold Start); wird durch den Cache selten fällig
+HEALTH_READ_TIMEOUT = 15
+
+# Wie lange (Sekunden) ein Ollama-Status gilt; Ausfälle werden früher erneut geprüft
+OLLAMA_HEALTH_TTL = float(os.getenv("OLLAMA_HEALTH_TTL", "30"))
+OLLAMA_DOWN_TTL = float(os.getenv("OLLAMA_DOWN_TTL", "10"))
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Beauty-CRM/1.0',
+    'Accept': 'application/json',
+    'Content-Type': 'application/json'
+}
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+def get_http_session(backend: str) -> requests.Session:
+    """Gibt die gemeinsame Session eines Backends zurück (Keep-Alive, begrenzter Pool)"""
+    session = _sessions.get(backend)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(backend)
+            if session is None:
+                session = requests.Session()
+                # Keine automatischen Wiederholungen: ein hängendes Backend soll schnell zum Fallback führen
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_POOL_SIZE,
+                                      max_retries=0, pool_block=False)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update(DEFAULT_HEADERS)
+                _sessions[backend] = session
+    return session
+
+_ollama_health = {'available': False, 'models': [], 'error': None,
+                  'status_code': None, 'response_preview': None, 'expires': 0.0}
+_health_lock = threading.Lock()
+
+def _tags_status(status_code: int, text: str, data: Optional[Dict]) -> Dict:
+    """Status aus der Antwort von /api/tags"""
+    result = {'available': False, 'models': [], 'error': None,
+              'status_code': status_code, 'response_preview': None}
+    if status_code == 200:
+        result['available'] = True
+        models = [model['name'] for model in (data or {}).get('models', [])]
+        # Entferne :latest Suffix für bessere Lesbarkeit
+        result['models'] = [m.replace(':latest', '') if ':latest' in m else m for m in models]
+    else:
+        result['response_preview'] = text[:200] if text else None
+        result['error'] = f"HTTP {status_code}: {text[:100]}"
+        print(f"Ollama check failed: Status {status_code}, Response: {text[:200]}, URL: {OLLAMA_BASE_URL}")
+    return result
+
+def _probe_error(e: Exception) -> Dict:
+    """Status für eine fehlgeschlagene Abfrage von /api/tags (requests oder httpx)"""
+    if isinstance(e, (requests.exceptions.Timeout, httpx.TimeoutException)):
+        error = f"Timeout ({HEALTH_READ_TIMEOUT:g}s) - Hugging Face Spaces könnte im Cold Start sein"
+    elif isinstance(e, requests.exceptions.SSLError):
+        error = f"SSL Error: {str(e)[:150]}"
+    elif isinstance(e, (requests.exceptions.ConnectionError, httpx.TransportError)):
+        error = f"Connection Error: {str(e)[:150]}"
+    else:
+        error = f"{type(e).__name__}: {str(e)[:150]}"
+    print(f"Ollama check error: {error}, URL: {OLLAMA_BASE_URL}")
+    return {'available': False, 'models': [], 'error': error,
+            'status_code': None, 'response_preview': None}
+
+def _probe_ollama() -> Dict:
+    """Fragt /api/tags ab und liefert Status, Modelle und ggf. Fehlerdetails"""
     try:
-        # Erhöhter Timeout für Hugging Face Spaces
-        # Füge Headers hinzu für bessere Kompatibilität
-        headers = {
-            'User-Agent': 'Beauty-CRM/1.0',
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
-        response = requests.get(
-            f"{OLLAMA_BASE_URL}/api/tags", 
-            timeout=15,  # Erhöht auf 15s für Hugging Face Spaces
-            headers=headers,
+        response = get_http_session("ollama").get(
+            f"{OLLAMA_BASE_URL}/api/tags",
+            timeout=(LLM_CONNECT_TIMEOUT, HEALTH_READ_TIMEOUT),
             verify=True  # SSL-Verifikation aktivieren
         )
-        if response.status_code == 200:
-            return True
-        else:
-            print(f"Ollama check failed: Status {response.status_code}, Response: {response.text[:200]}, URL: {OLLAMA_BASE_URL}")
-            return False
-    except requests.exceptions.Timeout:
-        print(f"Ollama timeout (15s): URL {OLLAMA_BASE_URL}")
-        return False
-    except requests.exceptions.ConnectionError as e:
-        print(f"Ollama connection error: {e}, URL: {OLLAMA_BASE_URL}")
-        return False
-    except requests.exceptions.SSLError as e:
-        print(f"Ollama SSL error: {e}, URL: {OLLAMA_BASE_URL}")
-        return False
+        return _tags_status(response.status_code, response.text,
+                            response.json() if response.status_code == 200 else None)
     except Exception as e:
-        print(f"Ollama check error: {type(e).__name__}: {e}, URL: {OLLAMA_BASE_URL}")
-        return False
+        return _probe_error(e)
+
+def _store_ollama_status(status: Dict) -> Dict:
+    ttl = OLLAMA_HEALTH_TTL if status['available'] else OLLAMA_DOWN_TTL
+    _ollama_health.update(status, expires=time.monotonic() + ttl)
+    return {key: value for key, value in _ollama_health.items() if key != 'expires'}
+
+def get_ollama_status(force: bool = False) -> Dict:
+    """Gecachter Ollama-Status (available, models, error, status_code, response_preview)"""
+    with _health_lock:
+        if force or _ollama_health['expires'] <= time.monotonic():
+            return _store_ollama_status(_probe_ollama())
+        return {key: value for key, value in _ollama_health.items() if key != 'expires'}
+
+def mark_ollama_unavailable(error: str):
+    """Merkt einen Ausfall aus einer echten Anfrage vor, statt bis zum Ablauf der TTL weiter zu warten"""
+    with _health_lock:
+        _ollama_health.update(available=False, error=error,
+                              expires=time.monotonic() + OLLAMA_DOWN_TTL)
+
+def check_ollama_available(force: bool = False) -> bool:
+    """Prüft ob Ollama läuft (Ergebnis wird OLLAMA_HEALTH_TTL Sekunden gecacht)"""
+    return get_ollama_status(force)['available']
+
+def _ollama_enabled() -> bool:
+    """Ollama als Provider aktiv? Liest nur den gecachten Status, prüft also nie per HTTP
+
+    Die Einstiegspunkte (chat_with_llm, stream_chat_with_llm, async_chat_with_llm)
+    aktualisieren den Status vorher, synchron bzw. ohne die Event-Loop zu blockieren.
+    """
+    return not USE_CLOUD_API and _ollama_health['available']
 
 def get_available_models() -> List[str]:
-    """Holt verfügbare Ollama-Modelle"""
-    try:
-        # Erhöhter Timeout für Hugging Face Spaces
-        headers = {
-            'User-Agent': 'Beauty-CRM/1.0',
-            'Accept': 'application/json'
-        }
-        response = requests.get(
-            f"{OLLAMA_BASE_URL}/api/tags", 
-            timeout=15,
-            headers=headers
-        )
-        if response.status_code == 200:
-            data = response.json()
-            models = [model['name'] for model in data.get('models', [])]
-            # Entferne :latest Suffix für bessere Lesbarkeit
-            return [m.replace(':latest', '') if ':latest' in m else m for m in models]
-        else:
-            print(f"Error getting models: Status {response.status_code}")
-    except Exception as e:
-        print(f"Error getting models: {type(e).__name__}: {e}")
-    return []
+    """Holt verfügbare Ollama-Modelle (aus derselben gecachten Statusabfrage)"""
+    return list(get_ollama_status()['models'])
 
 def download_model(model_name: str = "llama3.2") -> bool:
     """Lädt ein Ollama-Modell herunter"""
     try:
-        response = requests.post(
+        response = get_http_session("ollama").post(
             f"{OLLAMA_BASE_URL}/api/pull",
             json={"name": model_name},
             stream=True,
-            timeout=300
+            timeout=(LLM_CONNECT_TIMEOUT, 300)
         )
-        if response.status_code == 200:
-            return True
+        with response:
+            if response.status_code == 200:
+                # Neues Modell soll sofort in der Modellliste erscheinen
+                get_ollama_status(force=True)
+                return True
     except Exception as e:
         print(f"Fehler beim Download: {e}")
     return False
 
+def _ollama_complete(prompt: str, model: str = "llama3.2") -> str:
+    """Eine Antwort von Ollama (/api/generate); wirft bei Fehlern"""
+    # Normalisiere Model-Name (füge :latest hinzu falls nicht vorhanden)
+    model_name = model if ':' in model else f"{model}:latest"
+    try:
+        response = get_http_session("ollama").post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json={
+                "model": model_name,
+                "prompt": prompt,
+                "stream": False
+            },
+            timeout=(LLM_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+        )
+    except requests.exceptions.ConnectionError as e:
+        mark_ollama_unavailable(f"Connection Error: {str(e)[:150]}")
+        raise
+    if response.status_code != 200:
+        raise RuntimeError(f"Ollama API Error: Status {response.status_code}, Response: {response.text[:200]}")
+    return response.json().get('response') or 'Keine Antwort erhalten'
+
+def _openai_complete(prompt: str, model: str = "gpt-3.5-turbo") -> str:
+    """Eine Antwort von OpenAI; wirft bei Fehlern"""
+    response = get_http_session("openai").post(
+        "https://api.openai.com/v1/chat/completions",
+        headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
+        json={
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 500
+        },
+        timeout=(LLM_CONNECT_TIMEOUT, CLOUD_READ_TIMEOUT)
+    )
+    response.raise_for_status()
+    return response.json()['choices'][0]['message']['content']
+
+def _anthropic_complete(prompt: str, model: str = "claude-3-haiku-20240307") -> str:
+    """Eine Antwort von Anthropic; wirft bei Fehlern"""
+    response = get_http_session("anthropic").post(
+        "https://api.anthropic.com/v1/messages",
+        headers={
+            "x-api-key": ANTHROPIC_API_KEY,
+            "anthropic-version": "2023-06-01"
+        },
+        json={
+            "model": model,
+            "max_tokens": 500,
+            "messages": [{"role": "user", "content": prompt}]
+        },
+        timeout=(LLM_CONNECT_TIMEOUT, CLOUD_READ_TIMEOUT)
+    )
+    response.raise_for_status()
+    return response.json()['content'][0]['text']
+
 def chat_with_openai(prompt: str, model: str = "gpt-3.5-turbo") -> Optional[str]:
     """Verwendet OpenAI API als Fallback"""
     if not OPENAI_API_KEY:
         return None
     
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": model,
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": 500
-            },
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data['choices'][0]['message']['content']
+        return _openai_complete(prompt, model)
     except Exception as e:
         print(f"OpenAI Error: {e}")
     return None
@@ -125,131 +232,379 @@ def chat_with_anthropic(prompt: str, model: str = "claude-3-haiku-20240307") ->
         return None
     
     try:
-        response = requests.post(
-            "https://api.anthropic.com/v1/messages",
-            headers={
-                "x-api-key": ANTHROPIC_API_KEY,
-                "anthropic-version": "2023-06-01",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": model,
-                "max_tokens": 500,
-                "messages": [{"role": "user", "content": prompt}]
-            },
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data['content'][0]['text']
+        return _anthropic_complete(prompt, model)
     except Exception as e:
         print(f"Anthropic Error: {e}")
     return None
 
-def chat_with_llm(prompt: str, model: str = "llama3.2", context: Optional[str] = None) -> str:
+def _failure_message(error: AllProvidersFailedError) -> str:
+    """Benutzerfreundliche Meldung zum zuletzt fehlgeschlagenen Provider"""
+    name, e = list(error.errors.items())[-1]
+    if isinstance(e, (requests.exceptions.Timeout, httpx.TimeoutException)):
+        return "⏱️ Die Anfrage dauerte zu lange. Hugging Face Spaces könnte im Cold Start sein. Bitte versuchen Sie es erneut."
+    if isinstance(e, (requests.exceptions.ConnectionError, httpx.TransportError)):
+        return f"❌ Verbindungsfehler zu {name}: {str(e)[:100]}"
+    return f"❌ Fehler: {str(e)[:100]}"
+
+def chat_with_llm(prompt: str, model: str = "llama3.2", context: Optional[str] = None,
+                  hedge: Optional[bool] = None) -> str:
     """Sendet eine Nachricht an die LLM und erhält eine Antwort
-    Versucht zuerst Ollama, dann Cloud-APIs als Fallback
+    Versucht zuerst Ollama, dann Cloud-APIs als Fallback (Provider mit offenem
+    Circuit Breaker werden übersprungen, hedge=True startet langsame Fallbacks parallel)
     """
     # Erweitere den Prompt mit Kontext, falls vorhanden
     full_prompt = prompt
     if context:
         full_prompt = f"Kontext: {context}\n\nFrage: {prompt}"
     
-    # Versuche zuerst Ollama
-    if not USE_CLOUD_API and check_ollama_available():
-        try:
-            # Normalisiere Model-Name (füge :latest hinzu falls nicht vorhanden)
-            model_name = model if ':' in model else f"{model}:latest"
-            
-            # Headers für bessere Kompatibilität
-            headers = {
-                'User-Agent': 'Beauty-CRM/1.0',
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            }
-            
-            # Erhöhter Timeout für Hugging Face Spaces (kann bei Cold Start länger dauern)
-            # Vercel Hobby Plan hat 10s Limit, daher reduzieren wir auf 8s für Sicherheit
-            response = requests.post(
-                f"{OLLAMA_BASE_URL}/api/generate",
-                json={
-                    "model": model_name,
-                    "prompt": full_prompt,
-                    "stream": False
-                },
-                headers=headers,
-                timeout=8  # Reduziert für Vercel Hobby Plan (10s Limit)
-            )
-            
+    if not USE_CLOUD_API:
+        get_ollama_status()
+    try:
+        return llm_router.complete(full_prompt, model, hedge)
+    except NoProviderAvailableError:
+        # Keine API verfügbar
+        return "❌ Keine AI-API verfügbar. Bitte Ollama installieren oder eine Cloud-API konfigurieren (OpenAI/Anthropic)."
+    except AllProvidersFailedError as e:
+        print(f"LLM Error: {e}")
+        return _failure_message(e)
+
+# Fehlermeldungen, die chat_with_llm/stream_chat_with_llm statt einer Antwort liefern
+ERROR_PREFIXES = ("❌", "⏱️")
+
+def is_error_response(text: str) -> bool:
+    """True, wenn der Text eine Fehlermeldung statt einer LLM-Antwort ist (nicht cachen)"""
+    return not text or text.startswith(ERROR_PREFIXES) or "\n\n❌ " in text
+
+def _iter_sse(response) -> Iterator[Tuple[str, str]]:
+    """Liest Server-Sent Events einer gestreamten Antwort als (event, data)-Paare"""
+    response.encoding = response.encoding or 'utf-8'
+    event, data = "message", []
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+    if data:
+        yield event, "\n".join(data)
+
+def stream_ollama(prompt: str, model: str = "llama3.2", system: Optional[str] = None,
+                  base_url: Optional[str] = None) -> Iterator[str]:
+    """Streamt die Ollama-Antwort stückweise (NDJSON von /api/generate)
+
+    Der Read-Timeout gilt pro Chunk, begrenzt also die Zeit bis zum ersten Token
+    statt die Dauer der gesamten Antwort.
+    """
+    payload = {
+        "model": model if ':' in model else f"{model}:latest",
+        "prompt": prompt,
+        "stream": True
+    }
+    if system:
+        payload["system"] = system
+    with get_http_session("ollama").post(
+        f"{(base_url or OLLAMA_BASE_URL).rstrip('/')}/api/generate",
+        json=payload,
+        stream=True,
+        timeout=(LLM_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(chunk_size=None):
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('error'):
+                raise RuntimeError(f"Ollama: {chunk['error']}")
+            if chunk.get('response'):
+                yield chunk['response']
+            if chunk.get('done'):
+                break
+
+def stream_openai(prompt: str, model: str = "gpt-3.5-turbo") -> Iterator[str]:
+    """Streamt die OpenAI-Antwort stückweise (SSE)"""
+    with get_http_session("openai").post(
+        "https://api.openai.com/v1/chat/completions",
+        headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Accept": "text/event-stream"},
+        json={
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 500,
+            "stream": True
+        },
+        stream=True,
+        timeout=(LLM_CONNECT_TIMEOUT, CLOUD_READ_TIMEOUT)
+    ) as response:
+        response.raise_for_status()
+        for _, data in _iter_sse(response):
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get('choices') or [{}]
+            content = choices[0].get('delta', {}).get('content')
+            if content:
+                yield content
+
+def stream_anthropic(prompt: str, model: str = "claude-3-haiku-20240307") -> Iterator[str]:
+    """Streamt die Anthropic-Antwort stückweise (SSE)"""
+    with get_http_session("anthropic").post(
+        "https://api.anthropic.com/v1/messages",
+        headers={
+            "x-api-key": ANTHROPIC_API_KEY,
+            "anthropic-version": "2023-06-01",
+            "Accept": "text/event-stream"
+        },
+        json={
+            "model": model,
+            "max_tokens": 500,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True
+        },
+        stream=True,
+        timeout=(LLM_CONNECT_TIMEOUT, CLOUD_READ_TIMEOUT)
+    ) as response:
+        response.raise_for_status()
+        for event, data in _iter_sse(response):
+            if event == "content_block_delta":
+                text = json.loads(data).get('delta', {}).get('text')
+                if text:
+                    yield text
+            elif event == "message_stop":
+                break
+            elif event == "error":
+                raise RuntimeError(f"Anthropic: {json.loads(data).get('error', {}).get('message', data)}")
+
+# --- Async-Client (für die async-Endpunkte in api.py, blockiert die Event-Loop nicht) ---
+
+class _AsyncBackend:
+    """HTTP-Client und Concurrency-Limit eines Backends für eine Event-Loop"""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+            timeout=httpx.Timeout(CLOUD_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        )
+        # Weitere Anfragen warten, statt das Backend zu überlasten
+        self.semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+_async_backends: Dict[str, _AsyncBackend] = {}
+
+def get_async_backend(backend: str) -> _AsyncBackend:
+    """Gibt Client und Semaphore des Backends für die laufende Event-Loop zurück"""
+    async_backend = _async_backends.get(backend)
+    if async_backend is None or async_backend.loop is not asyncio.get_running_loop():
+        async_backend = _async_backends[backend] = _AsyncBackend()
+    return async_backend
+
+async def close_async_clients():
+    """Schließt die Async-Clients (beim Herunterfahren der API)"""
+    for async_backend in list(_async_backends.values()):
+        await async_backend.client.aclose()
+    _async_backends.clear()
+
+async def _apost_json(backend: str, url: str, payload: Dict, read_timeout: float,
+                      headers: Optional[Dict] = None) -> Dict:
+    async_backend = get_async_backend(backend)
+    async with async_backend.semaphore:
+        response = await async_backend.client.post(
+            url, json=payload, headers=headers,
+            timeout=httpx.Timeout(read_timeout, connect=LLM_CONNECT_TIMEOUT)
+        )
+    response.raise_for_status()
+    return response.json()
+
+async def async_get_ollama_status(force: bool = False) -> Dict:
+    """Wie get_ollama_status, prüft aber ohne die Event-Loop zu blockieren"""
+    if not force and _ollama_health['expires'] > time.monotonic():
+        return {key: value for key, value in _ollama_health.items() if key != 'expires'}
+    try:
+        response = await get_async_backend("ollama").client.get(
+            f"{OLLAMA_BASE_URL}/api/tags",
+            timeout=httpx.Timeout(HEALTH_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        )
+        status = _tags_status(response.status_code, response.text,
+                              response.json() if response.status_code == 200 else None)
+    except Exception as e:
+        status = _probe_error(e)
+    with _health_lock:
+        return _store_ollama_status(status)
+
+async def async_check_ollama_available(force: bool = False) -> bool:
+    return (await async_get_ollama_status(force))['available']
+
+async def async_llm_available() -> bool:
+    """True, wenn mindestens ein Provider aktiv ist (Ollama erreichbar oder Cloud-API konfiguriert)
+
+    Ob ein aktiver Provider tatsächlich antwortet, entscheidet erst der Router (Circuit Breaker, Fallback).
+    """
+    if not USE_CLOUD_API:
+        await async_get_ollama_status()
+    return bool(llm_router.candidates())
+
+async def async_download_model(model_name: str = "llama3.2") -> bool:
+    """Lädt ein Ollama-Modell herunter (async)"""
+    try:
+        async with get_async_backend("ollama").client.stream(
+            "POST", f"{OLLAMA_BASE_URL}/api/pull",
+            json={"name": model_name},
+            timeout=httpx.Timeout(300, connect=LLM_CONNECT_TIMEOUT)
+        ) as response:
             if response.status_code == 200:
-                data = response.json()
-                return data.get('response', 'Keine Antwort erhalten')
-            else:
-                error_msg = f"Ollama API Error: Status {response.status_code}"
-                if response.text:
-                    error_msg += f", Response: {response.text[:200]}"
-                print(error_msg)
-        except requests.exceptions.Timeout:
-            print(f"Ollama Timeout (8s): URL {OLLAMA_BASE_URL}, Model: {model}")
-            return "⏱️ Die Anfrage dauerte zu lange. Hugging Face Spaces könnte im Cold Start sein. Bitte versuchen Sie es erneut."
-        except requests.exceptions.ConnectionError as e:
-            print(f"Ollama Connection Error: {e}, URL: {OLLAMA_BASE_URL}")
-            return f"❌ Verbindungsfehler zu Ollama: {str(e)[:100]}"
-        except Exception as e:
-            print(f"Ollama Error: {type(e).__name__}: {e}, URL: {OLLAMA_BASE_URL}")
-            return f"❌ Fehler: {str(e)[:100]}"
-    
-    # Fallback zu Cloud APIs
-    if OPENAI_API_KEY:
-        result = chat_with_openai(full_prompt)
-        if result:
-            return result
-    
-    if ANTHROPIC_API_KEY:
-        result = chat_with_anthropic(full_prompt)
-        if result:
-            return result
+                await async_get_ollama_status(force=True)
+                return True
+    except Exception as e:
+        print(f"Fehler beim Download: {e}")
+    return False
+
+async def _async_ollama_complete(prompt: str, model: str = "llama3.2") -> str:
+    model_name = model if ':' in model else f"{model}:latest"
+    try:
+        data = await _apost_json("ollama", f"{OLLAMA_BASE_URL}/api/generate",
+                                 {"model": model_name, "prompt": prompt, "stream": False},
+                                 OLLAMA_READ_TIMEOUT)
+    except httpx.TransportError as e:
+        if not isinstance(e, httpx.ReadTimeout):
+            mark_ollama_unavailable(f"Connection Error: {str(e)[:150]}")
+        raise
+    return data.get('response') or 'Keine Antwort erhalten'
+
+async def _async_openai_complete(prompt: str, model: str = "gpt-3.5-turbo") -> str:
+    data = await _apost_json("openai", "https://api.openai.com/v1/chat/completions",
+                             {"model": model, "messages": [{"role": "user", "content": prompt}],
+                              "max_tokens": 500},
+                             CLOUD_READ_TIMEOUT, headers={"Authorization": f"Bearer {OPENAI_API_KEY}"})
+    return data['choices'][0]['message']['content']
+
+async def _async_anthropic_complete(prompt: str, model: str = "claude-3-haiku-20240307") -> str:
+    data = await _apost_json("anthropic", "https://api.anthropic.com/v1/messages",
+                             {"model": model, "max_tokens": 500,
+                              "messages": [{"role": "user", "content": prompt}]},
+                             CLOUD_READ_TIMEOUT,
+                             headers={"x-api-key": ANTHROPIC_API_KEY, "anthropic-version": "2023-06-01"})
+    return data['content'][0]['text']
+
+async def async_chat_with_llm(prompt: str, model: str = "llama3.2", context: Optional[str] = None,
+                              hedge: Optional[bool] = None) -> str:
+    """asyncio-Variante von chat_with_llm (gleiche Provider, Circuit Breaker und Meldungen)
+
+    Wird die Aufgabe abgebrochen (Client getrennt), werden laufende HTTP-Anfragen mit abgebrochen.
+    """
+    full_prompt = prompt
+    if context:
+        full_prompt = f"Kontext: {context}\n\nFrage: {prompt}"
     
+    # Status vorab asynchron aktualisieren, damit enabled() nur den Cache liest
+    if not USE_CLOUD_API:
+        await async_get_ollama_status()
+    try:
+        return await llm_router.acomplete(full_prompt, model, hedge)
+    except NoProviderAvailableError:
+        return "❌ Keine AI-API verfügbar. Bitte Ollama installieren oder eine Cloud-API konfigurieren (OpenAI/Anthropic)."
+    except AllProvidersFailedError as e:
+        print(f"LLM Error: {e}")
+        return _failure_message(e)
+
+# Reihenfolge = Fallback-Reihenfolge; Cloud-Provider verwenden ihr eigenes Standardmodell
+llm_router = LLMRouter([
+    Provider("Ollama", _ollama_complete,
+             enabled=_ollama_enabled,
+             acall=_async_ollama_complete),
+    Provider("OpenAI", lambda prompt, model: _openai_complete(prompt),
+             enabled=lambda: bool(OPENAI_API_KEY),
+             acall=lambda prompt, model: _async_openai_complete(prompt)),
+    Provider("Anthropic", lambda prompt, model: _anthropic_complete(prompt),
+             enabled=lambda: bool(ANTHROPIC_API_KEY),
+             acall=lambda prompt, model: _async_anthropic_complete(prompt)),
+])
+
+_STREAMS = {
+    "Ollama": stream_ollama,
+    "OpenAI": lambda prompt, model: stream_openai(prompt),
+    "Anthropic": lambda prompt, model: stream_anthropic(prompt),
+}
+
+def get_llm_provider_stats() -> List[Dict]:
+    """Circuit-Breaker-Zustand, Fehler und Latenz (p50/p95) pro Provider"""
+    return llm_router.stats()
+
+def stream_chat_with_llm(prompt: str, model: str = "llama3.2", context: Optional[str] = None) -> Iterator[str]:
+    """Wie chat_with_llm, liefert die Antwort aber Token für Token
+
+    Ein Fallback auf das nächste Backend passiert nur, solange noch nichts
+    ausgegeben wurde; bricht ein Stream danach ab, endet die Antwort mit einem Hinweis.
+    Streams zählen für die Circuit Breaker, aber nicht für die Latenzstatistik
+    (Zeit bis zum ersten Token ist nicht mit kompletten Antworten vergleichbar).
+    """
+    full_prompt = prompt
+    if context:
+        full_prompt = f"Kontext: {context}\n\nFrage: {prompt}"
+
+    if not USE_CLOUD_API:
+        get_ollama_status()
+    last_error = None
+    for provider in llm_router.candidates():
+        if not provider.breaker.allow():
+            continue
+        name = provider.name
+        started = False
+        try:
+            for token in _STREAMS[name](full_prompt, model):
+                started = True
+                yield token
+            if started:
+                provider.breaker.record_success()
+                return
+            raise RuntimeError("leere Antwort")
+        except GeneratorExit:
+            # Client hat abgebrochen: weder Erfolg noch Fehler des Providers
+            provider.breaker.release()
+            raise
+        except Exception as e:
+            provider.breaker.record_failure()
+            print(f"{name} Stream Error: {type(e).__name__}: {e}")
+            if started:
+                yield f"\n\n❌ Verbindung zu {name} abgebrochen: {str(e)[:100]}"
+                return
+            if name == "Ollama" and isinstance(e, requests.exceptions.ConnectionError):
+                mark_ollama_unavailable(f"Connection Error: {str(e)[:150]}")
+            if isinstance(e, requests.exceptions.Timeout):
+                last_error = f"⏱️ {name} hat nicht rechtzeitig geantwortet. Bitte versuchen Sie es erneut."
+            else:
+                last_error = f"❌ Fehler bei {name}: {str(e)[:100]}"
+
     # Keine API verfügbar
-    return "❌ Keine AI-API verfügbar. Bitte Ollama installieren oder eine Cloud-API konfigurieren (OpenAI/Anthropic)."
+    yield last_error or "❌ Keine AI-API verfügbar. Bitte Ollama installieren oder eine Cloud-API konfigurieren (OpenAI/Anthropic)."
 
-def get_crm_context() -> str:
-    """Holt relevante CRM-Daten als Kontext für den AI Assistant"""
-    from database import execute_query
-    
-    context_parts = []
-    
-    # Kundenstatistik
-    customers = execute_query("SELECT COUNT(*) as count FROM customers")
-    if customers:
-        context_parts.append(f"Anzahl Kunden: {customers[0]['count']}")
-    
-    # Heutige Termine
-    today = datetime.now().strftime("%Y-%m-%d")
-    appointments = execute_query("""
-        SELECT COUNT(*) as count FROM appointments 
-        WHERE appointment_date = ? AND status != 'abgesagt'
-    """, (today,))
-    if appointments:
-        context_parts.append(f"Heutige Termine: {appointments[0]['count']}")
+def get_crm_context(question: Optional[str] = None) -> str:
+    """Holt relevante CRM-Daten als Kontext für den AI Assistant
+    Mit Frage zusätzlich die passendsten Datensätze aus dem lokalen Suchindex (crm_retrieval)
+    """
+    from dashboard_stats import get_dashboard_stats
     
-    # Umsatz heute
-    sales = execute_query("""
-        SELECT COALESCE(SUM(total_amount - discount), 0) as total 
-        FROM sales WHERE sale_date = ?
-    """, (today,))
-    if sales:
-        context_parts.append(f"Umsatz heute: €{sales[0]['total']:.2f}")
+    stats = get_dashboard_stats()
+    context_parts = [
+        f"Anzahl Kunden: {stats['customers']}",
+        f"Heutige Termine: {stats['appointments_today']}",
+        f"Umsatz heute: €{stats['sales_total_today']:.2f}",
+    ]
     
     # Niedrige Lagerbestände
-    low_stock = execute_query("""
-        SELECT name FROM products 
-        WHERE stock_quantity <= min_stock_level
-        LIMIT 5
-    """)
-    if low_stock:
-        products = ", ".join([p['name'] for p in low_stock])
+    if stats['low_stock_products']:
+        products = ", ".join(stats['low_stock_products'])
         context_parts.append(f"Produkte mit niedrigem Bestand: {products}")
     
+    if question:
+        try:
+            from crm_retrieval import retrieve_context
+            records = retrieve_context(question)
+        except Exception as e:
+            print(f"Retrieval Error: {type(e).__name__}: {e}")
+            records = []
+        if records:
+            context_parts.append("Relevante Datensätze:")
+            context_parts.extend(f"- {record}" for record in records)
+    
     return "\n".join(context_parts)
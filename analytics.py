@@ -0,0 +1,355 @@
+"""
+Vorberechnete Umsatz-Kennzahlen für Analytics und Statistiken
+Die Rollup-Tabellen werden beim Verkauf in derselben Transaktion fortgeschrieben,
+damit Auswertungen nicht bei jedem Aufruf alle Verkäufe aggregieren müssen.
+
+Neuaufbau (z.B. nach manuellen Korrekturen an sales oder sale_items):
+    python analytics.py rebuild [von] [bis]
+"""
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from database import USE_POSTGRESQL, Transaction, execute_query, transaction
+
+NO_LOCATION = 0  # location_id für Verkäufe ohne Standort (NULL ist im Primärschlüssel nicht erlaubt)
+
+# RFM-Schwellen: Untergrenzen für die Scores 2, 3, 4 und 5 (darunter Score 1)
+RECENCY_DAYS = (240, 120, 60, 30)  # letzter Besuch innerhalb von ... Tagen
+FREQUENCY_VISITS = (2, 4, 8, 15)
+MONETARY_SPENT = (100.0, 250.0, 500.0, 1000.0)
+
+# Kundensegmente für Marketing: Mindest- bzw. Höchstwerte der RFM-Scores
+SEGMENTS = {
+    'champions': {'min_r': 4, 'min_f': 4, 'min_m': 4},
+    'loyal': {'min_f': 4},
+    'big_spenders': {'min_m': 5},
+    'new': {'min_r': 4, 'max_f': 1},
+    'at_risk': {'max_r': 2, 'min_f': 3},
+    'lost': {'max_r': 1},
+}
+
+def _column_types():
+    """(Geld, Text) Spaltentypen je nach Datenbank"""
+    if USE_POSTGRESQL:
+        return "DOUBLE PRECISION", "VARCHAR"
+    return "REAL", "TEXT"
+
+def create_sales_rollup_table(tx: Transaction):
+    """Legt die Tabelle für Tagesumsätze an (aufgerufen aus migrations.py)"""
+    money, text = _column_types()
+    tx.execute(f"""
+        CREATE TABLE IF NOT EXISTS daily_sales_rollup (
+            sale_date {text} NOT NULL,
+            location_id INTEGER NOT NULL DEFAULT 0,
+            payment_method {text} NOT NULL DEFAULT '',
+            transactions INTEGER NOT NULL DEFAULT 0,
+            gross_total {money} NOT NULL DEFAULT 0,
+            discount_total {money} NOT NULL DEFAULT 0,
+            revenue {money} NOT NULL DEFAULT 0,
+            PRIMARY KEY (sale_date, location_id, payment_method)
+        )
+    """)
+
+def create_service_rollup_table(tx: Transaction):
+    """Legt die Tabelle für Service-Kennzahlen pro Tag an (aufgerufen aus migrations.py)"""
+    money, text = _column_types()
+    tx.execute(f"""
+        CREATE TABLE IF NOT EXISTS daily_service_rollup (
+            sale_date {text} NOT NULL,
+            service_id INTEGER NOT NULL,
+            location_id INTEGER NOT NULL DEFAULT 0,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            tickets INTEGER NOT NULL DEFAULT 0,
+            revenue {money} NOT NULL DEFAULT 0,
+            PRIMARY KEY (sale_date, service_id, location_id)
+        )
+    """)
+
+def create_customer_stats_table(tx: Transaction):
+    """Legt die Tabelle für Kundenkennzahlen an (aufgerufen aus migrations.py)"""
+    money, text = _column_types()
+    tx.execute(f"""
+        CREATE TABLE IF NOT EXISTS customer_stats (
+            customer_id INTEGER PRIMARY KEY,
+            visits INTEGER NOT NULL DEFAULT 0,
+            total_spent {money} NOT NULL DEFAULT 0,
+            avg_ticket {money} NOT NULL DEFAULT 0,
+            first_visit {text},
+            last_visit {text},
+            frequency_score INTEGER NOT NULL DEFAULT 1,
+            monetary_score INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+
+def _score_sql(expr: str, thresholds) -> str:
+    """CASE-Ausdruck, der einen Wert anhand der Schwellen auf 1-5 abbildet"""
+    cases = " ".join(f"WHEN {expr} >= {limit} THEN {score}"
+                     for score, limit in reversed(list(enumerate(thresholds, start=2))))
+    return f"CASE {cases} ELSE 1 END"
+
+def _score(value: float, thresholds) -> int:
+    """Bildet einen Wert anhand der Schwellen auf 1-5 ab"""
+    return 1 + sum(1 for limit in thresholds if value >= limit)
+
+# --- Fortschreibung ---
+
+def add_sale_to_rollup(tx: Transaction, sale_date: str, location_id: Optional[int],
+                       payment_method: Optional[str], total: float, discount: float, sign: int = 1):
+    """Bucht einen Verkauf in die Tagessumme (sign=-1 nimmt ihn wieder heraus)"""
+    tx.execute("""
+        INSERT INTO daily_sales_rollup (sale_date, location_id, payment_method,
+                                        transactions, gross_total, discount_total, revenue)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (sale_date, location_id, payment_method) DO UPDATE SET
+            transactions = daily_sales_rollup.transactions + excluded.transactions,
+            gross_total = daily_sales_rollup.gross_total + excluded.gross_total,
+            discount_total = daily_sales_rollup.discount_total + excluded.discount_total,
+            revenue = daily_sales_rollup.revenue + excluded.revenue
+    """, (sale_date, location_id or NO_LOCATION, payment_method or "",
+          sign, sign * total, sign * (discount or 0), sign * (total - (discount or 0))))
+
+def add_services_to_rollup(tx: Transaction, sale_date: str, location_id: Optional[int],
+                           items: List[Dict], sign: int = 1):
+    """Bucht die Service-Positionen eines Verkaufs in die Tageskennzahlen pro Service"""
+    per_service: Dict[int, List[float]] = {}
+    for item in items:
+        if item['type'] != 'service':
+            continue
+        totals = per_service.setdefault(item['id'], [0, 0.0])
+        totals[0] += item['quantity']
+        totals[1] += item['price'] * item['quantity']
+    if not per_service:
+        return
+
+    tx.executemany("""
+        INSERT INTO daily_service_rollup (sale_date, service_id, location_id, quantity, tickets, revenue)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (sale_date, service_id, location_id) DO UPDATE SET
+            quantity = daily_service_rollup.quantity + excluded.quantity,
+            tickets = daily_service_rollup.tickets + excluded.tickets,
+            revenue = daily_service_rollup.revenue + excluded.revenue
+    """, [(sale_date, service_id, location_id or NO_LOCATION, sign * quantity, sign, sign * revenue)
+          for service_id, (quantity, revenue) in per_service.items()])
+
+def _date_where(column: str, start_date: Optional[str], end_date: Optional[str]):
+    where, params = [], []
+    if start_date:
+        where.append(f"{column} >= ?")
+        params.append(start_date)
+    if end_date:
+        where.append(f"{column} <= ?")
+        params.append(end_date)
+    return where, params
+
+def rebuild_sales_rollup(tx: Transaction, start_date: Optional[str] = None,
+                         end_date: Optional[str] = None):
+    """Berechnet die Tagessummen für einen Zeitraum (Standard: alles) neu aus sales"""
+    where, params = _date_where("sale_date", start_date, end_date)
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+    tx.execute(f"DELETE FROM daily_sales_rollup {where_sql}", tuple(params))
+    tx.execute(f"""
+        INSERT INTO daily_sales_rollup (sale_date, location_id, payment_method,
+                                        transactions, gross_total, discount_total, revenue)
+        SELECT sale_date, COALESCE(location_id, 0), COALESCE(payment_method, ''),
+               COUNT(*), SUM(total_amount), SUM(COALESCE(discount, 0)),
+               SUM(total_amount - COALESCE(discount, 0))
+        FROM sales
+        {where_sql}
+        GROUP BY sale_date, COALESCE(location_id, 0), COALESCE(payment_method, '')
+    """, tuple(params))
+
+def rebuild_service_rollup(tx: Transaction, start_date: Optional[str] = None,
+                           end_date: Optional[str] = None):
+    """Berechnet die Service-Kennzahlen für einen Zeitraum (Standard: alles) neu aus sale_items"""
+    where, params = _date_where("sale_date", start_date, end_date)
+    tx.execute(f"DELETE FROM daily_service_rollup {'WHERE ' + ' AND '.join(where) if where else ''}",
+               tuple(params))
+
+    where, params = _date_where("s.sale_date", start_date, end_date)
+    where.append("si.item_type = 'service'")
+    tx.execute(f"""
+        INSERT INTO daily_service_rollup (sale_date, service_id, location_id, quantity, tickets, revenue)
+        SELECT s.sale_date, si.item_id, COALESCE(s.location_id, 0),
+               SUM(si.quantity), COUNT(DISTINCT s.id), SUM(si.price * si.quantity)
+        FROM sale_items si
+        JOIN sales s ON si.sale_id = s.id
+        WHERE {' AND '.join(where)}
+        GROUP BY s.sale_date, si.item_id, COALESCE(s.location_id, 0)
+    """, tuple(params))
+
+def add_sale_to_customer_stats(tx: Transaction, customer_id: int, sale_date: str, amount: float):
+    """Bucht einen Verkauf (Betrag nach Rabatt) in die Kennzahlen des Kunden"""
+    least, greatest = ("LEAST", "GREATEST") if USE_POSTGRESQL else ("MIN", "MAX")
+    visits = "customer_stats.visits + 1"
+    spent = "customer_stats.total_spent + excluded.total_spent"
+    tx.execute(f"""
+        INSERT INTO customer_stats (customer_id, visits, total_spent, avg_ticket, first_visit, last_visit,
+                                    frequency_score, monetary_score)
+        VALUES (?, 1, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (customer_id) DO UPDATE SET
+            visits = {visits},
+            total_spent = {spent},
+            avg_ticket = ({spent}) / ({visits}),
+            first_visit = {least}(COALESCE(customer_stats.first_visit, excluded.first_visit), excluded.first_visit),
+            last_visit = {greatest}(COALESCE(customer_stats.last_visit, excluded.last_visit), excluded.last_visit),
+            frequency_score = {_score_sql(visits, FREQUENCY_VISITS)},
+            monetary_score = {_score_sql(spent, MONETARY_SPENT)}
+    """, (customer_id, amount, amount, sale_date, sale_date,
+          _score(1, FREQUENCY_VISITS), _score(amount, MONETARY_SPENT)))
+
+def rebuild_customer_stats(tx: Transaction, customer_id: Optional[int] = None):
+    """Berechnet die Kundenkennzahlen neu aus sales (alle oder ein Kunde, z.B. nach Storno/Korrektur)"""
+    where, params = "customer_id IS NOT NULL", ()
+    if customer_id is not None:
+        where, params = "customer_id = ?", (customer_id,)
+    tx.execute(f"DELETE FROM customer_stats WHERE {where}", params)
+
+    visits = "COUNT(*)"
+    spent = "SUM(total_amount - COALESCE(discount, 0))"
+    tx.execute(f"""
+        INSERT INTO customer_stats (customer_id, visits, total_spent, avg_ticket, first_visit, last_visit,
+                                    frequency_score, monetary_score)
+        SELECT customer_id, {visits}, {spent}, {spent} / {visits}, MIN(sale_date), MAX(sale_date),
+               {_score_sql(visits, FREQUENCY_VISITS)}, {_score_sql(spent, MONETARY_SPENT)}
+        FROM sales
+        WHERE {where}
+        GROUP BY customer_id
+    """, params)
+
+def rebuild_rollups(tx: Transaction, start_date: Optional[str] = None,
+                    end_date: Optional[str] = None):
+    """Baut alle Rollup-Tabellen für einen Zeitraum neu auf"""
+    rebuild_sales_rollup(tx, start_date, end_date)
+    rebuild_service_rollup(tx, start_date, end_date)
+    # Kundenkennzahlen sind nicht nach Datum aufgeteilt und werden immer komplett neu berechnet
+    rebuild_customer_stats(tx)
+
+# --- Abfragen ---
+
+def days_ago(days: int) -> str:
+    """Datum vor `days` Tagen als 'YYYY-MM-DD' (ersetzt SQLite-spezifisches date('now', ...))"""
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+def _range_filter(start_date: str, end_date: Optional[str], location_id: Optional[int]):
+    where, params = ["sale_date >= ?"], [start_date]
+    if end_date:
+        where.append("sale_date <= ?")
+        params.append(end_date)
+    if location_id is not None:
+        where.append("location_id = ?")
+        params.append(location_id)
+    return " AND ".join(where), tuple(params)
+
+def get_daily_revenue(start_date: str, end_date: Optional[str] = None,
+                      location_id: Optional[int] = None) -> List[Dict]:
+    """Umsatz (nach Rabatt), Rabatte und Anzahl Verkäufe pro Tag"""
+    where, params = _range_filter(start_date, end_date, location_id)
+    return execute_query(f"""
+        SELECT sale_date, SUM(revenue) as total, SUM(transactions) as count,
+               SUM(discount_total) as discount
+        FROM daily_sales_rollup
+        WHERE {where}
+        GROUP BY sale_date
+        HAVING SUM(transactions) > 0
+        ORDER BY sale_date
+    """, params)
+
+def get_revenue_by_payment_method(start_date: str, end_date: Optional[str] = None,
+                                  location_id: Optional[int] = None) -> List[Dict]:
+    """Umsatz und Anzahl Verkäufe pro Zahlungsart"""
+    where, params = _range_filter(start_date, end_date, location_id)
+    return execute_query(f"""
+        SELECT payment_method, SUM(revenue) as total, SUM(transactions) as count
+        FROM daily_sales_rollup
+        WHERE {where}
+        GROUP BY payment_method
+        HAVING SUM(transactions) > 0
+        ORDER BY total DESC
+    """, params)
+
+def get_service_stats(start_date: str, end_date: Optional[str] = None,
+                      categories: Optional[List[str]] = None,
+                      location_id: Optional[int] = None) -> List[Dict]:
+    """Anzahl, Umsatz und Durchschnitt pro Service im Zeitraum, optional nach Kategorien gefiltert"""
+    where, params = _date_where("r.sale_date", start_date, end_date)
+    if categories:
+        where.append(f"s.category IN ({', '.join('?' for _ in categories)})")
+        params.extend(categories)
+    if location_id is not None:
+        where.append("r.location_id = ?")
+        params.append(location_id)
+
+    rows = execute_query(f"""
+        SELECT r.service_id, s.name, s.category,
+               SUM(r.quantity) as count, SUM(r.tickets) as tickets, SUM(r.revenue) as revenue
+        FROM daily_service_rollup r
+        JOIN services s ON r.service_id = s.id
+        WHERE {' AND '.join(where)}
+        GROUP BY r.service_id, s.name, s.category
+        HAVING SUM(r.quantity) > 0
+        ORDER BY count DESC, revenue DESC
+    """, tuple(params))
+    for row in rows:
+        row['avg_ticket'] = round(row['revenue'] / row['tickets'], 2) if row['tickets'] else 0.0
+    return rows
+
+def _recency_sql() -> Tuple[str, tuple]:
+    """CASE-Ausdruck für den Recency-Score (hängt vom heutigen Datum ab, daher beim Lesen berechnet)"""
+    cases = " ".join(f"WHEN cs.last_visit >= ? THEN {score}"
+                     for score, _ in reversed(list(enumerate(RECENCY_DAYS, start=2))))
+    return f"CASE {cases} ELSE 1 END", tuple(days_ago(days) for days in reversed(RECENCY_DAYS))
+
+_CUSTOMER_STATS_COLUMNS = """
+    cs.customer_id, c.first_name || ' ' || c.last_name as name, c.email, c.loyalty_points,
+    cs.visits, cs.total_spent, cs.avg_ticket, cs.first_visit, cs.last_visit,
+    {recency} as recency_score, cs.frequency_score, cs.monetary_score
+"""
+
+def get_top_customers(limit: int = 20) -> List[Dict]:
+    """Kunden mit dem höchsten Gesamtumsatz (Index auf total_spent)"""
+    recency, params = _recency_sql()
+    return execute_query(f"""
+        SELECT {_CUSTOMER_STATS_COLUMNS.format(recency=recency)}
+        FROM customer_stats cs
+        JOIN customers c ON cs.customer_id = c.id
+        WHERE cs.visits > 0
+        ORDER BY cs.total_spent DESC
+        LIMIT ?
+    """, params + (limit,))
+
+def get_customer_segment(segment: str, limit: int = 500) -> List[Dict]:
+    """Kunden eines RFM-Segments (siehe SEGMENTS), nach Umsatz sortiert; wirft ValueError bei unbekanntem Segment"""
+    if segment not in SEGMENTS:
+        raise ValueError(f"Unbekanntes Segment: {segment}")
+    rules = SEGMENTS[segment]
+    recency, recency_params = _recency_sql()
+
+    where, params = ["cs.visits > 0"], []
+    for key, column in (('r', recency), ('f', 'cs.frequency_score'), ('m', 'cs.monetary_score')):
+        if f'min_{key}' in rules:
+            where.append(f"{column} >= ?")
+            params.extend((recency_params if key == 'r' else ()) + (rules[f'min_{key}'],))
+        if f'max_{key}' in rules:
+            where.append(f"{column} <= ?")
+            params.extend((recency_params if key == 'r' else ()) + (rules[f'max_{key}'],))
+
+    return execute_query(f"""
+        SELECT {_CUSTOMER_STATS_COLUMNS.format(recency=recency)}
+        FROM customer_stats cs
+        JOIN customers c ON cs.customer_id = c.id
+        WHERE {' AND '.join(where)}
+        ORDER BY cs.total_spent DESC
+        LIMIT ?
+    """, recency_params + tuple(params) + (limit,))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("Verwendung: python analytics.py rebuild [von YYYY-MM-DD] [bis YYYY-MM-DD]")
+        sys.exit(1)
+    start, end = (sys.argv[2:4] + [None, None])[:2]
+    from database import init_database
+    init_database()
+    with transaction(immediate=True) as tx:
+        rebuild_rollups(tx, start, end)
+    print(f"Rollups neu aufgebaut ({start or 'Anfang'} bis {end or 'heute'})")
@@ -3,31 +3,63 @@ FastAPI Backend für Beauty CRM
 API-Endpunkte für das CRM-System
 Optimiert für Vercel Serverless Functions
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict
-from datetime import datetime
 import os
+import json
+import asyncio
+import csv
+import functools
+import gzip
+import io
+import sys
+import tempfile
+import threading
+from contextlib import asynccontextmanager
 
 from database import (
-    init_database, execute_query, execute_update
+    init_database, execute_query, execute_update, get_cache_stats, get_query_metrics, get_slow_queries,
+    get_pool_stats
 )
 from booking_system import (
     get_available_time_slots, check_availability, create_online_booking,
-    get_upcoming_appointments, get_weekly_calendar, get_employee_schedule
+    find_next_available_slots, get_upcoming_appointments, get_week_view, get_month_view,
+    get_employee_schedule, BookingConflictError, create_appointment as create_booked_appointment
 )
+from sales_system import create_sale as record_sale
+from dashboard_stats import get_dashboard_stats
+from analytics import (
+    days_ago, get_daily_revenue, get_revenue_by_payment_method, get_service_stats,
+    get_top_customers, get_customer_segment
+)
+from customer_search import search_customers, refresh_customer
+from crm_retrieval import refresh_record
+from customers import list_customers, iter_customers, stream_json, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from simplybook_features import (
     create_recurring_appointments, create_group_booking,
     send_appointment_reminder, get_appointments_needing_reminder
 )
-from ai_assistant import (
-    check_ollama_available, get_available_models, download_model,
-    chat_with_llm, get_crm_context
-)
+# ai_assistant (requests, httpx, LLM-Router) wird erst in den AI-Routen importiert:
+# die meisten Aufrufe brauchen es nicht, und jeder Kaltstart auf Vercel zahlt den Import
+from response_cache import response_cache, make_key, get_response_cache_stats
+from bulk_import import IMPORTERS, FORMATS, import_records
+from db_executor import run_db, open_db_stream, DatabaseBusyError, get_db_executor_stats
+from exports import EXPORTS, MEDIA_TYPES, ExportError, resolve_range, export, export_filename
 
-app = FastAPI(title="Beauty CRM API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Ausstehende Einträge des AI-Antwort-Caches in die Datei schreiben
+    response_cache.flush()
+    # Keep-Alive-Verbindungen der Async-LLM-Clients sauber schließen (nur falls eine AI-Route lief)
+    ai_assistant = sys.modules.get("ai_assistant")
+    if ai_assistant is not None:
+        await ai_assistant.close_async_clients()
+
+app = FastAPI(title="Beauty CRM API", lifespan=lifespan)
 
 # CORS für Frontend
 app.add_middleware(
@@ -36,20 +68,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Initialisiere Datenbank bei Bedarf (für Vercel Serverless)
 _db_initialized = False
+_db_init_lock = threading.Lock()
 
 def ensure_db_initialized():
     global _db_initialized
+    # Routen laufen parallel auf dem DB-Thread-Pool: nur ein Thread darf initialisieren
     if not _db_initialized:
-        try:
-            init_database()
-            _db_initialized = True
-        except Exception as e:
-            print(f"Database initialization: {e}")
-            _db_initialized = True
+        with _db_init_lock:
+            if not _db_initialized:
+                try:
+                    init_database()
+                except Exception as e:
+                    print(f"Database initialization: {e}")
+                _db_initialized = True
+
+async def run_db_or_503(fn, *args, **kwargs):
+    """Wie run_db(), aber eine volle Warteschlange wird zu HTTP 503 mit Retry-After"""
+    try:
+        return await run_db(fn, *args, **kwargs)
+    except DatabaseBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+def open_stream_or_503(rows):
+    """Wie open_db_stream(), aber sind alle Stream-Plätze belegt, wird daraus HTTP 503 mit Retry-After"""
+    try:
+        return open_db_stream(rows)
+    except DatabaseBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+def db_route(func):
+    """Macht aus einer synchronen Route eine async-Route, deren Rumpf auf dem DB-Thread-Pool läuft,
+    damit eine langsame Abfrage nicht die Event-Loop (und damit alle anderen Anfragen) blockiert"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db_or_503(func, *args, **kwargs)
+    return wrapper
 
 # Pydantic Models
 class CustomerCreate(BaseModel):
@@ -75,6 +133,7 @@ class SaleCreate(BaseModel):
     items: List[Dict]
     payment_method: str
     discount: float = 0.0
+    location_id: Optional[int] = None
 
 # Frontend HTML
 FRONTEND_HTML = """
@@ -519,20 +578,44 @@ FRONTEND_HTML = """
                 setInput('');
                 setLoading(true);
                 
+                // Hängt Text an die letzte Assistant-Nachricht an (legt sie beim ersten Stück an)
+                const appendToAnswer = (text) => setMessages(prev => {
+                    const last = prev[prev.length - 1];
+                    if (last && last.role === 'assistant' && last.streaming) {
+                        return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+                    }
+                    return [...prev, { role: 'assistant', content: text, streaming: true }];
+                });
+                
                 try {
-                    const response = await fetch(`${API_URL}/api/ai/chat`, {
+                    // Server-Sent Events: die Antwort erscheint Token für Token
+                    const response = await fetch(`${API_URL}/api/ai/chat/stream`, {
                         method: 'POST',
                         headers: { 'Content-Type': 'application/json' },
                         body: JSON.stringify({ message: input, model: model })
                     });
+                    if (!response.ok || !response.body) {
+                        throw new Error(`HTTP ${response.status}`);
+                    }
                     
-                    const data = await response.json();
-                    
-                    if (data.error) {
-                        setMessages(prev => [...prev, { role: 'assistant', content: `❌ Fehler: ${data.error}` }]);
-                    } else {
-                        setMessages(prev => [...prev, { role: 'assistant', content: data.response }]);
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    while (true) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        buffer += decoder.decode(value, { stream: true });
+                        const events = buffer.split('\\n\\n');
+                        buffer = events.pop();
+                        for (const event of events) {
+                            const dataLine = event.split('\\n').find(line => line.startsWith('data: '));
+                            if (!dataLine) continue;
+                            const data = JSON.parse(dataLine.slice(6));
+                            if (data.token) appendToAnswer(data.token);
+                            if (data.error) appendToAnswer(`❌ Fehler: ${data.error}`);
+                        }
                     }
+                    setMessages(prev => prev.map(msg => msg.streaming ? { role: msg.role, content: msg.content } : msg));
                 } catch (err) {
                     setMessages(prev => [...prev, { role: 'assistant', content: `❌ Fehler beim Senden: ${err.message}` }]);
                 } finally {
@@ -677,7 +760,7 @@ FRONTEND_HTML = """
                                 </div>
                             ))
                         )}
-                        {loading && (
+                        {loading && !(messages.length && messages[messages.length - 1].streaming) && (
                             <div style={{
                                 display: 'flex',
                                 gap: '1rem',
@@ -824,7 +907,8 @@ FRONTEND_HTML = """
 
 # API Routes
 @app.get("/", response_class=HTMLResponse)
-async def root():
+@db_route
+def root():
     """Serve Frontend"""
     ensure_db_initialized()
     # Versuche public/index.html zu laden (verschiedene Pfade für lokale Entwicklung und Vercel)
@@ -845,17 +929,88 @@ async def root():
     return HTMLResponse(content=FRONTEND_HTML)
 
 @app.get("/api/health")
-async def health():
+@db_route
+def health():
     ensure_db_initialized()
     return {"status": "ok", "database": "ready"}
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/Miss-Zähler des Stammdaten-Caches"""
+    return get_cache_stats()
+
+@app.get("/api/db/executor")
+async def db_executor_stats():
+    """Auslastung und Wartezeiten des DB-Thread-Pools"""
+    return get_db_executor_stats()
+
+METRICS_SORT_KEYS = ("total_ms", "calls", "avg_ms", "p95_ms", "p99_ms", "max_ms", "rows", "errors")
+
+@app.get("/api/metrics")
+async def metrics(top: int = 20, sort: str = "total_ms", slow: int = 20):
+    """Abfrage-Metriken pro SQL-Fingerprint, Slow-Query-Log und Zustand von Pools und Caches
+
+    top: Anzahl Fingerprints (sortiert nach sort), slow: Anzahl neuester langsamer Abfragen.
+    """
+    if sort not in METRICS_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort muss einer von {', '.join(METRICS_SORT_KEYS)} sein")
+    result = {
+        "queries": get_query_metrics(max(0, top), sort),
+        "slow_queries": get_slow_queries(max(0, slow)) if slow > 0 else [],
+        "db_pool": get_pool_stats(),
+        "db_executor": get_db_executor_stats(),
+        "db_cache": get_cache_stats(),
+        "ai_cache": get_response_cache_stats(),
+    }
+    # Provider-Statistik nur, wenn der AI Assistant schon geladen ist (kein Import nur für Metriken)
+    ai_assistant = sys.modules.get("ai_assistant")
+    result["ai_providers"] = ai_assistant.get_llm_provider_stats() if ai_assistant is not None else []
+    return result
+
 @app.get("/api/customers")
-async def get_customers():
+@db_route
+def get_customers(response: Response, limit: int = DEFAULT_PAGE_SIZE, after: Optional[str] = None,
+                  q: Optional[str] = None, min_points: Optional[int] = None):
+    """Kundenliste seitenweise; der Cursor der nächsten Seite steht im Header X-Next-Cursor"""
+    ensure_db_initialized()
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit muss zwischen 1 und {MAX_PAGE_SIZE} liegen")
+    try:
+        # Alle Spalten wie vor der Pagination (Adresse, Notizen, updated_at), nicht nur LIST_COLUMNS
+        customers, next_cursor = list_customers(limit, after, q, min_points, columns="*")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return customers
+
+@app.get("/api/customers/search")
+@db_route
+def search_customers_endpoint(q: str, limit: int = 10):
+    """Unscharfe Kundensuche nach Name, E-Mail oder Telefon, nach Relevanz sortiert"""
+    ensure_db_initialized()
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit muss zwischen 1 und 100 liegen")
+    return search_customers(q, limit)
+
+@app.get("/api/customers/export")
+@db_route
+def export_customers(format: str = "json", q: Optional[str] = None,
+                     min_points: Optional[int] = None):
+    """Streamt alle (gefilterten) Kunden als JSON-Array oder NDJSON"""
     ensure_db_initialized()
-    return execute_query("SELECT * FROM customers ORDER BY last_name, first_name")
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format muss 'json' oder 'ndjson' sein")
+    ndjson = format == "ndjson"
+    return StreamingResponse(
+        open_stream_or_503(stream_json(iter_customers(q, min_points), ndjson=ndjson)),
+        media_type="application/x-ndjson" if ndjson else "application/json",
+        headers={"Content-Disposition": f"attachment; filename=customers.{format}"}
+    )
 
 @app.get("/api/customers/{customer_id}")
-async def get_customer(customer_id: int):
+@db_route
+def get_customer(customer_id: int):
     ensure_db_initialized()
     result = execute_query("SELECT * FROM customers WHERE id = ?", (customer_id,))
     if not result:
@@ -863,22 +1018,27 @@ async def get_customer(customer_id: int):
     return result[0]
 
 @app.post("/api/customers")
-async def create_customer(customer: CustomerCreate):
+@db_route
+def create_customer(customer: CustomerCreate):
     ensure_db_initialized()
     customer_id = execute_update("""
         INSERT INTO customers (first_name, last_name, email, phone, address, birthdate, notes)
         VALUES (?, ?, ?, ?, ?, ?, ?)
     """, (customer.first_name, customer.last_name, customer.email, customer.phone,
           customer.address, customer.birthdate, customer.notes))
+    refresh_customer(customer_id)
+    refresh_record('customer', customer_id)
     return {"id": customer_id, "message": "Kunde erfolgreich erstellt"}
 
 @app.get("/api/services")
-async def get_services():
+@db_route
+def get_services():
     ensure_db_initialized()
     return execute_query("SELECT * FROM services WHERE active = 1 ORDER BY category, name")
 
 @app.get("/api/appointments")
-async def get_appointments(date: Optional[str] = None):
+@db_route
+def get_appointments(date: Optional[str] = None):
     ensure_db_initialized()
     if date:
         return execute_query("""
@@ -904,20 +1064,26 @@ async def get_appointments(date: Optional[str] = None):
         """)
 
 @app.post("/api/appointments")
-async def create_appointment(appointment: AppointmentCreate):
+@db_route
+def create_appointment(appointment: AppointmentCreate):
     ensure_db_initialized()
-    appointment_id = execute_update("""
-        INSERT INTO appointments (customer_id, service_id, employee_id, 
-                                  appointment_date, appointment_time, duration, notes, status, group_size)
-        VALUES (?, ?, ?, ?, ?, 
-                (SELECT duration FROM services WHERE id = ?), ?, 'geplant', ?)
-    """, (appointment.customer_id, appointment.service_id, appointment.employee_id,
-          appointment.appointment_date, appointment.appointment_time,
-          appointment.service_id, appointment.notes, appointment.group_size))
+    service = execute_query("SELECT duration FROM services WHERE id = ?", (appointment.service_id,))
+    if not service:
+        raise HTTPException(status_code=400, detail="Service nicht gefunden")
+    try:
+        # Zeitfenster wird in derselben Transaktion geprüft und gebucht (kein Doppelbuchen)
+        appointment_id = create_booked_appointment(
+            appointment.customer_id, appointment.service_id, appointment.appointment_date,
+            appointment.appointment_time, appointment.employee_id, service[0]['duration'] or 60,
+            appointment.notes, appointment.group_size)
+    except BookingConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    refresh_record('appointment', appointment_id)
     return {"id": appointment_id, "message": "Termin erfolgreich gebucht"}
 
 @app.get("/api/sales")
-async def get_sales(days: int = 30):
+@db_route
+def get_sales(days: int = 30):
     ensure_db_initialized()
     return execute_query("""
         SELECT s.*, c.first_name || ' ' || c.last_name as customer_name
@@ -928,76 +1094,96 @@ async def get_sales(days: int = 30):
     """, (days,))
 
 @app.post("/api/sales")
-async def create_sale(sale: SaleCreate):
+@db_route
+def create_sale(sale: SaleCreate):
     ensure_db_initialized()
-    now = datetime.now()
-    total = sum(item['price'] * item['quantity'] for item in sale.items)
-    sale_id = execute_update("""
-        INSERT INTO sales (customer_id, sale_date, sale_time, total_amount, 
-                          payment_method, discount)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (sale.customer_id, now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S"),
-          total, sale.payment_method, sale.discount))
-    
-    for item in sale.items:
-        execute_update("""
-            INSERT INTO sale_items (sale_id, item_type, item_id, item_name, quantity, price)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (sale_id, item['type'], item['id'], item['name'], item['quantity'], item['price']))
-    
+    sale_id = record_sale(sale.customer_id, sale.items, sale.payment_method, sale.discount,
+                          sale.location_id)
+    if sale.customer_id:
+        # Besuche und Umsatz stehen im Kundendokument
+        refresh_record('customer', sale.customer_id)
     return {"id": sale_id, "message": "Verkauf erfolgreich"}
 
 @app.get("/api/products")
-async def get_products():
+@db_route
+def get_products():
     ensure_db_initialized()
     return execute_query("SELECT * FROM products ORDER BY category, name")
 
 @app.get("/api/employees")
-async def get_employees():
+@db_route
+def get_employees():
     ensure_db_initialized()
     return execute_query("SELECT * FROM employees WHERE active = 1 ORDER BY last_name, first_name")
 
 @app.get("/api/stats/today")
-async def get_today_stats():
+@db_route
+def get_today_stats():
     ensure_db_initialized()
-    today = datetime.now().strftime("%Y-%m-%d")
-    
-    appointments = execute_query("""
-        SELECT COUNT(*) as count FROM appointments 
-        WHERE appointment_date = ? AND status != 'abgesagt'
-    """, (today,))
-    
-    sales = execute_query("""
-        SELECT COUNT(*) as count, COALESCE(SUM(total_amount - discount), 0) as total 
-        FROM sales WHERE sale_date = ?
-    """, (today,))
-    
-    open_appointments = execute_query("""
-        SELECT COUNT(*) as count FROM appointments 
-        WHERE appointment_date = ? AND status = 'geplant'
-    """, (today,))
-    
+    stats = get_dashboard_stats()
     return {
-        'appointments': appointments[0]['count'] if appointments else 0,
-        'sales_count': sales[0]['count'] if sales else 0,
-        'sales_total': float(sales[0]['total']) if sales else 0.0,
-        'open_appointments': open_appointments[0]['count'] if open_appointments else 0
+        'appointments': stats['appointments_today'],
+        'sales_count': stats['sales_count_today'],
+        'sales_total': stats['sales_total_today'],
+        'open_appointments': stats['open_appointments_today']
     }
 
+@app.get("/api/stats/dashboard")
+@db_route
+def get_dashboard():
+    """Alle Dashboard-Zähler aus einer Abfrage (kurz gecacht)"""
+    ensure_db_initialized()
+    return get_dashboard_stats()
+
 @app.get("/api/stats/revenue")
-async def get_revenue_stats(days: int = 7):
+@db_route
+def get_revenue_stats(days: int = 7, location_id: Optional[int] = None):
+    """Umsatz pro Tag aus dem Tages-Rollup"""
     ensure_db_initialized()
-    return execute_query("""
-        SELECT sale_date, SUM(total_amount - discount) as total
-        FROM sales
-        WHERE sale_date >= date('now', '-' || ? || ' days')
-        GROUP BY sale_date
-        ORDER BY sale_date
-    """, (days,))
+    return get_daily_revenue(days_ago(days), location_id=location_id)
+
+@app.get("/api/stats/payment-methods")
+@db_route
+def get_payment_method_stats(days: int = 30, location_id: Optional[int] = None):
+    """Umsatz pro Zahlungsart aus dem Tages-Rollup"""
+    ensure_db_initialized()
+    return get_revenue_by_payment_method(days_ago(days), location_id=location_id)
+
+@app.get("/api/analytics/services")
+@db_route
+def get_service_analytics(start_date: Optional[str] = None, end_date: Optional[str] = None,
+                          category: Optional[str] = None, location_id: Optional[int] = None):
+    """Anzahl, Umsatz und Durchschnittsbon pro Service (Standard: letzte 30 Tage)
+    
+    category: eine oder mehrere Kategorien, kommagetrennt
+    """
+    ensure_db_initialized()
+    categories = [c.strip() for c in category.split(",") if c.strip()] if category else None
+    return get_service_stats(start_date or days_ago(30), end_date, categories, location_id)
+
+@app.get("/api/analytics/customers/top")
+@db_route
+def get_top_customer_analytics(limit: int = 20):
+    """Kunden mit dem höchsten Gesamtumsatz inkl. RFM-Scores"""
+    ensure_db_initialized()
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit muss zwischen 1 und 1000 liegen")
+    return get_top_customers(limit)
+
+@app.get("/api/analytics/customers/segments/{segment}")
+@db_route
+def get_customer_segment_analytics(segment: str, limit: int = 500):
+    """Kunden eines RFM-Segments (champions, loyal, big_spenders, new, at_risk, lost)"""
+    ensure_db_initialized()
+    try:
+        return get_customer_segment(segment, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 # Terminbuchung (SimplyBook.me Stil)
 @app.get("/api/booking/available-slots")
-async def get_available_slots(date: str, employee_id: Optional[int] = None, service_id: int = None):
+@db_route
+def get_available_slots(date: str, employee_id: Optional[int] = None, service_id: int = None):
     """Holt verfügbare Zeitfenster für ein Datum"""
     ensure_db_initialized()
     duration = 60
@@ -1007,8 +1193,22 @@ async def get_available_slots(date: str, employee_id: Optional[int] = None, serv
             duration = service[0]['duration'] or 60
     return get_available_time_slots(date, employee_id, duration)
 
+@app.get("/api/booking/next-available")
+@db_route
+def get_next_available(service_id: int, days: int = 14, limit: int = 5,
+                       employee_id: Optional[int] = None, start_date: Optional[str] = None):
+    """Sucht die frühesten freien Termine für einen Service (alle Mitarbeiter, mehrere Tage)"""
+    ensure_db_initialized()
+    if days < 1 or days > 366 or limit < 1:
+        raise HTTPException(status_code=400, detail="Ungültiger Zeitraum oder Limit")
+    try:
+        return find_next_available_slots(service_id, days, limit, employee_id, start_date)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 @app.post("/api/booking/book")
-async def book_appointment(booking: dict):
+@db_route
+def book_appointment(booking: dict):
     """Erstellt eine Online-Buchung (SimplyBook.me Stil)"""
     ensure_db_initialized()
     try:
@@ -1025,95 +1225,126 @@ async def book_appointment(booking: dict):
             booking['time'],
             booking.get('employee_id')
         )
+        refresh_record('appointment', appointment_id)
         return {"id": appointment_id, "message": "Termin erfolgreich gebucht!"}
+    except BookingConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/booking/upcoming")
-async def get_upcoming(days: int = 7):
+@db_route
+def get_upcoming(days: int = 7):
     """Holt kommende Termine"""
     ensure_db_initialized()
     return get_upcoming_appointments(days)
 
 @app.get("/api/booking/week")
-async def get_week_calendar(start_date: str):
-    """Holt Wochenkalender"""
+@db_route
+def get_week_calendar(start_date: str):
+    """Holt Wochenkalender (Tag -> Mitarbeiter -> Termine)"""
+    ensure_db_initialized()
+    return get_week_view(start_date)
+
+@app.get("/api/booking/month")
+@db_route
+def get_month_calendar(year: int, month: int):
+    """Holt Monatskalender (Tag -> Mitarbeiter -> Termine)"""
     ensure_db_initialized()
-    calendar_df = get_weekly_calendar(start_date)
-    return calendar_df.to_dict('records')
+    if month < 1 or month > 12:
+        raise HTTPException(status_code=400, detail="Ungültiger Monat")
+    return get_month_view(year, month)
+
+# Massenimport
+# Bis zu dieser Größe bleibt ein Upload im Speicher, größere werden in eine temporäre Datei ausgelagert
+IMPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+@app.post("/api/import/{kind}")
+async def bulk_import_endpoint(kind: str, http_request: Request, format: str = "csv"):
+    """Importiert Kunden, Produkte oder Termine aus CSV/NDJSON im Request-Body (auch gzip)
+
+    Antwort: Bericht mit importierten Zeilen, Dubletten, ungültigen Zeilen und Durchsatz.
+    """
+    if kind not in IMPORTERS:
+        raise HTTPException(status_code=404, detail=f"Unbekannter Import: {kind}")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="format muss 'csv' oder 'ndjson' sein")
+    
+    # Body stückweise lesen statt komplett in den Speicher (große Migrationsdateien)
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    async for chunk in http_request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    
+    def run_import():
+        ensure_db_initialized()
+        raw = gzip.GzipFile(fileobj=spool, mode="rb") if spool.read(2) == b"\x1f\x8b" else spool
+        spool.seek(0)
+        with io.TextIOWrapper(raw, encoding="utf-8-sig", newline="") as stream:
+            return import_records(kind, stream, format)
+    
+    try:
+        return await run_db_or_503(run_import)
+    except (UnicodeDecodeError, OSError, EOFError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Datei konnte nicht gelesen werden: {e}")
+    finally:
+        spool.close()
+
+@app.get("/api/export/{kind}")
+@db_route
+def export_endpoint(kind: str, format: str = "csv", month: Optional[str] = None,
+                    start_date: Optional[str] = None, end_date: Optional[str] = None,
+                    location_id: Optional[int] = None, gzip: bool = False):
+    """Streamt Verkäufe (eine Zeile pro Position) oder Termine als CSV, NDJSON oder Parquet
+
+    Zeitraum per month=YYYY-MM oder start_date/end_date; gzip=true komprimiert den Strom.
+    """
+    ensure_db_initialized()
+    if kind not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unbekannter Export: {kind}")
+    try:
+        start, end = resolve_range(month, start_date, end_date)
+        stream = export(kind, format, start, end, location_id, gzip)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = export_filename(kind, format, start, end, location_id, gzip)
+    return StreamingResponse(
+        open_stream_or_503(stream),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
 
 # AI Assistant
 @app.get("/api/ai/status")
-async def ai_status():
-    """Prüft Ollama Status"""
-    from ai_assistant import OLLAMA_BASE_URL
+async def ai_status(refresh: bool = False):
+    """Prüft Ollama Status (gecacht, refresh=true erzwingt eine neue Prüfung)"""
+    from ai_assistant import OLLAMA_BASE_URL, async_get_ollama_status
     import os
-    import requests
     
     # Debug: Prüfe Environment Variable
     env_url = os.getenv("OLLAMA_BASE_URL", "NOT SET")
     
-    available = check_ollama_available()
-    models = []
-    error_msg = None
+    status = await async_get_ollama_status(force=refresh)
+    available = status['available']
     test_response = None
-    
-    if available:
-        models = get_available_models()
-    else:
-        # Versuche direkten Test für bessere Fehlermeldung
-        try:
-            headers = {
-                'User-Agent': 'Beauty-CRM/1.0',
-                'Accept': 'application/json'
-            }
-            response = requests.get(
-                f"{OLLAMA_BASE_URL}/api/tags", 
-                timeout=15,
-                headers=headers
-            )
-            test_response = {
-                "status_code": response.status_code,
-                "url": OLLAMA_BASE_URL,
-                "response_preview": response.text[:200] if response.text else None
-            }
-            if response.status_code != 200:
-                error_msg = f"HTTP {response.status_code}: {response.text[:100]}"
-        except requests.exceptions.Timeout:
-            error_msg = "Timeout (15s) - Hugging Face Spaces könnte im Cold Start sein"
-        except requests.exceptions.ConnectionError as e:
-            error_msg = f"Connection Error: {str(e)[:150]}"
-        except requests.exceptions.SSLError as e:
-            error_msg = f"SSL Error: {str(e)[:150]}"
-        except Exception as e:
-            error_msg = f"{type(e).__name__}: {str(e)[:150]}"
+    if not available and status['status_code'] is not None:
+        test_response = {
+            "status_code": status['status_code'],
+            "url": OLLAMA_BASE_URL,
+            "response_preview": status['response_preview']
+        }
     
     return {
         "available": available,
-        "models": models,
+        "models": status['models'],
         "ollama_url": OLLAMA_BASE_URL,
         "env_url": env_url,
-        "error": error_msg if not available else None,
-        "test_response": test_response if not available else None
+        "error": status['error'] if not available else None,
+        "test_response": test_response
     }
 
-@app.post("/api/ai/chat")
-async def ai_chat(request: dict):
-    """Chat mit AI Assistant"""
-    ensure_db_initialized()
-    from ai_assistant import OLLAMA_BASE_URL
-    
-    # Prüfe Ollama Status mit detaillierter Fehlermeldung
-    available = check_ollama_available()
-    if not available:
-        return {
-            "error": f"Ollama ist nicht verfügbar. URL: {OLLAMA_BASE_URL}. Bitte prüfen Sie die Verbindung zu Hugging Face Spaces."
-        }
-    
-    model = request.get('model', 'llama3.2')
-    message = request.get('message', '')
-    context = get_crm_context()
-    
+def _ai_prompt(message: str, context: str) -> str:
+    """Baut den Prompt aus System-Anweisung, aktuellen CRM-Daten und Benutzernachricht"""
     system_prompt = f"""Du bist ein hilfreicher AI-Assistant für ein Friseur- und Beauty-Salon CRM-System.
 Du hilfst bei Fragen zu:
 - Kundenverwaltung
@@ -1128,19 +1359,123 @@ Aktuelle CRM-Daten:
 
 Antworte immer freundlich, professionell und auf Deutsch."""
     
-    full_prompt = f"{system_prompt}\n\nBenutzer: {message}\n\nAssistant:"
+    return f"{system_prompt}\n\nBenutzer: {message}\n\nAssistant:"
+
+def _ollama_unavailable_error() -> str:
+    from ai_assistant import OLLAMA_BASE_URL
+    return f"Ollama ist nicht verfügbar. URL: {OLLAMA_BASE_URL}. Bitte prüfen Sie die Verbindung zu Hugging Face Spaces."
+
+# Wie oft (Sekunden) während einer Generierung geprüft wird, ob der Client noch verbunden ist
+DISCONNECT_POLL_SECONDS = 0.5
+
+async def _cancel_on_disconnect(http_request: Request, coro):
+    """Führt coro aus und bricht sie ab, sobald der Client die Verbindung trennt (Ergebnis None)"""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                print("AI Chat: Client getrennt, Generierung abgebrochen")
+                return None
+    finally:
+        task.cancel()
+
+@app.post("/api/ai/chat")
+async def ai_chat(request: dict, http_request: Request):
+    """Chat mit AI Assistant (async: andere Anfragen laufen während der Generierung weiter)"""
+    from ai_assistant import async_llm_available, async_chat_with_llm, get_crm_context, is_error_response
+    await run_db_or_503(ensure_db_initialized)
+    
+    # Nur abweisen, wenn gar kein Provider aktiv ist; ist Ollama gestört, übernimmt der Router den Fallback
+    if not await async_llm_available():
+        return {"error": _ollama_unavailable_error()}
+    
+    model = request.get('model', 'llama3.2')
+    message = request.get('message', '')
+    context = await run_db_or_503(get_crm_context, message)
+    
+    # Gleiche Frage bei unveränderten CRM-Daten: Antwort aus dem Cache
+    cache_key = make_key(message, model, context)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return {"response": cached, "cached": True}
     
     try:
-        response = chat_with_llm(full_prompt, model)
+        response = await _cancel_on_disconnect(http_request, async_chat_with_llm(
+            _ai_prompt(message, context), model, hedge=request.get('hedge')))
+        if response is None:
+            return Response(status_code=499)
+        if not is_error_response(response):
+            response_cache.put(cache_key, response)
         return {"response": response}
     except Exception as e:
         return {"error": f"Fehler beim Generieren der Antwort: {str(e)}"}
 
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/ai/chat/stream")
+async def ai_chat_stream(request: dict):
+    """Chat mit AI Assistant als Server-Sent Events: {"token"} pro Stück, dann event 'done'"""
+    from ai_assistant import async_llm_available, stream_chat_with_llm, get_crm_context, is_error_response
+    await run_db_or_503(ensure_db_initialized)
+    model = request.get('model', 'llama3.2')
+    message = request.get('message', '')
+    available = await async_llm_available()
+    # Kontext vorab auf dem DB-Thread-Pool laden: der Stream selbst läuft im Thread-Pool von
+    # Starlette und soll dort keine Datenbankverbindung halten
+    context = await run_db_or_503(get_crm_context, message) if available else None
+    
+    def events():
+        if not available:
+            yield _sse({"error": _ollama_unavailable_error()}, "error")
+            yield _sse({}, "done")
+            return
+        
+        cache_key = make_key(message, model, context)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            yield _sse({"token": cached})
+            yield _sse({"cached": True}, "done")
+            return
+        
+        answer, failed = [], False
+        try:
+            for token in stream_chat_with_llm(_ai_prompt(message, context), model):
+                answer.append(token)
+                yield _sse({"token": token})
+        except Exception as e:
+            failed = True
+            yield _sse({"error": f"Fehler beim Generieren der Antwort: {str(e)}"}, "error")
+        # Nur vollständige Antworten cachen (nicht bei Fehler oder Abbruch durch den Client)
+        if not failed and not is_error_response("".join(answer)):
+            response_cache.put(cache_key, "".join(answer))
+        yield _sse({}, "done")
+    
+    # X-Accel-Buffering: Proxies (nginx) sollen die Tokens nicht puffern
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/ai/cache/stats")
+async def ai_cache_stats():
+    """Hit/Miss-Zähler des AI-Antwort-Caches"""
+    return get_response_cache_stats()
+
+@app.get("/api/ai/providers")
+async def ai_providers():
+    """Circuit-Breaker-Zustand und Latenz pro LLM-Provider"""
+    from ai_assistant import get_llm_provider_stats
+    return get_llm_provider_stats()
+
 @app.post("/api/ai/download-model")
 async def download_ai_model(request: dict):
     """Lädt ein Ollama-Modell herunter"""
+    from ai_assistant import async_download_model
     model_name = request.get('model', 'llama3.2')
-    success = download_model(model_name)
+    success = await async_download_model(model_name)
     return {"success": success, "model": model_name}
 
 # Export für Vercel
@@ -0,0 +1,132 @@
+"""
+Verfügbarkeits-Engine für die Terminbuchung
+Lädt die Buchungen eines Tages einmal als sortierte Minuten-Intervalle pro Mitarbeiter
+und beantwortet Slot- und Überschneidungsabfragen per Bisect bzw. Merge-Sweep.
+"""
+import os
+from bisect import bisect_left
+from typing import List, Dict, Optional, Tuple
+from database import execute_query
+
+# Öffnungszeiten und Slot-Raster (über Environment-Variablen konfigurierbar)
+OPENING_TIME = os.getenv("BOOKING_OPENING_TIME", "09:00")
+CLOSING_TIME = os.getenv("BOOKING_CLOSING_TIME", "18:00")
+SLOT_MINUTES = int(os.getenv("BOOKING_SLOT_MINUTES", "30"))
+DEFAULT_DURATION = 60  # Minuten, falls ein Termin keine Dauer hat
+
+def to_minutes(value: str) -> int:
+    """Wandelt 'HH:MM' oder 'HH:MM:SS' in Minuten seit Mitternacht um"""
+    if len(value) >= 5 and value[2] == ":":
+        return int(value[:2]) * 60 + int(value[3:5])
+    hours, minutes = value.split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+def format_minutes(minutes: int) -> str:
+    """Wandelt Minuten seit Mitternacht in 'HH:MM' um"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def _merge(intervals: List[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+    """Verschmilzt überlappende Intervalle; gibt sortierte Start- und Endlisten zurück"""
+    starts, ends = [], []
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1]:
+            if end > ends[-1]:
+                ends[-1] = end
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+class DayAvailability:
+    """Belegung eines Tages als disjunkte, sortierte Intervalle pro Mitarbeiter
+
+    Termine ohne Mitarbeiter blockieren alle Mitarbeiter. Wird kein Mitarbeiter
+    angegeben, gilt der Salon als eine Ressource: jeder Termin blockiert.
+    """
+
+    def __init__(self, bookings: List[Dict], opening_time: Optional[str] = None,
+                 closing_time: Optional[str] = None, slot_minutes: Optional[int] = None):
+        self.opening = to_minutes(opening_time or OPENING_TIME)
+        self.closing = to_minutes(closing_time or CLOSING_TIME)
+        self.slot_minutes = slot_minutes or SLOT_MINUTES
+
+        self._raw: Dict[Optional[int], List[Tuple[int, int]]] = {}
+        for booking in bookings:
+            if not booking.get('appointment_time'):
+                continue
+            start = to_minutes(booking['appointment_time'])
+            end = start + (booking.get('duration') or DEFAULT_DURATION)
+            self._raw.setdefault(booking.get('employee_id'), []).append((start, end))
+
+        self._merged: Dict[object, Tuple[List[int], List[int]]] = {}
+
+    def _busy(self, employee_id: Optional[int]) -> Tuple[List[int], List[int]]:
+        """Belegte Intervalle aus Sicht eines Mitarbeiters (oder des ganzen Salons)"""
+        key = 'all' if employee_id is None else employee_id
+        if key not in self._merged:
+            if employee_id is None:
+                intervals = [iv for ivs in self._raw.values() for iv in ivs]
+            else:
+                intervals = self._raw.get(employee_id, []) + self._raw.get(None, [])
+            self._merged[key] = _merge(intervals)
+        return self._merged[key]
+
+    def within_opening_hours(self, start: int) -> bool:
+        """Prüft ob ein Termin zu dieser Startzeit gebucht werden darf"""
+        return self.opening <= start <= self.closing - self.slot_minutes
+
+    def slot_starts(self) -> range:
+        """Alle Slot-Startzeiten des Tages in Minuten"""
+        return range(self.opening, self.closing - self.slot_minutes + 1, self.slot_minutes)
+
+    def is_free(self, start: int, duration: int, employee_id: Optional[int] = None) -> bool:
+        """Prüft ob [start, start + duration) frei ist (O(log n))"""
+        starts, ends = self._busy(employee_id)
+        # Letztes belegtes Intervall, das vor dem Ende des gewünschten Zeitraums beginnt
+        idx = bisect_left(starts, start + duration) - 1
+        return idx < 0 or ends[idx] <= start
+
+    def free_slots(self, duration: int, employee_id: Optional[int] = None) -> List[int]:
+        """Alle freien Slot-Startzeiten für eine Dauer (Merge-Sweep, O(Slots + Buchungen))"""
+        starts, ends = self._busy(employee_id)
+        free = []
+        idx = 0
+        count = len(starts)
+        for start in self.slot_starts():
+            # Intervalle überspringen, die vor diesem Slot enden
+            while idx < count and ends[idx] <= start:
+                idx += 1
+            if idx == count or starts[idx] >= start + duration:
+                free.append(start)
+        return free
+
+def load_day(date: str, tx=None, **hours) -> DayAvailability:
+    """Lädt alle aktiven Buchungen eines Tages mit einer Abfrage
+
+    tx: optional eine laufende Transaktion, damit Prüfung und Buchung atomar sind
+    """
+    query = tx.query if tx is not None else execute_query
+    bookings = query("""
+        SELECT employee_id, appointment_time, duration
+        FROM appointments
+        WHERE appointment_date = ?
+        AND status != 'abgesagt'
+    """, (date,))
+    return DayAvailability(bookings, **hours)
+
+def load_range(start_date: str, end_date: str, **hours) -> Dict[str, DayAvailability]:
+    """Lädt alle aktiven Buchungen eines Zeitraums (inklusive) mit einer Abfrage, gruppiert nach Tag
+
+    Tage ohne Buchungen fehlen im Ergebnis; dafür DayAvailability([]) verwenden.
+    """
+    bookings = execute_query("""
+        SELECT appointment_date, employee_id, appointment_time, duration
+        FROM appointments
+        WHERE appointment_date BETWEEN ? AND ?
+        AND status != 'abgesagt'
+    """, (start_date, end_date))
+
+    by_date: Dict[str, List[Dict]] = {}
+    for booking in bookings:
+        by_date.setdefault(booking['appointment_date'], []).append(booking)
+    return {date: DayAvailability(rows, **hours) for date, rows in by_date.items()}
@@ -0,0 +1,122 @@
+"""
+Benchmark: Verfügbarkeit eines Tages mit 1000+ Buchungen – alte Slot-für-Slot-Prüfung gegen DayAvailability
+
+    python benchmarks/bench_availability.py
+    DATABASE_URL=postgresql://... python benchmarks/bench_availability.py
+
+Die Buchungen liegen am Ende des Tages (schlechtester Fall der alten Schleife: jeder frühe
+Slot wird gegen alle Buchungen geprüft). BOOKINGS per Umgebungsvariable anpassbar.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+from common import best_of, database, print_table, setup_database
+from availability import format_minutes, load_day, to_minutes
+
+BOOKINGS = int(os.getenv("BOOKINGS", "1200"))
+DATE = "2099-01-15"  # weit in der Zukunft, damit echte Termine unberührt bleiben
+NOTE = "benchmark"
+
+# --- Baseline: Implementierung vor availability.py (booking_system, unverändert bis auf den Parameternamen) ---
+
+def old_get_available_time_slots(date: str, employee_id=None, service_duration: int = 60):
+    time_slots = []
+    current = datetime.strptime(f"{date} 09:00", "%Y-%m-%d %H:%M")
+    end = datetime.strptime(f"{date} 18:00", "%Y-%m-%d %H:%M")
+    while current < end:
+        time_slots.append(current.strftime("%H:%M"))
+        current += timedelta(minutes=30)
+
+    if employee_id:
+        booked = database.execute_query("""
+            SELECT appointment_time, duration FROM appointments
+            WHERE appointment_date = ? AND employee_id = ? AND status != 'abgesagt'
+        """, (date, employee_id))
+    else:
+        booked = database.execute_query("""
+            SELECT appointment_time, duration FROM appointments
+            WHERE appointment_date = ? AND status != 'abgesagt'
+        """, (date,))
+
+    available_slots = []
+    for slot in time_slots:
+        slot_time = datetime.strptime(f"{date} {slot}", "%Y-%m-%d %H:%M")
+        slot_end = slot_time + timedelta(minutes=service_duration)
+        is_available = True
+        for booking in booked:
+            booking_start = datetime.strptime(f"{date} {booking['appointment_time']}", "%Y-%m-%d %H:%M")
+            booking_end = booking_start + timedelta(minutes=booking['duration'] or 60)
+            if not (slot_end <= booking_start or slot_time >= booking_end):
+                is_available = False
+                break
+        if is_available:
+            available_slots.append(slot)
+    return available_slots
+
+def old_check_availability(date: str, time_: str, employee_id, duration: int) -> bool:
+    slot_start = datetime.strptime(f"{date} {time_}", "%Y-%m-%d %H:%M")
+    slot_end = slot_start + timedelta(minutes=duration)
+    appointments = database.execute_query("""
+        SELECT appointment_time, duration FROM appointments
+        WHERE appointment_date = ? AND (employee_id = ? OR employee_id IS NULL) AND status != 'abgesagt'
+    """, (date, employee_id))
+    for apt in appointments:
+        apt_start = datetime.strptime(f"{date} {apt['appointment_time']}", "%Y-%m-%d %H:%M")
+        apt_end = apt_start + timedelta(minutes=apt['duration'] or 60)
+        if not (slot_end <= apt_start or slot_start >= apt_end):
+            return False
+    return True
+
+# --- Benchmark ---
+
+def seed(employee_ids):
+    rng = random.Random(42)
+    rows = []
+    for _ in range(BOOKINGS):
+        start = rng.randrange(to_minutes("16:00"), to_minutes("17:55"))
+        rows.append((rng.choice(employee_ids), DATE, format_minutes(start), rng.choice((5, 10, 15)), NOTE))
+    database.execute_many("""
+        INSERT INTO appointments (employee_id, appointment_date, appointment_time, duration, notes)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows)
+
+def main():
+    backend = setup_database()
+    employee_ids = [row['id'] for row in database.execute_query("SELECT id FROM employees ORDER BY id")]
+    employee = employee_ids[0]
+    seed(employee_ids)
+    try:
+        # Gleiche Ergebnisse, sonst wäre der Vergleich wertlos
+        day = load_day(DATE)
+        assert old_get_available_time_slots(DATE) == [format_minutes(m) for m in day.free_slots(60)]
+        checks = [format_minutes(m) for m in range(to_minutes("09:00"), to_minutes("17:30") + 1, 15)]
+        assert [old_check_availability(DATE, t, employee, 30) for t in checks] == \
+            [day.is_free(to_minutes(t), 30, employee) for t in checks]
+
+        rows = []
+        old = best_of(lambda: old_get_available_time_slots(DATE, None, 60))
+        new = best_of(lambda: load_day(DATE).free_slots(60))
+        rows.append(("free_slots, ganzer Salon", f"{old * 1000:.2f}", f"{new * 1000:.2f}", f"{old / new:.0f}x"))
+
+        old = best_of(lambda: old_get_available_time_slots(DATE, employee, 60))
+        new = best_of(lambda: load_day(DATE).free_slots(60, employee))
+        rows.append(("free_slots, ein Mitarbeiter", f"{old * 1000:.2f}", f"{new * 1000:.2f}", f"{old / new:.0f}x"))
+
+        # Alte Prüfung: eine Abfrage plus Schleife pro Aufruf; neu: Tag einmal laden, dann Bisect
+        old = best_of(lambda: [old_check_availability(DATE, t, employee, 30) for t in checks]) / len(checks)
+        new_loaded = best_of(lambda: load_day(DATE).is_free(to_minutes("09:00"), 30, employee))
+        day._busy(employee)  # Intervalle einmal aufbauen, wie bei wiederholten Prüfungen
+        new = best_of(lambda: [day.is_free(to_minutes(t), 30, employee) for t in checks]) / len(checks)
+        rows.append(("is_free inkl. Laden des Tages", f"{old * 1000:.2f}", f"{new_loaded * 1000:.2f}",
+                     f"{old / new_loaded:.0f}x"))
+        rows.append(("is_free, Tag bereits geladen", f"{old * 1000:.2f}", f"{new * 1000:.4f}", f"{old / new:.0f}x"))
+
+        print_table(f"Verfügbarkeit, {backend}, {BOOKINGS} Buchungen an einem Tag",
+                    ("Operation", "alt ms", "neu ms", "Faktor"), rows)
+    finally:
+        database.execute_update("DELETE FROM appointments WHERE appointment_date = ? AND notes = ?", (DATE, NOTE))
+        database.close_pool()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark: Wochen- und Monatskalender – alte Abfrage pro Tag gegen eine Bereichsabfrage
+
+    python benchmarks/bench_calendar.py
+    DATABASE_URL=postgresql://... python benchmarks/bench_calendar.py
+
+APPOINTMENTS und CUSTOMERS per Umgebungsvariable anpassbar.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+from common import best_of, database, print_table, setup_database
+from booking_system import get_month_view, get_week_view
+
+APPOINTMENTS = int(os.getenv("APPOINTMENTS", "10800"))
+CUSTOMERS = int(os.getenv("CUSTOMERS", "2000"))
+FIRST_DAY = datetime(2099, 1, 1)  # weit in der Zukunft, damit echte Termine unberührt bleiben
+DAYS = 180
+NOTE = "benchmark"
+
+# --- Baseline: get_weekly_calendar vor der Bereichsabfrage (eine Abfrage pro Tag, ohne DataFrame) ---
+
+def old_calendar(dates):
+    calendar_data = []
+    for date in dates:
+        date_str = date.strftime("%Y-%m-%d")
+        appointments = database.execute_query("""
+            SELECT a.*, c.first_name || ' ' || c.last_name as customer_name,
+                   s.name as service_name, e.first_name || ' ' || e.last_name as employee_name
+            FROM appointments a
+            LEFT JOIN customers c ON a.customer_id = c.id
+            LEFT JOIN services s ON a.service_id = s.id
+            LEFT JOIN employees e ON a.employee_id = e.id
+            WHERE a.appointment_date = ?
+            ORDER BY a.appointment_time
+        """, (date_str,))
+        for apt in appointments:
+            calendar_data.append({
+                'Datum': date.strftime("%d.%m.%Y"),
+                'Wochentag': date.strftime("%A"),
+                'Uhrzeit': apt['appointment_time'],
+                'Kunde': apt['customer_name'],
+                'Service': apt['service_name'],
+                'Mitarbeiter': apt['employee_name'] or 'N/A',
+                'Status': apt['status']
+            })
+    return calendar_data
+
+def old_week(start: datetime):
+    return old_calendar([start + timedelta(days=i) for i in range(7)])
+
+def old_month(year: int, month: int):
+    day, dates = datetime(year, month, 1), []
+    while day.month == month:
+        dates.append(day)
+        day += timedelta(days=1)
+    return old_calendar(dates)
+
+# --- Benchmark ---
+
+def seed():
+    rng = random.Random(7)
+    database.execute_many("INSERT INTO customers (first_name, last_name, email) VALUES (?, ?, ?)", [
+        (f"Kunde{i}", "Kalender", f"kunde{i}@kalender.example") for i in range(CUSTOMERS)])
+    customer_ids = [row['id'] for row in database.execute_query(
+        "SELECT id FROM customers WHERE last_name = 'Kalender'")]
+    employee_ids = [row['id'] for row in database.execute_query("SELECT id FROM employees")]
+    service_ids = [row['id'] for row in database.execute_query("SELECT id FROM services")]
+    database.execute_many("""
+        INSERT INTO appointments (customer_id, service_id, employee_id, appointment_date,
+                                  appointment_time, duration, notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(rng.choice(customer_ids), rng.choice(service_ids), rng.choice(employee_ids),
+           (FIRST_DAY + timedelta(days=rng.randrange(DAYS))).strftime("%Y-%m-%d"),
+           f"{rng.randrange(9, 18):02d}:{rng.choice((0, 30)):02d}", 30, NOTE)
+          for _ in range(APPOINTMENTS)])
+
+def cleanup():
+    database.execute_update("DELETE FROM appointments WHERE notes = ? AND appointment_date >= ?",
+                            (NOTE, FIRST_DAY.strftime("%Y-%m-%d")))
+    database.execute_update("DELETE FROM customers WHERE last_name = 'Kalender' AND email LIKE ?",
+                            ("%@kalender.example",))
+
+def main():
+    backend = setup_database()
+    seed()
+    try:
+        week = FIRST_DAY + timedelta(days=63)
+        week_str = week.strftime("%Y-%m-%d")
+        # Gleiche Termine in alter und neuer Ansicht
+        new_count = sum(len(g['appointments']) for groups in get_week_view(week_str).values() for g in groups)
+        assert len(old_week(week)) == new_count
+
+        rows = []
+        old = best_of(lambda: old_week(week), repeat=20)
+        new = best_of(lambda: get_week_view(week_str), repeat=20)
+        rows.append(("Woche (7 Tage)", "7", f"{old * 1000:.2f}", "1", f"{new * 1000:.2f}", f"{old / new:.1f}x"))
+
+        year, month = FIRST_DAY.year, 3
+        old = best_of(lambda: old_month(year, month), repeat=10)
+        new = best_of(lambda: get_month_view(year, month), repeat=10)
+        rows.append(("Monat (31 Tage)", "31", f"{old * 1000:.2f}", "1", f"{new * 1000:.2f}", f"{old / new:.1f}x"))
+
+        print_table(f"Kalender, {backend}, {APPOINTMENTS} Termine über {DAYS} Tage, {CUSTOMERS} Kunden",
+                    ("Ansicht", "Abfragen alt", "alt ms", "Abfragen neu", "neu ms", "Faktor"), rows)
+    finally:
+        cleanup()
+        database.close_pool()
+
+if __name__ == "__main__":
+    main()
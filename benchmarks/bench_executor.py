@@ -0,0 +1,64 @@
+"""
+Benchmark: Durchsatz des DB-Thread-Pools (db_executor) in Abhängigkeit von der Thread-Zahl
+
+    python benchmarks/bench_executor.py
+    DATABASE_URL=postgresql://... python benchmarks/bench_executor.py
+
+Jeder Auftrag ist eine Abfrage mit LATENCY_MS Wartezeit: bei PostgreSQL per pg_sleep auf dem
+Server, bei SQLite als simulierte Netzwerklatenz vor der Abfrage. Reine CPU-Arbeit in SQLite
+skaliert wegen des GIL kaum; die Messung ohne Latenz zeigt das zum Vergleich.
+WORKERS, TASKS und LATENCY_MS per Umgebungsvariable anpassbar.
+"""
+import asyncio
+import os
+import time
+
+from common import database, print_table, setup_database
+from db_executor import DBExecutor
+
+WORKERS = [int(w) for w in os.getenv("WORKERS", "1,2,4,8").split(",")]
+TASKS = int(os.getenv("TASKS", "400"))
+LATENCY_MS = float(os.getenv("LATENCY_MS", "5"))
+
+def query_with_latency():
+    if database.USE_POSTGRESQL:
+        return database.execute_query("SELECT pg_sleep(?) as slept", (LATENCY_MS / 1000,))
+    time.sleep(LATENCY_MS / 1000)
+    return database.execute_query("SELECT COUNT(*) as n FROM appointments")
+
+def query_only():
+    return database.execute_query("SELECT COUNT(*) as n FROM appointments")
+
+async def throughput(workers: int, task) -> float:
+    """Aufträge pro Sekunde, wenn TASKS Aufträge gleichzeitig eintreffen"""
+    executor = DBExecutor(workers=workers, max_queue=TASKS)
+    try:
+        await asyncio.gather(*(executor.run(task) for _ in range(workers)))  # Threads und Pool anwärmen
+        start = time.perf_counter()
+        await asyncio.gather(*(executor.run(task) for _ in range(TASKS)))
+        elapsed = time.perf_counter() - start
+        assert executor.stats()['rejected'] == 0
+        return TASKS / elapsed
+    finally:
+        executor._executor.shutdown(wait=True)
+
+def main():
+    backend = setup_database()
+    if max(WORKERS) > database.DB_POOL_MAX_SIZE:
+        print(f"Hinweis: mehr Threads als DB_POOL_MAX_SIZE={database.DB_POOL_MAX_SIZE}, Threads warten auf den Pool")
+    rows = []
+    base_latency = base_query = None
+    for workers in WORKERS:
+        with_latency = asyncio.run(throughput(workers, query_with_latency))
+        cpu_only = asyncio.run(throughput(workers, query_only))
+        base_latency = base_latency or with_latency
+        base_query = base_query or cpu_only
+        rows.append((workers, f"{with_latency:,.0f}", f"{with_latency / base_latency:.1f}x",
+                     f"{cpu_only:,.0f}", f"{cpu_only / base_query:.1f}x"))
+    print_table(f"DB-Thread-Pool, {backend}, {TASKS} gleichzeitige Aufträge, {os.cpu_count()} CPU(s)",
+                ("Threads", f"/s mit {LATENCY_MS:g} ms Latenz", "Skalierung", "/s nur Abfrage", "Skalierung"),
+                rows)
+    database.close_pool()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark: Abfragen pro Sekunde mit neuer Verbindung pro Abfrage (vorher) und Connection-Pool (jetzt)
+
+    python benchmarks/bench_pool.py                              # SQLite (Temp-Datei)
+    DATABASE_URL=postgresql://... python benchmarks/bench_pool.py  # PostgreSQL
+
+Bei PostgreSQL kostet jede neue Verbindung TCP-/TLS-Handshake und Authentifizierung;
+genau das spart der Pool. QUERIES und THREADS per Umgebungsvariable anpassbar.
+"""
+import os
+import threading
+import time
+
+from common import best_of, database, print_table, setup_database
+
+QUERIES = int(os.getenv("QUERIES", "2000"))
+THREADS = [int(t) for t in os.getenv("THREADS", "1,4").split(",")]
+# customers ist keine Stammdaten-Tabelle, der Query-Cache greift also nicht
+QUERY = "SELECT id, first_name, last_name, email FROM customers WHERE id = ?"
+
+def query_unpooled(customer_id: int):
+    """execute_query() vor dem Pool: eine neue Verbindung pro Abfrage"""
+    conn = database.get_connection()
+    try:
+        cursor = database.get_cursor(conn)
+        cursor.execute(database._adapt_placeholders(QUERY, (customer_id,)), (customer_id,))
+        return [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+def query_pooled(customer_id: int):
+    return database.execute_query(QUERY, (customer_id,))
+
+def run(query, threads: int, ids):
+    """Verteilt QUERIES Abfragen auf `threads` Threads"""
+    per_thread = QUERIES // threads
+
+    def worker(offset: int):
+        for i in range(per_thread):
+            query(ids[(offset + i) % len(ids)])
+
+    workers = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+def main():
+    backend = setup_database()
+    created = []
+    for i in range(50):
+        created.append(database.execute_update(
+            "INSERT INTO customers (first_name, last_name, email) VALUES (?, ?, ?)",
+            (f"Bench{i}", "Pool", f"bench{i}@pool.example")))
+    try:
+        rows = []
+        for threads in THREADS:
+            before = best_of(lambda: run(query_unpooled, threads, created), repeat=3)
+            database.close_pool()
+            query_pooled(created[0])  # Pool anwärmen wie im laufenden Betrieb
+            after = best_of(lambda: run(query_pooled, threads, created), repeat=3)
+            rows.append((threads, f"{QUERIES / before:,.0f}", f"{QUERIES / after:,.0f}",
+                         f"{before / after:.1f}x"))
+        print_table(f"Connection-Pool, {backend}, {QUERIES} Abfragen",
+                    ("Threads", "qps ohne Pool", "qps mit Pool", "Faktor"), rows)
+        print(f"  Pool: {database.get_pool_stats()}")
+    finally:
+        database.execute_update("DELETE FROM customers WHERE last_name = ? AND email LIKE ?",
+                                ("Pool", "bench%@pool.example"))
+        database.close_pool()
+
+if __name__ == "__main__":
+    main()
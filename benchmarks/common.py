@@ -0,0 +1,49 @@
+"""
+Gemeinsame Hilfen für die Benchmarks
+Standard ist eine frische SQLite-Datei im Temp-Verzeichnis. Ist DATABASE_URL gesetzt (und DB_TYPE
+nicht), läuft derselbe Benchmark gegen PostgreSQL; dort legt er Testdaten an und räumt sie wieder ab.
+"""
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, List, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if os.getenv("DATABASE_URL") and not os.getenv("DB_TYPE"):
+    os.environ["DB_TYPE"] = "postgresql"
+
+import database  # noqa: E402
+
+def setup_database() -> str:
+    """Initialisiert die Benchmark-Datenbank und gibt das Backend zurück ('sqlite' oder 'postgresql')"""
+    if database.USE_POSTGRESQL:
+        backend = "postgresql"
+    else:
+        database.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_"), "bench.db")
+        backend = "sqlite"
+    database.close_pool()
+    database.query_cache.clear()
+    database.init_database()
+    return backend
+
+def best_of(fn: Callable, repeat: int = 5) -> float:
+    """Schnellste von `repeat` Laufzeiten in Sekunden (robust gegen Ausreißer)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def print_table(title: str, header: Sequence[str], rows: List[Sequence]):
+    """Gibt eine einfache, ausgerichtete Ergebnistabelle aus"""
+    cells = [[str(c) for c in header]] + [[str(c) for c in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+    print(f"\n{title}")
+    for n, row in enumerate(cells):
+        print("  " + "  ".join(c.rjust(w) for c, w in zip(row, widths)))
+        if n == 0:
+            print("  " + "  ".join("-" * w for w in widths))
@@ -1,131 +1,207 @@
 """
 Erweiterte Terminbuchungsfunktion im SimplyBook.me Stil
 """
-from datetime import datetime, timedelta, time
-from typing import List, Dict, Optional, Tuple
-from database import execute_query, execute_update
-import pandas as pd
-
-def get_available_time_slots(date: str, employee_id: Optional[int] = None, service_duration: int = 60) -> List[str]:
-    """Ermittelt verfügbare Zeitfenster für ein bestimmtes Datum"""
-    # Öffnungszeiten (9:00 - 18:00)
-    start_time = time(9, 0)
-    end_time = time(18, 0)
-    
-    # Zeitblöcke (alle 30 Minuten)
-    time_slots = []
-    current = datetime.combine(datetime.strptime(date, "%Y-%m-%d").date(), start_time)
-    end = datetime.combine(datetime.strptime(date, "%Y-%m-%d").date(), end_time)
-    
-    while current < end:
-        time_slots.append(current.strftime("%H:%M"))
-        current += timedelta(minutes=30)
-    
-    # Prüfe gebuchte Termine
-    if employee_id:
-        booked = execute_query("""
-            SELECT appointment_time, duration 
-            FROM appointments 
-            WHERE appointment_date = ? 
-            AND employee_id = ?
-            AND status != 'abgesagt'
-        """, (date, employee_id))
-    else:
-        booked = execute_query("""
-            SELECT appointment_time, duration 
-            FROM appointments 
-            WHERE appointment_date = ? 
-            AND status != 'abgesagt'
-        """, (date,))
-    
-    # Entferne belegte Zeiten
-    available_slots = []
-    for slot in time_slots:
-        slot_time = datetime.strptime(f"{date} {slot}", "%Y-%m-%d %H:%M")
-        slot_end = slot_time + timedelta(minutes=service_duration)
-        
-        is_available = True
-        for booking in booked:
-            booking_start = datetime.strptime(f"{date} {booking['appointment_time']}", "%Y-%m-%d %H:%M")
-            booking_end = booking_start + timedelta(minutes=booking['duration'] or 60)
-            
-            # Prüfe Überschneidung
-            if not (slot_end <= booking_start or slot_time >= booking_end):
-                is_available = False
-                break
-        
-        if is_available:
-            available_slots.append(slot)
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Tuple, TYPE_CHECKING
+from database import USE_POSTGRESQL, execute_query, execute_update, transaction
+from availability import DayAvailability, load_day, load_range, to_minutes, format_minutes
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Namensraum für PostgreSQL Advisory-Locks der Terminbuchung (zweiter Schlüssel: Datum)
+BOOKING_LOCK_NAMESPACE = 7301
+
+class BookingConflictError(ValueError):
+    """Das gewünschte Zeitfenster ist nicht (mehr) verfügbar"""
+
+def get_available_time_slots(date: str, employee_id: Optional[int] = None, service_duration: int = 60,
+                             opening_time: Optional[str] = None, closing_time: Optional[str] = None,
+                             slot_minutes: Optional[int] = None) -> List[str]:
+    """Ermittelt verfügbare Zeitfenster für ein bestimmtes Datum
     
-    return available_slots
+    Öffnungszeiten und Slot-Raster kommen aus availability (Standard 9:00 - 18:00, 30 Minuten).
+    """
+    day = load_day(date, opening_time=opening_time, closing_time=closing_time, slot_minutes=slot_minutes)
+    return [format_minutes(start) for start in day.free_slots(service_duration, employee_id)]
 
-def check_availability(date: str, time: str, employee_id: Optional[int], duration: int) -> Tuple[bool, str]:
+def check_availability(date: str, time: str, employee_id: Optional[int], duration: int,
+                       opening_time: Optional[str] = None, closing_time: Optional[str] = None,
+                       slot_minutes: Optional[int] = None) -> Tuple[bool, str]:
     """Prüft ob ein Zeitfenster verfügbar ist"""
+    day = load_day(date, opening_time=opening_time, closing_time=closing_time, slot_minutes=slot_minutes)
+    return _slot_status(day, to_minutes(time), duration, employee_id)
+
+def _slot_status(day: DayAvailability, start: int, duration: int,
+                 employee_id: Optional[int]) -> Tuple[bool, str]:
     # Prüfe ob innerhalb der Öffnungszeiten
-    slot_time = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M").time()
-    if slot_time < time(9, 0) or slot_time > time(17, 30):
-        return False, "Außerhalb der Öffnungszeiten (9:00 - 18:00)"
+    if not day.within_opening_hours(start):
+        return False, f"Außerhalb der Öffnungszeiten ({format_minutes(day.opening)} - {format_minutes(day.closing)})"
+    
+    if not day.is_free(start, duration, employee_id):
+        return False, f"Zeitfenster bereits belegt"
+    
+    return True, "Verfügbar"
+
+def reserve_slot(tx, date: str, time: str, employee_id: Optional[int], duration: int):
+    """Prüft ein Zeitfenster innerhalb einer Schreibtransaktion und sperrt den Tag bis zum Commit
+    
+    Wirft BookingConflictError, falls das Zeitfenster nicht frei ist. SQLite serialisiert
+    Schreiber über transaction(immediate=True); PostgreSQL über einen Advisory-Lock pro Tag.
+    """
+    if USE_POSTGRESQL:
+        tx.query("SELECT pg_advisory_xact_lock(?, ?)",
+                 (BOOKING_LOCK_NAMESPACE, int(date.replace("-", ""))))
     
-    # Berechne Start- und Endzeit
-    slot_start = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-    slot_end = slot_start + timedelta(minutes=duration)
+    is_available, message = _slot_status(load_day(date, tx=tx), to_minutes(time), duration, employee_id)
+    if not is_available:
+        raise BookingConflictError(message)
+
+def find_next_available_slots(service_id: int, days: int = 14, limit: int = 5,
+                              employee_id: Optional[int] = None,
+                              start_date: Optional[str] = None) -> List[Dict]:
+    """Sucht die frühesten freien Termine für einen Service bei beliebigen Mitarbeitern
+    
+    Lädt Buchungen und Mitarbeiter für den ganzen Zeitraum mit je einer Abfrage und
+    berechnet die Verfügbarkeit in einem Durchlauf; Ergebnis sortiert nach Zeit und Mitarbeiter.
+    """
+    service = execute_query("SELECT duration FROM services WHERE id = ?", (service_id,))
+    if not service:
+        raise ValueError("Service nicht gefunden")
+    duration = service[0]['duration'] or 60
     
-    # Prüfe Überschneidungen - hole alle Termine für das Datum
     if employee_id:
-        appointments = execute_query("""
-            SELECT appointment_time, duration 
-            FROM appointments 
-            WHERE appointment_date = ? 
-            AND (employee_id = ? OR employee_id IS NULL)
-            AND status != 'abgesagt'
-        """, (date, employee_id))
+        employees = execute_query("""
+            SELECT id, first_name || ' ' || last_name as name 
+            FROM employees WHERE id = ? AND active = 1
+        """, (employee_id,))
     else:
-        appointments = execute_query("""
-            SELECT appointment_time, duration 
-            FROM appointments 
-            WHERE appointment_date = ? 
-            AND status != 'abgesagt'
-        """, (date,))
-    
-    # Prüfe jede Buchung auf Überschneidung
-    for apt in appointments:
-        apt_start = datetime.strptime(f"{date} {apt['appointment_time']}", "%Y-%m-%d %H:%M")
-        apt_duration = apt['duration'] or 60
-        apt_end = apt_start + timedelta(minutes=apt_duration)
+        employees = execute_query("""
+            SELECT id, first_name || ' ' || last_name as name 
+            FROM employees WHERE active = 1 
+            ORDER BY id
+        """)
+    if not employees:
+        return []
+    
+    now = datetime.now()
+    first_day = datetime.strptime(start_date, "%Y-%m-%d") if start_date else now
+    last_day = first_day + timedelta(days=days - 1)
+    booked_days = load_range(first_day.strftime("%Y-%m-%d"), last_day.strftime("%Y-%m-%d"))
+    today = now.strftime("%Y-%m-%d")
+    now_minutes = now.hour * 60 + now.minute
+    
+    candidates = []
+    for offset in range(days):
+        date_str = (first_day + timedelta(days=offset)).strftime("%Y-%m-%d")
+        if date_str < today:
+            continue
+        day = booked_days.get(date_str) or DayAvailability([])
         
-        # Prüfe Überschneidung
-        if not (slot_end <= apt_start or slot_start >= apt_end):
-            return False, f"Zeitfenster bereits belegt"
+        day_slots = []
+        for emp in employees:
+            for start in day.free_slots(duration, emp['id']):
+                # Heute nur Zeitfenster in der Zukunft
+                if date_str == today and start <= now_minutes:
+                    continue
+                day_slots.append((start, emp['id'], emp['name']))
+        
+        day_slots.sort()
+        for start, emp_id, emp_name in day_slots:
+            candidates.append({
+                'date': date_str,
+                'time': format_minutes(start),
+                'employee_id': emp_id,
+                'employee_name': emp_name,
+                'duration': duration
+            })
+        
+        # Spätere Tage können nur spätere Termine liefern
+        if len(candidates) >= limit:
+            break
     
-    return True, "Verfügbar"
+    return candidates[:limit]
 
-def get_weekly_calendar(start_date: str) -> pd.DataFrame:
-    """Erstellt eine Wochenansicht des Kalenders"""
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    week_dates = [start + timedelta(days=i) for i in range(7)]
+def get_calendar(start_date: str, end_date: str) -> Dict[str, List[Dict]]:
+    """Holt alle Termine eines Zeitraums (inklusive) mit einer Abfrage
+    
+    Ergebnis: Tag -> Mitarbeiter -> Termine, z.B.
+    {'2024-05-06': [{'employee_id': 1, 'employee_name': 'Maria Schmidt', 'appointments': [...]}]}
+    Jeder Tag des Zeitraums ist enthalten, auch ohne Termine.
+    """
+    rows = execute_query("""
+        SELECT a.id, a.appointment_date, a.appointment_time, a.duration, a.status,
+               a.customer_id, a.service_id, a.employee_id,
+               c.first_name || ' ' || c.last_name as customer_name, 
+               s.name as service_name, e.first_name || ' ' || e.last_name as employee_name
+        FROM appointments a
+        LEFT JOIN customers c ON a.customer_id = c.id
+        LEFT JOIN services s ON a.service_id = s.id
+        LEFT JOIN employees e ON a.employee_id = e.id
+        WHERE a.appointment_date BETWEEN ? AND ?
+        ORDER BY a.appointment_date, a.employee_id, a.appointment_time
+    """, (start_date, end_date))
+    
+    calendar = {}
+    current = datetime.strptime(start_date, "%Y-%m-%d")
+    last = datetime.strptime(end_date, "%Y-%m-%d")
+    while current <= last:
+        calendar[current.strftime("%Y-%m-%d")] = []
+        current += timedelta(days=1)
+    
+    # Zeilen sind nach Tag und Mitarbeiter sortiert: neue Gruppe bei jedem Wechsel
+    for row in rows:
+        groups = calendar.setdefault(row['appointment_date'], [])
+        if not groups or groups[-1]['employee_id'] != row['employee_id']:
+            groups.append({
+                'employee_id': row['employee_id'],
+                'employee_name': row['employee_name'],
+                'appointments': []
+            })
+        groups[-1]['appointments'].append({
+            'id': row['id'],
+            'time': row['appointment_time'],
+            'duration': row['duration'],
+            'status': row['status'],
+            'customer_id': row['customer_id'],
+            'customer_name': row['customer_name'],
+            'service_id': row['service_id'],
+            'service_name': row['service_name']
+        })
     
+    return calendar
+
+def get_week_view(start_date: str) -> Dict[str, List[Dict]]:
+    """Wochenansicht: sieben Tage ab start_date"""
+    end = datetime.strptime(start_date, "%Y-%m-%d") + timedelta(days=6)
+    return get_calendar(start_date, end.strftime("%Y-%m-%d"))
+
+def get_month_view(year: int, month: int) -> Dict[str, List[Dict]]:
+    """Monatsansicht: alle Tage eines Kalendermonats"""
+    first = datetime(year, month, 1)
+    next_month = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    last = next_month - timedelta(days=1)
+    return get_calendar(first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d"))
+
+def get_weekly_calendar(start_date: str) -> "pd.DataFrame":
+    """Erstellt eine Wochenansicht des Kalenders als Tabelle"""
+    # pandas erst hier laden: die API braucht es nicht und startet ohne deutlich schneller
+    import pandas as pd
     calendar_data = []
-    for date in week_dates:
-        date_str = date.strftime("%Y-%m-%d")
-        appointments = execute_query("""
-            SELECT a.*, c.first_name || ' ' || c.last_name as customer_name, 
-                   s.name as service_name, e.first_name || ' ' || e.last_name as employee_name
-            FROM appointments a
-            LEFT JOIN customers c ON a.customer_id = c.id
-            LEFT JOIN services s ON a.service_id = s.id
-            LEFT JOIN employees e ON a.employee_id = e.id
-            WHERE a.appointment_date = ?
-            ORDER BY a.appointment_time
-        """, (date_str,))
-        
-        for apt in appointments:
+    for date_str, groups in get_week_view(start_date).items():
+        date = datetime.strptime(date_str, "%Y-%m-%d")
+        appointments = sorted(
+            ((apt, group['employee_name']) for group in groups for apt in group['appointments']),
+            key=lambda item: item[0]['time']
+        )
+        for apt, employee_name in appointments:
             calendar_data.append({
                 'Datum': date.strftime("%d.%m.%Y"),
                 'Wochentag': date.strftime("%A"),
-                'Uhrzeit': apt['appointment_time'],
+                'Uhrzeit': apt['time'],
                 'Kunde': apt['customer_name'],
                 'Service': apt['service_name'],
-                'Mitarbeiter': apt['employee_name'] or apt.get('employee_name', 'N/A'),
+                'Mitarbeiter': employee_name or 'N/A',
                 'Status': apt['status']
             })
     
@@ -145,49 +221,63 @@ def get_employee_schedule(employee_id: int, date: str) -> List[Dict]:
 
 def create_online_booking(customer_data: Dict, service_id: int, date: str, time: str, 
                          employee_id: Optional[int] = None) -> int:
-    """Erstellt eine Online-Buchung"""
-    # Prüfe Verfügbarkeit
+    """Erstellt eine Online-Buchung (wirft BookingConflictError bei belegtem Zeitfenster)"""
     service = execute_query("SELECT * FROM services WHERE id = ?", (service_id,))
     if not service:
         raise ValueError("Service nicht gefunden")
     
     duration = service[0]['duration'] or 60
-    is_available, message = check_availability(date, time, employee_id, duration)
     
-    if not is_available:
-        raise ValueError(message)
-    
-    # Erstelle oder finde Kunde
-    customer_id = None
-    if customer_data.get('email'):
-        existing = execute_query("SELECT id FROM customers WHERE email = ?", (customer_data['email'],))
-        if existing:
-            customer_id = existing[0]['id']
-            # Aktualisiere Kundendaten
-            execute_update("""
-                UPDATE customers 
-                SET first_name = ?, last_name = ?, phone = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
+    # Verfügbarkeitsprüfung, Kunde und Termin atomar in einer Schreibtransaktion
+    with transaction(immediate=True) as tx:
+        reserve_slot(tx, date, time, employee_id, duration)
+        
+        # Erstelle oder finde Kunde
+        customer_id = None
+        if customer_data.get('email'):
+            existing = tx.query("SELECT id FROM customers WHERE email = ?", (customer_data['email'],))
+            if existing:
+                customer_id = existing[0]['id']
+                # Aktualisiere Kundendaten
+                tx.execute("""
+                    UPDATE customers 
+                    SET first_name = ?, last_name = ?, phone = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, (customer_data['first_name'], customer_data['last_name'], 
+                      customer_data.get('phone'), customer_id))
+        
+        if not customer_id:
+            # Neuer Kunde
+            customer_id = tx.execute("""
+                INSERT INTO customers (first_name, last_name, email, phone)
+                VALUES (?, ?, ?, ?)
             """, (customer_data['first_name'], customer_data['last_name'], 
-                  customer_data.get('phone'), customer_id))
-    
-    if not customer_id:
-        # Neuer Kunde
-        customer_id = execute_update("""
-            INSERT INTO customers (first_name, last_name, email, phone)
-            VALUES (?, ?, ?, ?)
-        """, (customer_data['first_name'], customer_data['last_name'], 
-              customer_data.get('email'), customer_data.get('phone')))
-    
-    # Erstelle Termin
-    appointment_id = execute_update("""
-        INSERT INTO appointments (customer_id, service_id, employee_id, 
-                                appointment_date, appointment_time, duration, status)
-        VALUES (?, ?, ?, ?, ?, ?, 'geplant')
-    """, (customer_id, service_id, employee_id, date, time, duration))
+                  customer_data.get('email'), customer_data.get('phone')))
+        
+        # Erstelle Termin
+        appointment_id = tx.execute("""
+            INSERT INTO appointments (customer_id, service_id, employee_id, 
+                                    appointment_date, appointment_time, duration, status)
+            VALUES (?, ?, ?, ?, ?, ?, 'geplant')
+        """, (customer_id, service_id, employee_id, date, time, duration))
     
     return appointment_id
 
+def create_appointment(customer_id: int, service_id: int, date: str, time: str,
+                       employee_id: Optional[int], duration: int, notes: Optional[str] = None,
+                       group_size: int = 1) -> int:
+    """Legt einen Termin an, nachdem das Zeitfenster atomar geprüft wurde
+    
+    Wirft BookingConflictError, falls das Zeitfenster inzwischen belegt ist.
+    """
+    with transaction(immediate=True) as tx:
+        reserve_slot(tx, date, time, employee_id, duration)
+        return tx.execute("""
+            INSERT INTO appointments (customer_id, service_id, employee_id, 
+                                    appointment_date, appointment_time, duration, notes, status, group_size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'geplant', ?)
+        """, (customer_id, service_id, employee_id, date, time, duration, notes, group_size))
+
 def get_upcoming_appointments(days: int = 7) -> List[Dict]:
     """Holt kommende Termine"""
     end_date = (datetime.now() + timedelta(days=days)).strftime("%Y-%m-%d")
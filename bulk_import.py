@@ -0,0 +1,413 @@
+"""
+Massenimport für Kunden, Produkte und Termine (z.B. beim Umzug aus einem anderen System)
+Liest CSV oder NDJSON zeilenweise, prüft jede Zeile und schreibt in Blöcken per executemany,
+eine Transaktion pro Block. Der Speicherbedarf hängt nur von der Blockgröße ab, nicht von der Datei.
+
+Aufruf:
+    python bulk_import.py customers kunden.csv
+    python bulk_import.py appointments termine.ndjson.gz
+    python bulk_import.py products - ndjson < produkte.ndjson
+"""
+import csv
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from itertools import chain
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from database import Transaction, execute_query, transaction
+from customer_search import PHONE_KEY_SQL, normalize_phone
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))  # Zeilen pro Transaktion
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))  # gemeldete Fehlerzeilen (gezählt werden alle)
+FORMATS = ("csv", "ndjson")
+IN_CHUNK = 400  # Parameter pro IN-Liste (SQLite erlaubt je nach Version nur 999 pro Abfrage)
+
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_TIME_RE = re.compile(r"^(\d{1,2}):(\d{2})(?::\d{2})?$")
+
+class ImportRowError(ValueError):
+    """Ungültige Zeile; die Meldung landet im Importbericht"""
+
+# --- Lesen ---
+
+def read_records(stream: TextIO, format: str = "csv") -> Iterator[Tuple[int, object]]:
+    """Liefert (Zeilennummer, Datensatz) – bei CSV ein Dictionary, bei NDJSON die rohe Zeile
+
+    CSV-Trennzeichen (Komma oder Semikolon wie bei deutschem Excel) wird an der Kopfzeile erkannt.
+    """
+    if format == "ndjson":
+        for number, line in enumerate(stream, start=1):
+            if line.strip():
+                yield number, line
+        return
+
+    header = stream.readline()
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    reader = csv.DictReader(chain([header], stream), delimiter=delimiter)
+    reader.fieldnames = [(name or "").strip().lower() for name in reader.fieldnames or []]
+    for row in reader:
+        yield reader.line_num, row
+
+def _as_dict(record) -> Dict:
+    if isinstance(record, dict):
+        return record
+    try:
+        row = json.loads(record)
+    except ValueError as e:
+        raise ImportRowError(f"Ungültiges JSON: {e}")
+    if not isinstance(row, dict):
+        raise ImportRowError("JSON-Objekt erwartet")
+    return {str(key).strip().lower(): value for key, value in row.items()}
+
+# --- Prüfen ---
+
+def _text(row: Dict, key: str, required: bool = False) -> Optional[str]:
+    value = row.get(key)
+    value = str(value).strip() if value is not None else ""
+    if not value:
+        if required:
+            raise ImportRowError(f"'{key}' fehlt")
+        return None
+    return value
+
+def _number(row: Dict, key: str, cast: Callable, default=None, required: bool = False):
+    value = _text(row, key, required)
+    if value is None:
+        return default
+    try:
+        # Dezimalkomma zulassen ("12,50")
+        number = float(value.replace(",", "."))
+    except ValueError:
+        raise ImportRowError(f"'{key}' ist keine Zahl: {value!r}")
+    if cast is int:
+        if not number.is_integer():
+            raise ImportRowError(f"'{key}' ist keine ganze Zahl: {value!r}")
+        number = int(number)
+    if number < 0:
+        raise ImportRowError(f"'{key}' darf nicht negativ sein")
+    return number
+
+def _date(row: Dict, key: str, required: bool = False) -> Optional[str]:
+    """YYYY-MM-DD oder deutsches Format TT.MM.JJJJ, gespeichert als YYYY-MM-DD"""
+    value = _text(row, key, required)
+    if value is None:
+        return None
+    for pattern in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(value[:10], pattern).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ImportRowError(f"'{key}' ist kein Datum: {value!r}")
+
+def _time(row: Dict, key: str) -> str:
+    value = _text(row, key, required=True)
+    match = _TIME_RE.match(value)
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ImportRowError(f"'{key}' ist keine Uhrzeit (HH:MM): {value!r}")
+    return f"{int(match.group(1)):02d}:{match.group(2)}"
+
+def _email(row: Dict, key: str = "email") -> Optional[str]:
+    value = _text(row, key)
+    if value is None:
+        return None
+    if not _EMAIL_RE.match(value):
+        raise ImportRowError(f"'{key}' ist keine gültige E-Mail-Adresse: {value!r}")
+    return value.lower()
+
+def _chunks(values: List, size: int = IN_CHUNK) -> Iterator[List]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _find_customers(tx: Transaction, emails: Iterable[str], phones: Iterable[str]) -> List[Dict]:
+    """Vorhandene Kunden mit einer der E-Mails (ohne Groß-/Kleinschreibung) oder einer der
+    normalisierten Telefonnummern; beide Abfragen laufen über Ausdrucksindizes"""
+    rows = []
+    for chunk in _chunks(sorted(set(emails))):
+        rows += tx.query(f"SELECT id, email, phone FROM customers WHERE LOWER(email) IN "
+                         f"({', '.join('?' * len(chunk))})", tuple(chunk))
+    for chunk in _chunks(sorted(set(phones))):
+        rows += tx.query(f"SELECT id, email, phone FROM customers WHERE {PHONE_KEY_SQL} IN "
+                         f"({', '.join('?' * len(chunk))})", tuple(chunk))
+    return rows
+
+# --- Importer pro Tabelle ---
+
+class CustomerImporter:
+    """Kunden; Dubletten (gleiche E-Mail oder Telefonnummer, in der Datei oder schon
+    in der Datenbank) werden übersprungen"""
+
+    def validate(self, row: Dict) -> Dict:
+        phone = _text(row, "phone")
+        if phone and len(normalize_phone(phone)) < 5:
+            raise ImportRowError(f"'phone' ist keine Telefonnummer: {phone!r}")
+        return {
+            'first_name': _text(row, "first_name", required=True),
+            'last_name': _text(row, "last_name", required=True),
+            'email': _email(row),
+            'phone': phone,
+            'address': _text(row, "address"),
+            'birthdate': _date(row, "birthdate"),
+            'notes': _text(row, "notes"),
+            'loyalty_points': _number(row, "loyalty_points", int, default=0),
+        }
+
+    def write(self, tx: Transaction, rows: List[Tuple[int, Dict]]) -> Tuple[int, int, List[Tuple[int, str]]]:
+        existing = _find_customers(tx, (c['email'] for _, c in rows if c['email']),
+                                   (normalize_phone(c['phone']) for _, c in rows if c['phone']))
+        seen = {c['email'].lower() for c in existing if c['email']}
+        seen |= {normalize_phone(c['phone']) for c in existing if c['phone']}
+
+        params, duplicates = [], 0
+        for _, c in rows:
+            keys = [k for k in (c['email'], c['phone'] and normalize_phone(c['phone'])) if k]
+            if any(k in seen for k in keys):
+                duplicates += 1
+                continue
+            seen.update(keys)
+            params.append((c['first_name'], c['last_name'], c['email'], c['phone'], c['address'],
+                           c['birthdate'], c['notes'], c['loyalty_points']))
+        tx.executemany("""
+            INSERT INTO customers (first_name, last_name, email, phone, address, birthdate, notes, loyalty_points)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, params)
+        return len(params), duplicates, []
+
+class ProductImporter:
+    """Produkte mit Preis und Lagerbestand"""
+
+    def validate(self, row: Dict) -> Dict:
+        return {
+            'name': _text(row, "name", required=True),
+            'category': _text(row, "category"),
+            'brand': _text(row, "brand"),
+            'price': _number(row, "price", float, required=True),
+            'stock_quantity': _number(row, "stock_quantity", int, default=0),
+            'min_stock_level': _number(row, "min_stock_level", int, default=5),
+            'description': _text(row, "description"),
+        }
+
+    def write(self, tx: Transaction, rows: List[Tuple[int, Dict]]) -> Tuple[int, int, List[Tuple[int, str]]]:
+        tx.executemany("""
+            INSERT INTO products (name, category, brand, price, stock_quantity, min_stock_level, description)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(p['name'], p['category'], p['brand'], p['price'], p['stock_quantity'],
+               p['min_stock_level'], p['description']) for _, p in rows])
+        return len(rows), 0, []
+
+class AppointmentImporter:
+    """Termine (auch historische); Kunde über customer_id, customer_email oder customer_phone,
+    Service über service_id oder service (Name), Mitarbeiter optional über employee_id oder employee
+
+    Verfügbarkeit wird nicht geprüft: importiert wird der Kalender, wie er im alten System war.
+    """
+
+    def __init__(self):
+        services = execute_query("SELECT id, name, duration FROM services")
+        self.service_duration = {s['id']: s['duration'] for s in services}
+        self.service_ids = {s['name'].strip().lower(): s['id'] for s in services}
+        employees = execute_query("SELECT id, first_name, last_name FROM employees")
+        self.employee_ids = {e['id']: e['id'] for e in employees}
+        self.employee_ids.update({f"{e['first_name']} {e['last_name']}".strip().lower(): e['id'] for e in employees})
+
+    def validate(self, row: Dict) -> Dict:
+        service_id = _number(row, "service_id", int)
+        if service_id is None:
+            name = _text(row, "service", required=True)
+            service_id = self.service_ids.get(name.lower())
+            if service_id is None:
+                raise ImportRowError(f"Unbekannter Service: {name!r}")
+        elif service_id not in self.service_duration:
+            raise ImportRowError(f"Unbekannte service_id: {service_id}")
+
+        employee = _number(row, "employee_id", int)
+        if employee is None:
+            employee = _text(row, "employee")
+            employee = employee.lower() if employee else None
+        employee_id = self.employee_ids.get(employee) if employee is not None else None
+        if employee is not None and employee_id is None:
+            raise ImportRowError(f"Unbekannter Mitarbeiter: {employee!r}")
+
+        customer = {
+            'customer_id': _number(row, "customer_id", int),
+            'customer_email': _email(row, "customer_email"),
+            'customer_phone': _text(row, "customer_phone"),
+        }
+        if not any(customer.values()):
+            raise ImportRowError("'customer_id', 'customer_email' oder 'customer_phone' fehlt")
+        return {
+            **customer,
+            'service_id': service_id,
+            'employee_id': employee_id,
+            'appointment_date': _date(row, "appointment_date", required=True),
+            'appointment_time': _time(row, "appointment_time"),
+            'duration': _number(row, "duration", int, default=self.service_duration[service_id]),
+            'status': _text(row, "status") or 'geplant',
+            'notes': _text(row, "notes"),
+            'group_size': _number(row, "group_size", int, default=1),
+        }
+
+    def write(self, tx: Transaction, rows: List[Tuple[int, Dict]]) -> Tuple[int, int, List[Tuple[int, str]]]:
+        ids = sorted({a['customer_id'] for _, a in rows if a['customer_id'] is not None})
+        known_ids = set()
+        for chunk in _chunks(ids):
+            known_ids |= {r['id'] for r in tx.query(
+                f"SELECT id FROM customers WHERE id IN ({', '.join('?' * len(chunk))})", tuple(chunk))}
+        by_key = {}
+        for c in _find_customers(tx, (a['customer_email'] for _, a in rows if a['customer_email']),
+                                 (normalize_phone(a['customer_phone']) for _, a in rows if a['customer_phone'])):
+            for key in (c['email'] and c['email'].lower(), c['phone'] and normalize_phone(c['phone'])):
+                if key:
+                    by_key.setdefault(key, c['id'])
+
+        params, errors = [], []
+        for line, a in rows:
+            if a['customer_id'] is not None:
+                customer_id = a['customer_id'] if a['customer_id'] in known_ids else None
+            else:
+                customer_id = by_key.get(a['customer_email']) or (
+                    a['customer_phone'] and by_key.get(normalize_phone(a['customer_phone'])))
+            if not customer_id:
+                errors.append((line, "Kunde nicht gefunden"))
+                continue
+            params.append((customer_id, a['service_id'], a['employee_id'], a['appointment_date'],
+                           a['appointment_time'], a['duration'], a['status'], a['notes'], a['group_size']))
+        tx.executemany("""
+            INSERT INTO appointments (customer_id, service_id, employee_id, appointment_date,
+                                      appointment_time, duration, status, notes, group_size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, params)
+        return len(params), 0, errors
+
+IMPORTERS = {
+    'customers': CustomerImporter,
+    'products': ProductImporter,
+    'appointments': AppointmentImporter,
+}
+
+# --- Ablauf ---
+
+class ImportReport:
+    """Zähler und Durchsatz eines Imports; Fehlermeldungen nur für die ersten IMPORT_MAX_ERRORS Zeilen"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    def error(self, line: int, message: str):
+        self.invalid += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self) -> Dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            'kind': self.kind,
+            'rows': self.rows,
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'errors': sorted(self.errors, key=lambda e: e['line']),
+            'seconds': round(elapsed, 2),
+            'rows_per_second': round(self.rows / elapsed) if elapsed > 0 else 0,
+        }
+
+def _write_batch(importer, batch: List[Tuple[int, Dict]], report: ImportReport):
+    # immediate: Schreibsperre sofort, da zwischen Dublettenprüfung und Insert kein anderer schreiben soll
+    with transaction(immediate=True) as tx:
+        imported, duplicates, errors = importer.write(tx, batch)
+    report.imported += imported
+    report.duplicates += duplicates
+    for line, message in errors:
+        report.error(line, message)
+
+def import_records(kind: str, stream: TextIO, format: str = "csv", batch_size: int = IMPORT_BATCH_SIZE,
+                   progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Importiert alle Zeilen aus stream und gibt den Bericht zurück
+
+    Jeder Block ist eine eigene Transaktion: bei einem Abbruch bleiben bereits geschriebene
+    Blöcke erhalten, ein erneuter Kundenimport überspringt sie als Dubletten.
+    progress(bericht) wird nach jedem Block aufgerufen.
+    """
+    if kind not in IMPORTERS:
+        raise ValueError(f"Unbekannter Import: {kind} (erlaubt: {', '.join(IMPORTERS)})")
+    if format not in FORMATS:
+        raise ValueError(f"Unbekanntes Format: {format} (erlaubt: {', '.join(FORMATS)})")
+    importer = IMPORTERS[kind]()
+    report = ImportReport(kind)
+    batch = []
+    for line, record in read_records(stream, format):
+        report.rows += 1
+        try:
+            batch.append((line, importer.validate(_as_dict(record))))
+        except ImportRowError as e:
+            report.error(line, str(e))
+        if len(batch) >= batch_size:
+            _write_batch(importer, batch, report)
+            batch = []
+            if progress:
+                progress(report.as_dict())
+    if batch:
+        _write_batch(importer, batch, report)
+    result = report.as_dict()
+    if report.imported:
+        _refresh_caches(kind)
+    if progress:
+        progress(result)
+    return result
+
+def _refresh_caches(kind: str):
+    """Prozesslokale Indizes und Zähler nach dem Import aktualisieren (andere Prozesse holen
+    neue Zeilen über ihre regulären Refreshs nach)"""
+    from dashboard_stats import clear_dashboard_stats
+    from crm_retrieval import refresh_index as refresh_retrieval_index
+    clear_dashboard_stats()
+    if kind == 'customers':
+        from customer_search import refresh_index as refresh_search_index
+        refresh_search_index()
+    refresh_retrieval_index()
+
+def open_input(path: str) -> TextIO:
+    """Öffnet eine Importdatei als Text ('-' = stdin, .gz wird entpackt, BOM von Excel wird entfernt)"""
+    if path == "-":
+        sys.stdin.reconfigure(encoding="utf-8-sig", newline="")
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, "r", encoding="utf-8-sig", newline="")
+
+def guess_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    return "ndjson" if name.endswith((".ndjson", ".jsonl")) else "csv"
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in IMPORTERS:
+        print(f"Verwendung: python bulk_import.py {{{'|'.join(IMPORTERS)}}} DATEI|- [csv|ndjson]")
+        sys.exit(1)
+    kind, path = sys.argv[1], sys.argv[2]
+    format = sys.argv[3] if len(sys.argv) > 3 else guess_format(path)
+
+    def print_progress(report: Dict):
+        print(f"\r{report['rows']:>9} Zeilen  {report['imported']:>9} importiert  "
+              f"{report['duplicates']:>7} Dubletten  {report['invalid']:>7} ungültig  "
+              f"{report['rows_per_second']:>7} Zeilen/s", end="", file=sys.stderr, flush=True)
+
+    from database import init_database
+    init_database()
+    with open_input(path) as stream:
+        result = import_records(kind, stream, format, progress=print_progress)
+    print(file=sys.stderr)
+    for error in result['errors']:
+        print(f"Zeile {error['line']}: {error['error']}", file=sys.stderr)
+    if result['invalid'] > len(result['errors']):
+        print(f"... und {result['invalid'] - len(result['errors'])} weitere ungültige Zeilen", file=sys.stderr)
+    print(json.dumps({k: v for k, v in result.items() if k != 'errors'}, ensure_ascii=False))
@@ -0,0 +1,400 @@
+"""
+Lokale Suche nach relevanten CRM-Datensätzen für den AI Assistant (BM25, offline, CPU)
+Indexiert Kunden, Dienstleistungen, Produkte, Termine, Bewertungen und Tagesumsätze und
+wählt pro Frage die passendsten Datensätze innerhalb eines Token-Budgets für den Prompt aus.
+"""
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from database import execute_query, iter_query
+from customer_search import normalize
+
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "300"))  # geschätzte LLM-Tokens
+RETRIEVAL_REFRESH_SECONDS = float(os.getenv("RETRIEVAL_REFRESH", "10"))
+RETRIEVAL_HISTORY_DAYS = int(os.getenv("RETRIEVAL_HISTORY_DAYS", "90"))  # Termine und Umsätze
+CHARS_PER_TOKEN = 4  # grobe Schätzung für deutschen Text
+MIN_RELATIVE_SCORE = 0.35  # schwächere Treffer (Anteil am besten Score) kommen nicht in den Prompt
+COMPACT_MIN_DEAD = 1000  # gelöschte Dokumente, ab denen (und ab 25 % des Index) kompaktiert wird
+
+# BM25-Parameter
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\d{4}-\d{2}-\d{2}|[\w.+\-]+@[\w.\-]+\w|\w+")
+_SUFFIXES = ("ungen", "ung", "ern", "en", "er", "es", "e", "n", "s")
+_STOPWORDS = frozenset("""
+    der die das den dem des ein eine einen einem einer eines und oder aber ist sind war waren
+    wie viel viele welche welcher welches wer was wann wo hat haben hatte hatten mit von zu zum
+    zur im in am an auf fur uber unter nach vor bei aus es ich wir sie er du ihr mir uns mich
+    bitte gibt gib zeig zeige alle aller nicht noch schon auch nur kann konnen mehr als sich
+    diese dieser dieses unser unsere unseren mein meine kein keine letzte letzten zuletzt
+""".split())
+# Relative Tage in Fragen werden zu Datums-Tokens der Dokumente
+_RELATIVE_DAYS = {"heute": 0, "morgen": 1, "ubermorgen": 2, "gestern": -1, "vorgestern": -2}
+
+def _stem(word: str) -> str:
+    """Sehr einfache Stammform: häufige deutsche Endungen ab 5 Zeichen abschneiden"""
+    if len(word) > 4 and not word.isdigit():
+        for suffix in _SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+                return word[:-len(suffix)]
+    return word
+
+def tokenize(text: str) -> List[str]:
+    """Zerlegt Text in normalisierte Such-Tokens (Datum und E-Mail bleiben ganz)"""
+    tokens = []
+    for raw in _TOKEN_RE.findall((text or "").lower()):
+        if "@" in raw or (len(raw) == 10 and raw[4] == "-"):
+            tokens.append(raw)
+            continue
+        word = normalize(raw)
+        if len(word) < 2 or word in _STOPWORDS:
+            continue
+        tokens.append(_stem(word))
+    return tokens
+
+def _query_tokens(question: str) -> List[str]:
+    today = datetime.now().date()
+    tokens = []
+    for word in (question or "").lower().split():
+        offset = _RELATIVE_DAYS.get(normalize(word.strip("?!.,;:")))
+        if offset is not None:
+            tokens.append((today + timedelta(days=offset)).strftime("%Y-%m-%d"))
+    return tokens + tokenize(question)
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+# --- Dokumente pro Datensatz-Art: (Text, zusätzliche Such-Tokens) ---
+
+def _money(value) -> str:
+    return f"{float(value or 0):.2f} €"
+
+def _customer_doc(row: Dict) -> str:
+    parts = [f"Kunde #{row['id']}: {row['first_name']} {row['last_name']}"]
+    for key in ('email', 'phone'):
+        if row.get(key):
+            parts.append(row[key])
+    parts.append(f"{row.get('loyalty_points') or 0} Treuepunkte")
+    if row.get('visits'):
+        parts.append(f"{row['visits']} Besuche, {_money(row['total_spent'])} Umsatz, letzter Besuch {row['last_visit']}")
+    if row.get('notes'):
+        parts.append(f"Notiz: {row['notes']}")
+    return ", ".join(parts)
+
+def _service_doc(row: Dict) -> str:
+    text = f"Dienstleistung #{row['id']}: {row['name']}"
+    if row.get('category'):
+        text += f" ({row['category']})"
+    text += f", {row.get('duration') or 0} Min, {_money(row['price'])}"
+    if not row.get('active', 1):
+        text += ", inaktiv"
+    if row.get('description'):
+        text += f", {row['description']}"
+    return text
+
+def _product_doc(row: Dict) -> str:
+    details = ", ".join(v for v in (row.get('brand'), row.get('category')) if v)
+    text = f"Produkt #{row['id']}: {row['name']}" + (f" ({details})" if details else "")
+    text += f", {_money(row['price'])}, Bestand {row.get('stock_quantity') or 0} (Mindestbestand {row.get('min_stock_level') or 0})"
+    if (row.get('stock_quantity') or 0) <= (row.get('min_stock_level') or 0):
+        text += ", niedriger Bestand"
+    return text
+
+def _appointment_doc(row: Dict) -> str:
+    text = f"Termin #{row['id']}: {row['appointment_date']} {row['appointment_time']}"
+    if row.get('customer_name'):
+        text += f", {row['customer_name']}"
+    if row.get('service_name'):
+        text += f", {row['service_name']}"
+    if row.get('employee_name'):
+        text += f", bei {row['employee_name']}"
+    text += f", Status {row.get('status') or 'geplant'}"
+    if row.get('notes'):
+        text += f", Notiz: {row['notes']}"
+    return text
+
+def _review_doc(row: Dict) -> str:
+    text = f"Bewertung #{row['id']}: {row['rating']}/5"
+    if row.get('customer_name'):
+        text += f" von {row['customer_name']}"
+    if row.get('created_at'):
+        text += f" am {str(row['created_at'])[:10]}"
+    if row.get('comment'):
+        text += f": {row['comment']}"
+    return text
+
+def _sales_day_doc(row: Dict) -> str:
+    return (f"Umsatz {row['sale_date']}: {int(row['transactions'] or 0)} Verkäufe, "
+            f"{_money(row['revenue'])}, Rabatte {_money(row['discount_total'])}")
+
+# Art -> (Dokument-Text, Such-Tokens, die jedes Dokument der Art zusätzlich bekommt)
+# Kunden bekommen keine Art-Tokens, weil eine Posting-Liste über alle Kunden sehr lang wäre
+_KINDS = {
+    'customer': (_customer_doc, ()),
+    'service': (_service_doc, ("dienstleist", "behandl", "service")),
+    'product': (_product_doc, ("produkt",)),
+    'appointment': (_appointment_doc, ("termin",)),
+    'review': (_review_doc, ("bewert", "feedback")),
+    'sales_day': (_sales_day_doc, ("umsatz", "verkauf")),
+}
+
+_CUSTOMER_SELECT = """
+    SELECT c.id, c.first_name, c.last_name, c.email, c.phone, c.notes, c.loyalty_points,
+           c.updated_at, s.visits, s.total_spent, s.last_visit
+    FROM customers c
+    LEFT JOIN customer_stats s ON s.customer_id = c.id
+"""
+_APPOINTMENT_SELECT = """
+    SELECT a.id, a.appointment_date, a.appointment_time, a.status, a.notes,
+           c.first_name || ' ' || c.last_name as customer_name, s.name as service_name,
+           e.first_name || ' ' || e.last_name as employee_name
+    FROM appointments a
+    LEFT JOIN customers c ON c.id = a.customer_id
+    LEFT JOIN services s ON s.id = a.service_id
+    LEFT JOIN employees e ON e.id = a.employee_id
+"""
+_REVIEW_SELECT = """
+    SELECT r.id, r.rating, r.comment, r.created_at,
+           c.first_name || ' ' || c.last_name as customer_name
+    FROM reviews r
+    LEFT JOIN customers c ON c.id = r.customer_id
+"""
+_SALES_DAY_SELECT = """
+    SELECT sale_date as id, sale_date, SUM(transactions) as transactions,
+           SUM(revenue) as revenue, SUM(discount_total) as discount_total
+    FROM daily_sales_rollup
+"""
+
+class RetrievalIndex:
+    """BM25-Index über CRM-Datensätze
+
+    Posting-Listen enthalten nur Dokumentnummern (Wiederholung = Häufigkeit), Dokumentlängen
+    liegen in einem array; so bleibt auch ein Index über 100k+ Kunden klein. Beim Aktualisieren
+    werden nur Datensätze neu zerlegt, deren Text sich geändert hat.
+
+    Entfernen ist lazy: das Dokument wird nur als gelöscht markiert (Posting-Listen gemeinsamer
+    Tokens wie "treuepunkt" umfassen alle Kunden) und die Suche überspringt es. Sobald gelöschte
+    Dokumente ein Viertel des Index ausmachen, wird in einem Durchgang kompaktiert.
+    """
+
+    def __init__(self):
+        self._docs: List[Optional[Tuple[str, object, str]]] = []  # Nr -> (Art, ID, Text)
+        self._doc_ids: Dict[Tuple[str, object], int] = {}  # (Art, ID) -> Nr
+        self._doc_len = array('I')
+        self._postings: Dict[str, List[int]] = {}
+        self._total_len = 0
+        self._count = 0
+        self._dead = 0  # als gelöscht markierte Dokumente, die noch in Posting-Listen stehen
+        self._lock = threading.RLock()
+        self._last_customer_id = 0
+        self._last_customer_updated = "1970-01-01 00:00:00"
+        self._last_refresh = 0.0
+
+    def __len__(self):
+        return self._count
+
+    # --- Pflege ---
+
+    def _tokens(self, kind: str, text: str) -> List[str]:
+        return tokenize(text) + list(_KINDS[kind][1])
+
+    def upsert(self, kind: str, record_id, text: str):
+        """Fügt einen Datensatz hinzu oder ersetzt ihn (unveränderter Text wird übersprungen)"""
+        key = (kind, record_id)
+        with self._lock:
+            doc = self._doc_ids.get(key)
+            if doc is not None:
+                if self._docs[doc][2] == text:
+                    return
+                self.remove(kind, record_id)
+            tokens = self._tokens(kind, text)
+            doc = len(self._docs)
+            self._docs.append((kind, record_id, text))
+            self._doc_ids[key] = doc
+            self._doc_len.append(len(tokens))
+            self._total_len += len(tokens)
+            self._count += 1
+            for token in tokens:
+                self._postings.setdefault(token, []).append(doc)
+
+    def remove(self, kind: str, record_id):
+        with self._lock:
+            doc = self._doc_ids.pop((kind, record_id), None)
+            if doc is None:
+                return
+            self._total_len -= self._doc_len[doc]
+            self._doc_len[doc] = 0
+            self._docs[doc] = None
+            self._count -= 1
+            self._dead += 1
+            if self._dead >= max(COMPACT_MIN_DEAD, self._count // 4):
+                self._compact()
+
+    def _compact(self):
+        """Nummeriert die lebenden Dokumente neu und entfernt gelöschte aus den Posting-Listen"""
+        mapping = array('i', [-1]) * len(self._docs)
+        docs: List[Optional[Tuple[str, object, str]]] = []
+        doc_len = array('I')
+        for old, entry in enumerate(self._docs):
+            if entry is not None:
+                mapping[old] = len(docs)
+                docs.append(entry)
+                doc_len.append(self._doc_len[old])
+        for token in list(self._postings):
+            postings = [mapping[d] for d in self._postings[token] if mapping[d] >= 0]
+            if postings:
+                self._postings[token] = postings
+            else:
+                del self._postings[token]
+        self._docs = docs
+        self._doc_len = doc_len
+        self._doc_ids = {(kind, record_id): doc for doc, (kind, record_id, _) in enumerate(docs)}
+        self._dead = 0
+
+    def _sync(self, kind: str, rows: Iterable[Dict], complete: bool = True) -> int:
+        """Gleicht eine Art mit den Zeilen ab; complete=True entfernt nicht mehr enthaltene Datensätze"""
+        build = _KINDS[kind][0]
+        seen = set()
+        changed = 0
+        for row in rows:
+            seen.add(row['id'])
+            doc = self._doc_ids.get((kind, row['id']))
+            text = build(row)
+            if doc is None or self._docs[doc][2] != text:
+                self.upsert(kind, row['id'], text)
+                changed += 1
+        if complete:
+            for (doc_kind, record_id) in [key for key in self._doc_ids if key[0] == kind]:
+                if record_id not in seen:
+                    self.remove(doc_kind, record_id)
+                    changed += 1
+        return changed
+
+    def _load_customers(self, rows: Iterable[Dict]) -> int:
+        count = 0
+        for row in rows:
+            self.upsert('customer', row['id'], _customer_doc(row))
+            count += 1
+            if row['id'] > self._last_customer_id:
+                self._last_customer_id = row['id']
+            updated = str(row['updated_at'] or "")
+            if updated > self._last_customer_updated:
+                self._last_customer_updated = updated
+        return count
+
+    def refresh(self, force: bool = False) -> int:
+        """Lädt Änderungen nach; gibt die Anzahl neu indexierter oder entfernter Datensätze zurück
+
+        Kunden werden inkrementell über neue IDs und updated_at geladen, die übrigen Arten
+        (klein bzw. auf RETRIEVAL_HISTORY_DAYS begrenzt) komplett abgeglichen.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh < RETRIEVAL_REFRESH_SECONDS:
+            return 0
+        since = (datetime.now() - timedelta(days=RETRIEVAL_HISTORY_DAYS)).strftime("%Y-%m-%d")
+        with self._lock:
+            changed = self._load_customers(iter_query(
+                f"{_CUSTOMER_SELECT} WHERE c.id > ? OR c.updated_at > ?",
+                (self._last_customer_id, self._last_customer_updated)))
+            changed += self._sync('service', execute_query("SELECT * FROM services"))
+            changed += self._sync('product', execute_query("SELECT * FROM products"))
+            changed += self._sync('appointment', iter_query(
+                f"{_APPOINTMENT_SELECT} WHERE a.appointment_date >= ?", (since,)))
+            changed += self._sync('review', iter_query(_REVIEW_SELECT))
+            changed += self._sync('sales_day', execute_query(
+                f"{_SALES_DAY_SELECT} WHERE sale_date >= ? GROUP BY sale_date", (since,)))
+            self._last_refresh = now
+        return changed
+
+    def refresh_record(self, kind: str, record_id: int):
+        """Indexiert einen einzelnen Kunden, Termin, ... sofort neu (nach eigenen Schreibzugriffen)"""
+        select, id_column = {
+            'customer': (_CUSTOMER_SELECT, "c.id"),
+            'service': ("SELECT * FROM services", "id"),
+            'product': ("SELECT * FROM products", "id"),
+            'appointment': (_APPOINTMENT_SELECT, "a.id"),
+            'review': (_REVIEW_SELECT, "r.id"),
+        }[kind]
+        with self._lock:
+            rows = execute_query(f"{select} WHERE {id_column} = ?", (record_id,))
+            if rows:
+                self.upsert(kind, record_id, _KINDS[kind][0](rows[0]))
+            else:
+                self.remove(kind, record_id)
+
+    # --- Suche ---
+
+    def search(self, question: str, top_k: int = RETRIEVAL_TOP_K) -> List[Tuple[float, str, object, str]]:
+        """Gibt die besten Datensätze als (Score, Art, ID, Text) zurück"""
+        terms = Counter(_query_tokens(question))
+        if not terms:
+            return []
+        with self._lock:
+            if not self._count:
+                return []
+            avg_len = self._total_len / self._count
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                frequencies = Counter(postings)
+                if self._dead:
+                    for doc in [d for d in frequencies if self._docs[d] is None]:
+                        del frequencies[doc]
+                    if not frequencies:
+                        continue
+                idf = math.log(1 + (self._count - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+                for doc, tf in frequencies.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[doc] / avg_len)
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            cutoff = best[0][1] * MIN_RELATIVE_SCORE if best else 0.0
+            return [(round(score, 3),) + self._docs[doc] for doc, score in best if score >= cutoff]
+
+_index: Optional[RetrievalIndex] = None
+_index_lock = threading.Lock()
+
+def get_retrieval_index() -> RetrievalIndex:
+    """Gibt den Index dieses Prozesses zurück (beim ersten Aufruf vollständig geladen)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = RetrievalIndex()
+                index.refresh(force=True)
+                _index = index
+    return _index
+
+def retrieve_context(question: str, top_k: int = RETRIEVAL_TOP_K,
+                     token_budget: int = RETRIEVAL_TOKEN_BUDGET) -> List[str]:
+    """Relevanteste Datensätze zur Frage, höchstens top_k und insgesamt etwa token_budget Tokens"""
+    index = get_retrieval_index()
+    index.refresh()
+    lines, used = [], 0
+    for _, _, _, text in index.search(question, top_k):
+        cost = estimate_tokens(text)
+        if used + cost > token_budget:
+            continue
+        lines.append(text)
+        used += cost
+    return lines
+
+def refresh_record(kind: str, record_id: int):
+    """Nach eigenen Schreibzugriffen aufrufen, damit der Assistant Änderungen sofort kennt"""
+    if _index is not None:
+        _index.refresh_record(kind, record_id)
+
+def refresh_index():
+    """Nach Massenänderungen (Import) aufrufen: gleicht den Index sofort mit der Datenbank ab"""
+    if _index is not None:
+        _index.refresh(force=True)
@@ -0,0 +1,369 @@
+"""
+Unscharfe Kundensuche für Kasse, Buchung und Marketing
+Hält pro Prozess einen Index im Speicher: Präfixsuche über sortierte Tokens
+(Name, E-Mail, normalisierte Telefonnummer) und Trigramm-Ähnlichkeit für Tippfehler in Namen.
+Der Index wird inkrementell über neue IDs und updated_at nachgeladen und regelmäßig
+mit den vorhandenen IDs abgeglichen, damit gelöschte Kunden verschwinden.
+"""
+import os
+import re
+import sys
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from database import execute_query, iter_query
+
+# Wie oft (Sekunden) eine Suche Änderungen anderer Prozesse nachlädt
+SEARCH_REFRESH_SECONDS = float(os.getenv("CUSTOMER_SEARCH_REFRESH", "2"))
+# Wie oft (Sekunden) der Index gegen alle Kunden-IDs geprüft wird (Löschungen anderer Prozesse)
+SEARCH_RECONCILE_SECONDS = float(os.getenv("CUSTOMER_SEARCH_RECONCILE", "60"))
+DEFAULT_LIMIT = 10
+MIN_SIMILARITY = 0.5  # Dice-Koeffizient der Trigramme für unscharfe Treffer
+FUZZY_BELOW = 50  # Unscharfe Suche nur, wenn ein Begriff weniger Präfixtreffer hat
+# Sekunden nach dem ersten Sehen eines updated_at-Werts, bis in dieser Sekunde keine Änderung mehr kommt
+UPDATED_AT_SETTLE = 1.5
+
+_SPLIT_RE = re.compile(r"[\s\-]+")
+_PHONE_QUERY_RE = re.compile(r"[\d\s+\-/().]+")
+_UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+
+def normalize(text: str) -> str:
+    """Kleinschreibung ohne Akzente ('Müller' -> 'muller', 'ß' -> 'ss')"""
+    text = text.lower()
+    if text.isascii():
+        return text
+    text = text.replace("ß", "ss")
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+def normalize_phone(phone: str) -> str:
+    """Nur Ziffern, internationale Vorwahl +49/0049 als führende 0"""
+    digits = re.sub(r"\D", "", phone)
+    if phone.strip().startswith("+49"):
+        digits = "0" + digits[2:]
+    elif digits.startswith("0049"):
+        digits = "0" + digits[4:]
+    return digits
+
+def _phone_digits_sql(column: str) -> str:
+    for char in (" ", "-", "/", "(", ")", "."):
+        column = f"REPLACE({column}, '{char}', '')"
+    return column
+
+_PHONE_DIGITS_SQL = _phone_digits_sql("phone")
+# SQL-Gegenstück zu normalize_phone() für die Spalte customers.phone (SQLite und PostgreSQL),
+# damit Telefonnummern per Ausdrucksindex abgeglichen werden können (z.B. beim Import)
+PHONE_KEY_SQL = (
+    f"(CASE WHEN SUBSTR({_PHONE_DIGITS_SQL}, 1, 3) = '+49' THEN '0' || SUBSTR({_PHONE_DIGITS_SQL}, 4)"
+    f" WHEN SUBSTR({_PHONE_DIGITS_SQL}, 1, 4) = '0049' THEN '0' || SUBSTR({_PHONE_DIGITS_SQL}, 5)"
+    f" ELSE REPLACE({_PHONE_DIGITS_SQL}, '+', '') END)"
+)
+
+@lru_cache(maxsize=65536)
+def name_tokens(text: Optional[str]) -> frozenset:
+    """Wörter eines Namens; Umlaute zusätzlich als ae/oe/ue, damit 'mueller' 'Müller' findet"""
+    tokens = set()
+    for word in _SPLIT_RE.split((text or "").lower()):
+        if word:
+            tokens.add(sys.intern(normalize(word)))
+            tokens.add(sys.intern(normalize(word.translate(_UMLAUTS))))
+    return frozenset(tokens)
+
+def _trigrams(token: str) -> Set[str]:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+def _query_terms(q: str) -> List[str]:
+    """Zerlegt die Eingabe in Suchbegriffe; reine Telefonnummern bleiben ein Begriff"""
+    if _PHONE_QUERY_RE.fullmatch(q.strip()) and sum(c.isdigit() for c in q) >= 3:
+        return [normalize_phone(q)]
+    return [word if "@" in word else normalize(word.translate(_UMLAUTS)) for word in q.lower().split()]
+
+class CustomerSearchIndex:
+    """Sortierte (Token, Kunden-ID)-Paare für Präfixsuche plus Trigramme über Namens-Tokens
+
+    Die Paare liegen in zwei parallelen Listen statt in Sets pro Token, damit auch
+    100k+ Kunden mit eindeutigen E-Mails und Telefonnummern wenig Speicher brauchen.
+    """
+
+    def __init__(self):
+        self._customers: Dict[int, Tuple] = {}  # id -> (Vorname, Nachname, E-Mail, Telefon)
+        self._keys: List[str] = []
+        self._ids: List[int] = []
+        self._pending: List[Tuple[str, int]] = []  # noch nicht einsortierte Paare
+        self._trigrams: Dict[str, Set[str]] = {}  # Trigramm -> Namens-Tokens
+        self._name_tokens: Set[str] = set()  # bereits in _trigrams erfasste Tokens
+        self._lock = threading.RLock()
+        self._last_id = 0
+        self._last_updated = "1970-01-01 00:00:00"
+        self._updated_seen = 0.0  # monotone Zeit, zu der _last_updated zuletzt gestiegen ist
+        self._updated_settled = True  # Sekunde von _last_updated abgeschlossen: '>' statt '>='
+        self._last_refresh = 0.0
+        self._last_reconcile = 0.0
+
+    def __len__(self):
+        return len(self._customers)
+
+    # --- Pflege ---
+
+    @staticmethod
+    def _tokens(first_name, last_name, email, phone) -> Tuple[frozenset, Set[str]]:
+        """Namens-Tokens und alle Such-Tokens eines Kunden"""
+        names = name_tokens(first_name) | name_tokens(last_name)
+        tokens = set(names)
+        email = (email or "").strip().lower()
+        if email:
+            tokens.add(email)
+        phone = normalize_phone(phone or "")
+        if phone:
+            tokens.add(phone)
+        return names, tokens
+
+    def upsert(self, customer: Dict):
+        """Fügt einen Kunden hinzu oder ersetzt seine Tokens"""
+        customer_id = customer['id']
+        fields = (customer.get('first_name'), customer.get('last_name'),
+                  customer.get('email'), customer.get('phone'))
+        names, tokens = self._tokens(*fields)
+
+        with self._lock:
+            old = self._customers.get(customer_id)
+            # Alte Tokens werden aus den gespeicherten Feldern neu berechnet statt gespeichert
+            old_tokens = self._tokens(*old)[1] if old else set()
+            if old_tokens - tokens:
+                self._flush()
+                for token in old_tokens - tokens:
+                    self._remove_pair(token, customer_id)
+            for token in tokens - old_tokens:
+                self._pending.append((token, customer_id))
+            for token in names - self._name_tokens:
+                self._name_tokens.add(token)
+                for gram in _trigrams(token):
+                    self._trigrams.setdefault(gram, set()).add(token)
+            self._customers[customer_id] = fields
+
+    def remove(self, customer_id: int):
+        """Entfernt einen Kunden aus dem Index (Trigramme bleiben, sie verweisen nur auf Tokens)"""
+        with self._lock:
+            old = self._customers.pop(customer_id, None)
+            if old:
+                self._flush()
+                for token in self._tokens(*old)[1]:
+                    self._remove_pair(token, customer_id)
+
+    def remove_many(self, customer_ids: Iterable[int]) -> int:
+        """Entfernt mehrere Kunden; bei vielen wird die Paarliste einmal gefiltert statt je Paar gelöscht"""
+        with self._lock:
+            removed = {cid for cid in customer_ids if cid in self._customers}
+            if len(removed) < 64:
+                for customer_id in removed:
+                    self.remove(customer_id)
+                return len(removed)
+            for customer_id in removed:
+                del self._customers[customer_id]
+            self._flush()
+            pairs = [(token, cid) for token, cid in zip(self._keys, self._ids) if cid not in removed]
+            self._keys = [token for token, _ in pairs]
+            self._ids = [cid for _, cid in pairs]
+            return len(removed)
+
+    def _remove_pair(self, token: str, customer_id: int):
+        lo = bisect_left(self._keys, token)
+        hi = bisect_right(self._keys, token, lo)
+        for idx in range(lo, hi):
+            if self._ids[idx] == customer_id:
+                del self._keys[idx]
+                del self._ids[idx]
+                return
+
+    def _flush(self):
+        """Sortiert neue Paare ein (einzeln bei wenigen, sonst komplett neu)"""
+        if not self._pending:
+            return
+        if len(self._pending) < 64:
+            for token, customer_id in self._pending:
+                idx = bisect_right(self._keys, token)
+                self._keys.insert(idx, token)
+                self._ids.insert(idx, customer_id)
+        else:
+            pairs = sorted(list(zip(self._keys, self._ids)) + self._pending)
+            self._keys = [token for token, _ in pairs]
+            self._ids = [customer_id for _, customer_id in pairs]
+        self._pending = []
+
+    def _load(self, rows: Iterable[Dict]) -> int:
+        count = 0
+        for row in rows:
+            count += 1
+            self.upsert(row)
+            if row['id'] > self._last_id:
+                self._last_id = row['id']
+            updated = str(row['updated_at'] or "")
+            if updated > self._last_updated:
+                self._last_updated = updated
+                self._updated_seen = time.monotonic()
+                self._updated_settled = False
+        return count
+
+    def refresh(self, force: bool = False) -> int:
+        """Lädt neue und geänderte Kunden nach; gibt die Anzahl geladener Zeilen zurück
+
+        updated_at hat nur Sekundenauflösung: Zeilen mit genau dem letzten bekannten Wert
+        werden erneut gelesen (>=), damit spätere Änderungen in derselben Sekunde nicht fehlen;
+        _load() überschreibt sie per ID. Erst wenn ein solcher Durchlauf UPDATED_AT_SETTLE
+        Sekunden nach dem Wert begann, ist die Sekunde abgeschlossen und es reicht wieder '>'
+        (sonst läse nach einem Massenimport jede Suche dessen letzte Sekunde erneut).
+        Gelöschte Kunden entfernt höchstens alle SEARCH_RECONCILE_SECONDS ein Abgleich der IDs.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh < SEARCH_REFRESH_SECONDS:
+            return 0
+        with self._lock:
+            if not self._customers:
+                # Vollständiger Aufbau ist bereits abgeglichen
+                self._last_reconcile = now
+            # Zeilenweise lesen, damit der erste Aufbau nicht alle Kunden doppelt im Speicher hält
+            settled = self._updated_settled
+            count = self._load(iter_query(f"""
+                SELECT id, first_name, last_name, email, phone, updated_at
+                FROM customers
+                WHERE id > ? OR updated_at {'>' if settled else '>='} ?
+            """, (self._last_id, self._last_updated)))
+            # Nur wenn der Wert währenddessen nicht gestiegen ist (_updated_seen liegt dann vor now)
+            if not settled and now - self._updated_seen >= UPDATED_AT_SETTLE:
+                self._updated_settled = True
+            self._flush()
+            self._last_refresh = now
+        if now - self._last_reconcile >= SEARCH_RECONCILE_SECONDS:
+            self._last_reconcile = now
+            self.reconcile()
+        return count
+
+    def reconcile(self) -> int:
+        """Entfernt Kunden, die nicht mehr in der Datenbank stehen; gibt ihre Anzahl zurück
+
+        Die IDs werden ohne Sperre gelesen, damit Suchen nicht warten. Entfernt werden nur
+        Kunden, die schon vor der Abfrage im Index waren: IDs werden nicht wiederverwendet,
+        fehlt eine davon im Ergebnis, wurde der Kunde gelöscht.
+        """
+        with self._lock:
+            known = set(self._customers)
+        if not known:
+            return 0
+        # Schneller Vorabtest über den Primärschlüssel: gleich viele Zeilen bis zur höchsten
+        # bekannten ID heißt, es fehlt keine; nur sonst alle IDs lesen
+        rows = execute_query("SELECT COUNT(*) as n FROM customers WHERE id <= ?", (max(known),))
+        if rows and rows[0]['n'] == len(known):
+            return 0
+        existing = {row['id'] for row in iter_query("SELECT id FROM customers")}
+        return self.remove_many(known - existing)
+
+    def refresh_customer(self, customer_id: int):
+        """Lädt einen einzelnen Kunden neu (nach Anlegen oder Bearbeiten)"""
+        with self._lock:
+            rows = execute_query("""
+                SELECT id, first_name, last_name, email, phone, updated_at
+                FROM customers WHERE id = ?
+            """, (customer_id,))
+            if rows:
+                self._load(rows)
+            else:
+                self.remove(customer_id)
+
+    # --- Suche ---
+
+    def _token_ids(self, token: str) -> List[int]:
+        lo = bisect_left(self._keys, token)
+        return self._ids[lo:bisect_right(self._keys, token, lo)]
+
+    def _term_scores(self, term: str) -> Dict[int, float]:
+        """Bester Score pro Kunde für einen Suchbegriff"""
+        scores: Dict[int, float] = {}
+
+        # Präfixtreffer: exakt 1.0, sonst 0.6-1.0 je nach Anteil des Begriffs am Token
+        keys, ids = self._keys, self._ids
+        idx = bisect_left(keys, term)
+        while idx < len(keys) and keys[idx].startswith(term):
+            token = keys[idx]
+            score = 1.0 if token == term else 0.6 + 0.4 * len(term) / len(token)
+            if score > scores.get(ids[idx], 0.0):
+                scores[ids[idx]] = score
+            idx += 1
+
+        # Unscharfe Treffer in Namen (Tippfehler) über Trigramme, nur bei wenigen Präfixtreffern
+        grams = _trigrams(term) if len(term) >= 4 and len(scores) < FUZZY_BELOW else None
+        if grams:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._trigrams.get(gram, ()))
+            for token, count in shared.items():
+                dice = 2 * count / (len(grams) + max(len(token) - 2, 1))
+                if dice < MIN_SIMILARITY or token.startswith(term):
+                    continue
+                score = 0.5 * dice
+                for customer_id in self._token_ids(token):
+                    if score > scores.get(customer_id, 0.0):
+                        scores[customer_id] = score
+        return scores
+
+    def search(self, q: str, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+        """Gibt die besten Treffer (alle Begriffe müssen passen) mit Score zurück"""
+        terms = _query_terms(q or "")
+        if not terms:
+            return []
+        with self._lock:
+            self._flush()
+            total: Optional[Dict[int, float]] = None
+            # Seltene Begriffe zuerst, damit die Schnittmenge schnell klein wird
+            for scores in sorted((self._term_scores(term) for term in terms), key=len):
+                if total is None:
+                    total = scores
+                else:
+                    total = {cid: s + scores[cid] for cid, s in total.items() if cid in scores}
+                if not total:
+                    return []
+
+            customers = self._customers
+            ranked = heapq.nsmallest(limit, total.items(), key=lambda item: (
+                -item[1], customers[item[0]][1] or "", customers[item[0]][0] or "", item[0]))
+            return [{
+                'id': cid,
+                'first_name': customers[cid][0],
+                'last_name': customers[cid][1],
+                'email': customers[cid][2],
+                'phone': customers[cid][3],
+                'score': round(score, 3),
+            } for cid, score in ranked]
+
+_index: Optional[CustomerSearchIndex] = None
+_index_lock = threading.Lock()
+
+def get_search_index() -> CustomerSearchIndex:
+    """Gibt den Suchindex dieses Prozesses zurück (beim ersten Aufruf vollständig geladen)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = CustomerSearchIndex()
+                index.refresh(force=True)
+                _index = index
+    return _index
+
+def search_customers(q: str, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+    """Sucht Kunden nach Name, E-Mail oder Telefon (unscharf, nach Relevanz sortiert)"""
+    index = get_search_index()
+    index.refresh()
+    return index.search(q, limit)
+
+def refresh_customer(customer_id: int):
+    """Nach eigenen Schreibzugriffen aufrufen, damit Änderungen sofort gefunden werden"""
+    if _index is not None:
+        _index.refresh_customer(customer_id)
+
+def refresh_index():
+    """Nach Massenänderungen (Import) aufrufen: lädt neue und geänderte Kunden sofort nach"""
+    if _index is not None:
+        _index.refresh(force=True)
@@ -0,0 +1,100 @@
+"""
+Kundenlisten mit Keyset-Pagination, serverseitigem Filter und Streaming-Export
+Seiten werden über einen Cursor (letzter Name, Vorname, ID) statt OFFSET geblättert,
+damit jede Seite unabhängig von der Tabellengröße gleich schnell ist.
+"""
+import base64
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+from database import execute_query, iter_query
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Spalten für Listen und Auswahlfelder (ohne Adresse und Notizen)
+LIST_COLUMNS = "id, first_name, last_name, email, phone, birthdate, loyalty_points, created_at"
+SEARCH_COLUMNS = ("first_name", "last_name", "email", "phone")
+
+def encode_cursor(row: Dict) -> str:
+    """Erzeugt den Cursor für die Seite nach dieser Zeile"""
+    key = [row['last_name'], row['first_name'], row['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str, int]:
+    """Liest einen Cursor; wirft ValueError bei ungültigem Wert"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_name, first_name, customer_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(last_name), str(first_name), int(customer_id)
+    except Exception as e:
+        raise ValueError(f"Ungültiger Cursor: {cursor}") from e
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _filter_sql(q: Optional[str] = None, min_points: Optional[int] = None,
+                after: Optional[str] = None) -> Tuple[str, list]:
+    """Baut WHERE-Klausel und Parameter für Filter und Cursor"""
+    conditions, params = [], []
+
+    # Jeder Suchbegriff muss in einer der Spalten vorkommen
+    for term in (q or "").lower().split():
+        pattern = f"%{_escape_like(term)}%"
+        conditions.append("(" + " OR ".join(
+            f"LOWER(COALESCE({col}, '')) LIKE ? ESCAPE '\\'" for col in SEARCH_COLUMNS) + ")")
+        params.extend([pattern] * len(SEARCH_COLUMNS))
+
+    if min_points is not None:
+        conditions.append("loyalty_points >= ?")
+        params.append(min_points)
+
+    if after:
+        conditions.append("(last_name, first_name, id) > (?, ?, ?)")
+        params.extend(decode_cursor(after))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+# Entspricht dem Index idx_customers_name_id (Vor- und Nachname sind NOT NULL)
+_ORDER_BY = "ORDER BY last_name, first_name, id"
+
+def list_customers(limit: int = DEFAULT_PAGE_SIZE, after: Optional[str] = None,
+                   q: Optional[str] = None, min_points: Optional[int] = None,
+                   columns: str = LIST_COLUMNS) -> Tuple[List[Dict], Optional[str]]:
+    """Gibt eine Seite Kunden und den Cursor der nächsten Seite zurück (None = letzte Seite)"""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    where, params = _filter_sql(q, min_points, after)
+
+    # Eine Zeile mehr laden, um zu erkennen ob es eine weitere Seite gibt
+    rows = execute_query(f"""
+        SELECT {columns} FROM customers
+        {where}
+        {_ORDER_BY}
+        LIMIT ?
+    """, tuple(params) + (limit + 1,))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
+
+def iter_customers(q: Optional[str] = None, min_points: Optional[int] = None,
+                   columns: str = "*") -> Iterator[Dict]:
+    """Liefert alle passenden Kunden zeilenweise (konstanter Speicher, für Exporte)"""
+    where, params = _filter_sql(q, min_points)
+    return iter_query(f"SELECT {columns} FROM customers {where} {_ORDER_BY}", tuple(params))
+
+def stream_json(rows: Iterator[Dict], ndjson: bool = False) -> Iterator[str]:
+    """Serialisiert Zeilen stückweise als JSON-Array oder NDJSON"""
+    if ndjson:
+        for row in rows:
+            yield json.dumps(row, default=str, ensure_ascii=False) + "\n"
+        return
+
+    yield "["
+    first = True
+    for row in rows:
+        yield ("" if first else ",") + json.dumps(row, default=str, ensure_ascii=False)
+        first = False
+    yield "]"
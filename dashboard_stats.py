@@ -0,0 +1,65 @@
+"""
+Gemeinsame Dashboard-Kennzahlen für Home, API und AI-Assistant
+Alle Zähler kommen aus einer einzigen Abfrage und werden wenige Sekunden gecacht,
+damit Streamlit-Reruns und Chat-Nachrichten nicht jedes Mal die Datenbank abfragen.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict
+from database import execute_query
+
+DASHBOARD_STATS_TTL = float(os.getenv("DASHBOARD_STATS_TTL", "5"))  # Sekunden
+LOW_STOCK_LIMIT = 5
+
+_cache = {'key': None, 'expires': 0.0, 'stats': None}
+_cache_lock = threading.Lock()
+
+def _load_stats(today: str) -> Dict:
+    counters = execute_query("""
+        SELECT
+            (SELECT COUNT(*) FROM customers) as customers,
+            (SELECT COUNT(*) FROM services) as services,
+            (SELECT COUNT(*) FROM employees) as employees,
+            (SELECT COUNT(*) FROM appointments) as appointments_total,
+            (SELECT COUNT(*) FROM appointments
+             WHERE appointment_date = ? AND status != 'abgesagt') as appointments_today,
+            (SELECT COUNT(*) FROM appointments
+             WHERE appointment_date = ? AND status = 'geplant') as open_appointments_today,
+            (SELECT COALESCE(SUM(transactions), 0) FROM daily_sales_rollup
+             WHERE sale_date = ?) as sales_count_today,
+            (SELECT COALESCE(SUM(revenue), 0) FROM daily_sales_rollup
+             WHERE sale_date = ?) as sales_total_today
+    """, (today, today, today, today))[0]
+
+    stats = {key: int(value or 0) for key, value in counters.items() if key != 'sales_total_today'}
+    stats['sales_total_today'] = float(counters['sales_total_today'] or 0)
+    stats['low_stock_products'] = [row['name'] for row in execute_query("""
+        SELECT name FROM products
+        WHERE stock_quantity <= min_stock_level
+        ORDER BY stock_quantity
+        LIMIT ?
+    """, (LOW_STOCK_LIMIT,))]
+    stats['date'] = today
+    return stats
+
+def get_dashboard_stats(max_age: float = None) -> Dict:
+    """Gibt alle Dashboard-Zähler zurück (höchstens max_age bzw. DASHBOARD_STATS_TTL Sekunden alt)"""
+    ttl = DASHBOARD_STATS_TTL if max_age is None else max_age
+    today = datetime.now().strftime("%Y-%m-%d")
+    now = time.monotonic()
+
+    with _cache_lock:
+        if _cache['key'] == today and _cache['expires'] > now:
+            return dict(_cache['stats'])
+
+    stats = _load_stats(today)
+    with _cache_lock:
+        _cache.update(key=today, expires=now + ttl, stats=stats)
+    return dict(stats)
+
+def clear_dashboard_stats():
+    """Verwirft die gecachten Zähler (z.B. nach Importen)"""
+    with _cache_lock:
+        _cache.update(key=None, expires=0.0, stats=None)
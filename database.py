@@ -3,9 +3,15 @@ Datenbankfunktionen für das CRM-System
 Unterstützt sowohl SQLite (lokal) als auch PostgreSQL (Cloud)
 """
 import os
-import pandas as pd
+import re
+import sys
+import time
+import threading
+from bisect import bisect_left
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Union
+from typing import Callable, List, Dict, Iterator, Optional, Union
 from dotenv import load_dotenv
 
 # Lade Environment-Variablen
@@ -16,6 +22,26 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 DB_TYPE = os.getenv("DB_TYPE", "sqlite")  # "sqlite" oder "postgresql"
 DB_PATH = os.getenv("DB_PATH", "salon_crm.db")
 
+# Connection-Pool Einstellungen
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Sekunden Wartezeit auf freie Verbindung
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))  # Sekunden bis Leerlauf-Verbindungen ersetzt werden
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))  # Sekunden Leerlauf bis zum Health-Check
+
+# Lese-Cache für selten geänderte Stammdaten
+DB_CACHE_TABLES = tuple(t.strip() for t in os.getenv("DB_CACHE_TABLES", "services,employees,products").split(",") if t.strip())
+DB_CACHE_TTL = float(os.getenv("DB_CACHE_TTL", "60"))  # Sekunden; begrenzt Veraltung bei Schreibzugriffen anderer Prozesse
+DB_CACHE_MAX_ENTRIES = int(os.getenv("DB_CACHE_MAX_ENTRIES", "256"))
+
+# Abfrage-Metriken und Slow-Query-Log
+DB_METRICS = os.getenv("DB_METRICS", "true").lower() == "true"
+DB_METRICS_MAX_STATEMENTS = int(os.getenv("DB_METRICS_MAX_STATEMENTS", "500"))  # verschiedene Fingerprints
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))  # ab dieser Dauer ins Slow-Query-Log (0 = aus)
+DB_SLOW_QUERY_LOG_SIZE = int(os.getenv("DB_SLOW_QUERY_LOG_SIZE", "100"))  # gemerkte langsame Abfragen
+DB_SLOW_QUERY_EXPLAIN = os.getenv("DB_SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+DB_SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("DB_SLOW_QUERY_EXPLAIN_INTERVAL", "60"))  # Sekunden pro Fingerprint
+
 # Prüfe ob PostgreSQL verwendet werden soll
 USE_POSTGRESQL = DB_TYPE == "postgresql" and DATABASE_URL is not None
 
@@ -23,7 +49,6 @@ if USE_POSTGRESQL:
     try:
         import psycopg2
         from psycopg2.extras import RealDictCursor
-        from psycopg2.pool import SimpleConnectionPool
         POSTGRESQL_AVAILABLE = True
     except ImportError:
         POSTGRESQL_AVAILABLE = False
@@ -33,15 +58,199 @@ else:
     POSTGRESQL_AVAILABLE = False
 
 def get_connection():
-    """Gibt eine Datenbankverbindung zurück (SQLite oder PostgreSQL)"""
+    """Gibt eine neue, ungepoolte Datenbankverbindung zurück (SQLite oder PostgreSQL)"""
     if USE_POSTGRESQL and POSTGRESQL_AVAILABLE:
         import psycopg2
         return psycopg2.connect(DATABASE_URL)
     else:
-        conn = sqlite3.connect(DB_PATH)
+        # check_same_thread=False: Verbindungen aus dem Pool wandern zwischen Threads,
+        # der Pool stellt sicher, dass jede Verbindung nur exklusiv benutzt wird
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
         conn.row_factory = sqlite3.Row
         return conn
 
+class ConnectionPool:
+    """Thread-sicherer Connection-Pool für SQLite und PostgreSQL
+    
+    Verbindungen werden beim Auschecken geprüft (Health-Check nach längerem Leerlauf)
+    und nach DB_POOL_MAX_IDLE Sekunden ohne Benutzung geschlossen.
+    """
+    
+    def __init__(self, min_size: int = DB_POOL_MIN_SIZE, max_size: int = DB_POOL_MAX_SIZE,
+                 timeout: float = DB_POOL_TIMEOUT, max_idle: float = DB_POOL_MAX_IDLE,
+                 ping_after: float = DB_POOL_PING_AFTER):
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self._idle = []  # Stapel aus (Verbindung, Zeitpunkt der letzten Rückgabe)
+        self._size = 0  # Offene Verbindungen (frei + ausgecheckt)
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        
+        for _ in range(self.min_size):
+            self._idle.append((get_connection(), time.monotonic()))
+            self._size += 1
+    
+    def acquire(self):
+        """Checkt eine Verbindung aus dem Pool aus (wartet höchstens `timeout` Sekunden)"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection-Pool ist geschlossen")
+                
+                conn = None
+                idle_since = None
+                if self._idle:
+                    # LIFO: die zuletzt benutzte Verbindung ist am ehesten noch gesund
+                    conn, idle_since = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"Keine freie Datenbankverbindung nach {self.timeout}s (max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+                    continue
+            
+            # Verbindungsaufbau und Health-Check außerhalb des Locks
+            if conn is None:
+                try:
+                    return get_connection()
+                except Exception:
+                    self._discard_slot()
+                    raise
+            
+            idle_for = time.monotonic() - idle_since
+            if idle_for > self.max_idle or not self._is_healthy(conn, ping=idle_for > self.ping_after):
+                self._close_quietly(conn)
+                self._discard_slot()
+                continue
+            return conn
+    
+    def release(self, conn, discard: bool = False):
+        """Gibt eine Verbindung an den Pool zurück"""
+        if not discard:
+            try:
+                # Offene Transaktionen nie an den nächsten Benutzer weitergeben
+                conn.rollback()
+            except Exception:
+                discard = True
+        
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._prune_idle()
+                conn = None
+            self._cond.notify()
+        
+        if conn is not None:
+            self._close_quietly(conn)
+    
+    @contextmanager
+    def connection(self):
+        """Context-Manager: checkt eine Verbindung aus und gibt sie danach zurück"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            # release() verwirft die Verbindung, falls das Rollback fehlschlägt
+            self.release(conn)
+    
+    def close(self):
+        """Schließt alle freien Verbindungen; ausgecheckte werden bei Rückgabe geschlossen"""
+        with self._cond:
+            self._closed = True
+            idle = self._idle
+            self._idle = []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+    
+    def stats(self) -> Dict:
+        """Gibt den aktuellen Zustand des Pools zurück"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            }
+    
+    def _prune_idle(self):
+        """Schließt Leerlauf-Verbindungen über min_size, die älter als max_idle sind (Lock gehalten)"""
+        now = time.monotonic()
+        while len(self._idle) > self.min_size and now - self._idle[0][1] > self.max_idle:
+            stale, _ = self._idle.pop(0)
+            self._size -= 1
+            self._close_quietly(stale)
+    
+    def _discard_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+    
+    @staticmethod
+    def _is_healthy(conn, ping: bool) -> bool:
+        if USE_POSTGRESQL and POSTGRESQL_AVAILABLE:
+            if conn.closed:
+                return False
+        if not ping:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+    
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Gibt den prozessweiten Connection-Pool zurück (wird bei Bedarf angelegt)"""
+    global _pool, _pool_pid
+    # Nach einem fork() dürfen Verbindungen des Elternprozesses nicht weiterbenutzt werden
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool()
+                _pool_pid = os.getpid()
+    return _pool
+
+def close_pool():
+    """Schließt den Connection-Pool (z.B. beim Herunterfahren)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+@contextmanager
+def pooled_connection():
+    """Context-Manager für eine Verbindung aus dem Connection-Pool"""
+    with get_pool().connection() as conn:
+        yield conn
+
 def get_cursor(conn):
     """Gibt einen Cursor zurück, der Dictionaries zurückgibt"""
     if USE_POSTGRESQL and POSTGRESQL_AVAILABLE:
@@ -64,7 +273,15 @@ def adapt_sql_for_db(sql: str) -> str:
     return sql
 
 def init_database():
-    """Initialisiert die Datenbank mit allen notwendigen Tabellen"""
+    """Initialisiert die Datenbank mit allen notwendigen Tabellen
+    
+    Ist das Schema schon auf dem neuesten Stand, bleibt es bei einer einzigen Abfrage
+    (wichtig für Kaltstarts auf Vercel, wo jede neue Instanz initialisiert).
+    """
+    from migrations import is_schema_current
+    if is_schema_current():
+        return
+    
     conn = get_connection()
     cursor = get_cursor(conn)
     
@@ -415,37 +632,16 @@ def init_database():
             )
         """)
     
-    # Füge neue Spalten hinzu falls sie nicht existieren (nur für SQLite)
-    if not USE_POSTGRESQL:
-        try:
-            cursor.execute("PRAGMA table_info(appointments)")
-            columns = [col[1] for col in cursor.fetchall()]
-            
-            if 'employee_id' not in columns:
-                cursor.execute("ALTER TABLE appointments ADD COLUMN employee_id INTEGER")
-            
-            if 'is_recurring' not in columns:
-                cursor.execute("ALTER TABLE appointments ADD COLUMN is_recurring INTEGER DEFAULT 0")
-            
-            if 'recurring_pattern' not in columns:
-                cursor.execute("ALTER TABLE appointments ADD COLUMN recurring_pattern TEXT")
-            
-            if 'parent_appointment_id' not in columns:
-                cursor.execute("ALTER TABLE appointments ADD COLUMN parent_appointment_id INTEGER")
-            
-            if 'group_size' not in columns:
-                cursor.execute("ALTER TABLE appointments ADD COLUMN group_size INTEGER DEFAULT 1")
-            
-            if 'reminder_sent' not in columns:
-                cursor.execute("ALTER TABLE appointments ADD COLUMN reminder_sent INTEGER DEFAULT 0")
-        except:
-            pass  # Spalten existieren bereits
-    
     conn.commit()
     conn.close()
     
+    # Ausstehende Schema-Migrationen (neue Spalten, Indizes) anwenden
+    from migrations import run_migrations
+    run_migrations()
+    
     # Initialdaten einfügen
     insert_initial_data()
+    query_cache.clear()
 
 def insert_initial_data():
     """Fügt initiale Beispieldaten ein"""
@@ -525,56 +721,432 @@ def insert_initial_data():
     conn.commit()
     conn.close()
 
-def execute_query(query: str, params: tuple = None) -> List[Dict]:
-    """Führt eine SQL-Abfrage aus und gibt Ergebnisse als Liste von Dictionaries zurück"""
-    conn = get_connection()
-    cursor = get_cursor(conn)
+_READ_TABLES_RE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+_WRITE_TABLE_RE = re.compile(
+    r"^\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+([A-Za-z_][A-Za-z0-9_]*)",
+    re.IGNORECASE
+)
+_VOLATILE_RE = re.compile(r"\b(?:now|CURRENT_\w+|RANDOM|LASTVAL)\b", re.IGNORECASE)
+# FROM-Bereich (Tabellen und JOINs) bis zur nächsten Klausel; Klammerinhalte sind vorher entfernt
+_FROM_CLAUSE_RE = re.compile(
+    r"\bFROM\s+(.*?)(?=\b(?:WHERE|GROUP|ORDER|LIMIT|OFFSET|HAVING|UNION|INTERSECT|EXCEPT|WINDOW)\b|;|$)",
+    re.IGNORECASE | re.DOTALL
+)
+_PARENS_RE = re.compile(r"\([^()]*\)")
+_SUBQUERY_RE = re.compile(r"\(\s*SELECT\b", re.IGNORECASE)
+
+def _has_unlisted_tables(query: str) -> bool:
+    """True bei Komma-Joins (FROM a, b) oder Unterabfragen: dort erfasst _READ_TABLES_RE
+    nicht sicher alle gelesenen Tabellen, solche Abfragen werden daher nie gecacht"""
+    if _SUBQUERY_RE.search(query):
+        return True
+    # Kommas in Funktionsaufrufen, IN-Listen und ON-Bedingungen zählen nicht
+    flat = query
+    while "(" in flat:
+        stripped = _PARENS_RE.sub("", flat)
+        if stripped == flat:
+            break
+        flat = stripped
+    return any("," in clause for clause in _FROM_CLAUSE_RE.findall(flat))
+
+class QueryCache:
+    """Thread-sicherer LRU-Cache für Abfragen auf Stammdaten-Tabellen
     
-    # Konvertiere ? Platzhalter zu %s für PostgreSQL
-    if USE_POSTGRESQL and params:
-        query = query.replace("?", "%s")
+    Einträge verfallen nach `ttl` Sekunden und werden bei jedem Schreibzugriff über
+    execute_update/transaction auf eine beteiligte Tabelle sofort verworfen.
+    """
     
-    if params:
-        cursor.execute(query, params)
-    else:
-        cursor.execute(query)
+    def __init__(self, tables=DB_CACHE_TABLES, ttl: float = DB_CACHE_TTL,
+                 max_entries: int = DB_CACHE_MAX_ENTRIES):
+        self.tables = frozenset(t.lower() for t in tables)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (query, params) -> (Ablaufzeit, Tabellen, Ergebnis)
+        self._generations = {}  # Tabelle -> Zähler, wird bei jedem Schreibzugriff erhöht
+        self._plans = {}  # query -> Tabellen (oder None, falls nicht cachebar)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
     
-    if USE_POSTGRESQL:
-        results = [dict(row) for row in cursor.fetchall()]
-    else:
-        results = [dict(row) for row in cursor.fetchall()]
+    def cacheable_tables(self, query: str):
+        """Gibt die gelesenen Tabellen zurück, falls die Abfrage gecacht werden darf, sonst None"""
+        plan = self._plans.get(query, False)
+        if plan is False:
+            plan = None
+            if self.tables and query.lstrip()[:6].upper() == "SELECT" and not _VOLATILE_RE.search(query):
+                tables = frozenset(t.lower() for t in _READ_TABLES_RE.findall(query))
+                if tables and tables <= self.tables and not _has_unlisted_tables(query):
+                    plan = tables
+            if len(self._plans) < 4096:
+                self._plans[query] = plan
+        return plan
     
-    conn.close()
-    return results
+    def generation(self, tables) -> tuple:
+        with self._lock:
+            return tuple(self._generations.get(t, 0) for t in sorted(tables))
+    
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key, tables, generation: tuple, result: List[Dict]):
+        with self._lock:
+            # Zwischenzeitlicher Schreibzugriff: Ergebnis könnte bereits veraltet sein
+            if generation != tuple(self._generations.get(t, 0) for t in sorted(tables)):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, tables, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, table: str):
+        """Verwirft alle Einträge, die die Tabelle lesen"""
+        table = table.lower()
+        if table not in self.tables:
+            return
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            stale = [key for key, entry in self._entries.items() if table in entry[1]]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += 1
+    
+    def invalidate_for(self, query: str):
+        """Verwirft Einträge der Tabelle, in die die Anweisung schreibt (DDL leert alles)"""
+        match = _WRITE_TABLE_RE.match(query)
+        if match:
+            self.invalidate(match.group(1))
+        elif not query.lstrip()[:6].upper() == "SELECT":
+            self.clear()
+    
+    def clear(self):
+        with self._lock:
+            for table in self.tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            self._entries.clear()
+            self.invalidations += 1
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'ttl': self.ttl,
+                'tables': sorted(self.tables),
+            }
 
-def execute_update(query: str, params: tuple = None) -> int:
-    """Führt ein UPDATE/INSERT aus und gibt die ID der eingefügten Zeile zurück"""
-    conn = get_connection()
+query_cache = QueryCache()
+
+def get_cache_stats() -> Dict:
+    """Gibt Hit/Miss-Zähler des Stammdaten-Caches zurück"""
+    return query_cache.stats()
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_EXPLAINABLE_RE = re.compile(r"^\s*(?:SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+# Histogramm-Grenzen in ms: 0,01 ms bis ~2 min, je Stufe Faktor 1,25 (Perzentile auf ±12 % genau)
+_LATENCY_BOUNDS = [0.01 * 1.25 ** i for i in range(74)]
+_OTHER_STATEMENTS = "(weitere Anweisungen)"
+
+def fingerprint_sql(query: str) -> str:
+    """Normalisiert SQL für die Gruppierung: Literale und Platzhalter werden zu ?, IN-Listen zu (?...)"""
+    sql = _COMMENT_RE.sub(" ", query)
+    sql = _STRING_LITERAL_RE.sub("?", sql)
+    sql = _NUMBER_LITERAL_RE.sub("?", sql.replace("%s", "?"))
+    sql = _PLACEHOLDER_LIST_RE.sub("(?...)", sql)
+    return " ".join(sql.split())
+
+class _StatementStats:
+    """Aggregierte Messwerte eines Fingerprints"""
+    
+    __slots__ = ("calls", "errors", "cache_hits", "rows", "total_ms", "max_ms", "buckets", "sites",
+                 "plan", "plan_at")
+    
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(_LATENCY_BOUNDS) + 1)
+        self.sites = Counter()
+        self.plan = None
+        self.plan_at = float("-inf")
+    
+    def add(self, ms: float, rows: int, site: str, failed: bool):
+        self.calls += 1
+        self.errors += failed
+        if rows > 0:
+            self.rows += rows
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        self.buckets[bisect_left(_LATENCY_BOUNDS, ms)] += 1
+        # Aufrufstellen begrenzen (z.B. Schleifen mit wechselnden Zeilennummern)
+        if site is not None and (site in self.sites or len(self.sites) < 20):
+            self.sites[site] += 1
+    
+    def percentile(self, p: float) -> float:
+        """Obergrenze des Histogramm-Eimers, in den das Perzentil fällt (höchstens max_ms)"""
+        if not self.calls:
+            return 0.0
+        target, seen = p * self.calls, 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return min(_LATENCY_BOUNDS[i] if i < len(_LATENCY_BOUNDS) else self.max_ms, self.max_ms)
+        return self.max_ms
+    
+    def as_dict(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'cache_hits': self.cache_hits,
+            'rows': self.rows,
+            'avg_rows': round(self.rows / self.calls, 1) if self.calls else 0.0,
+            'total_ms': round(self.total_ms, 2),
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'p50_ms': round(self.percentile(0.5), 3),
+            'p95_ms': round(self.percentile(0.95), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            'max_ms': round(self.max_ms, 3),
+            'sites': dict(self.sites.most_common(5)),
+        }
+
+class QueryMetrics:
+    """Laufzeit, Zeilen und Aufrufstellen pro SQL-Fingerprint plus Log der langsamsten Abfragen
+    
+    Speicher bleibt begrenzt: feste Histogramm-Eimer statt Einzelwerten, höchstens
+    `max_statements` Fingerprints (der Rest landet gesammelt unter "weitere Anweisungen").
+    """
+    
+    def __init__(self, max_statements: int = DB_METRICS_MAX_STATEMENTS, slow_ms: float = DB_SLOW_QUERY_MS,
+                 slow_log_size: int = DB_SLOW_QUERY_LOG_SIZE, explain_interval: float = DB_SLOW_QUERY_EXPLAIN_INTERVAL):
+        self.max_statements = max_statements
+        self.slow_ms = slow_ms
+        self.explain_interval = explain_interval
+        self._statements = {}  # Fingerprint -> _StatementStats
+        self._fingerprints = {}  # SQL-Text -> Fingerprint
+        self._total = _StatementStats()
+        self._slow = deque(maxlen=slow_log_size)
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+    
+    def fingerprint(self, query: str) -> str:
+        fingerprint = self._fingerprints.get(query)
+        if fingerprint is None:
+            fingerprint = fingerprint_sql(query)
+            if len(self._fingerprints) < 4096:
+                self._fingerprints[query] = fingerprint
+        return fingerprint
+    
+    def _stats_for(self, fingerprint: str) -> _StatementStats:
+        """Eintrag zum Fingerprint (Lock gehalten)"""
+        stats = self._statements.get(fingerprint)
+        if stats is None:
+            if len(self._statements) >= self.max_statements:
+                fingerprint = _OTHER_STATEMENTS
+                stats = self._statements.get(fingerprint)
+            if stats is None:
+                stats = self._statements[fingerprint] = _StatementStats()
+        return stats
+    
+    def record(self, query: str, seconds: float, rows: int, site: str, failed: bool = False,
+               explain: Optional[Callable[[], List[str]]] = None):
+        """Erfasst eine ausgeführte Anweisung; explain() liefert bei Bedarf den Ausführungsplan"""
+        ms = seconds * 1000
+        fingerprint = self.fingerprint(query)
+        slow = not failed and self.slow_ms > 0 and ms >= self.slow_ms
+        with self._lock:
+            stats = self._stats_for(fingerprint)
+            stats.add(ms, rows, site, failed)
+            self._total.add(ms, rows, None, failed)
+            if not slow:
+                return
+            self.slow_queries += 1
+            # EXPLAIN höchstens einmal pro Intervall und Fingerprint, sonst letzten Plan wiederverwenden
+            now = time.monotonic()
+            explain_due = explain is not None and now - stats.plan_at >= self.explain_interval
+            if explain_due:
+                stats.plan_at = now
+            plan = stats.plan
+        
+        if explain_due:
+            plan = explain()
+            with self._lock:
+                stats.plan = plan
+        entry = {
+            'at': datetime.now().isoformat(timespec="seconds"),
+            'duration_ms': round(ms, 2),
+            'rows': rows,
+            'site': site,
+            'fingerprint': fingerprint,
+            'plan': plan,
+        }
+        with self._lock:
+            self._slow.append(entry)
+        print(f"Langsame Abfrage ({ms:.0f} ms, {rows} Zeilen, {site}): {fingerprint[:200]}")
+    
+    def record_cache_hit(self, query: str):
+        fingerprint = self.fingerprint(query)
+        with self._lock:
+            self._stats_for(fingerprint).cache_hits += 1
+    
+    def slow_log(self, limit: int = None) -> List[Dict]:
+        """Langsame Abfragen, neueste zuerst"""
+        with self._lock:
+            entries = list(self._slow)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+    
+    def stats(self, top: int = 20, sort: str = "total_ms") -> Dict:
+        """Gesamtwerte und die `top` Fingerprints nach `sort` (total_ms, p95_ms, calls, ...)"""
+        with self._lock:
+            statements = [dict(stats.as_dict(), fingerprint=fingerprint, plan=stats.plan)
+                          for fingerprint, stats in self._statements.items()]
+            total = self._total.as_dict()
+            slow_queries = self.slow_queries
+        statements.sort(key=lambda s: s.get(sort, 0), reverse=True)
+        total.pop('sites')
+        total.pop('cache_hits')
+        return dict(
+            total,
+            enabled=DB_METRICS,
+            statements=len(statements),
+            slow_query_ms=self.slow_ms,
+            slow_queries=slow_queries,
+            top=statements[:top],
+        )
+
+query_metrics = QueryMetrics()
+
+def get_query_metrics(top: int = 20, sort: str = "total_ms") -> Dict:
+    """Gibt Laufzeit-Perzentile, Zeilen und Aufrufstellen der häufigsten/teuersten Abfragen zurück"""
+    return query_metrics.stats(top, sort)
+
+def get_slow_queries(limit: int = None) -> List[Dict]:
+    """Gibt die zuletzt protokollierten langsamen Abfragen samt Ausführungsplan zurück"""
+    return query_metrics.slow_log(limit)
+
+def get_pool_stats() -> Dict:
+    """Gibt Größe und Auslastung des Connection-Pools zurück"""
+    return get_pool().stats()
+
+_call_sites = {}  # (Code-Objekt, Zeile) -> Bezeichnung
+
+def _call_site() -> str:
+    """Erste Aufrufstelle außerhalb dieses Moduls, z.B. 'api.py:get_customers:1012'"""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    key = (frame.f_code, frame.f_lineno)
+    site = _call_sites.get(key)
+    if site is None:
+        site = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}"
+        if len(_call_sites) < 4096:
+            _call_sites[key] = site
+    return site
+
+def _explain(conn, query: str, params) -> List[str]:
+    """Ausführungsplan einer Anweisung (EXPLAIN ohne ANALYZE, führt sie also nicht erneut aus)"""
+    if not _EXPLAINABLE_RE.match(query):
+        return []
+    sql = ("EXPLAIN " if USE_POSTGRESQL else "EXPLAIN QUERY PLAN ") + _adapt_placeholders(query, params)
     cursor = get_cursor(conn)
+    try:
+        if params:
+            cursor.execute(sql, params)
+        else:
+            cursor.execute(sql)
+        if USE_POSTGRESQL:
+            return [row['QUERY PLAN'] for row in cursor.fetchall()]
+        return [row[3] for row in cursor.fetchall()]  # (id, parent, notused, detail)
+    except Exception as e:
+        if USE_POSTGRESQL:
+            # Abgebrochene Transaktion nicht weiterverwenden (nur außerhalb von transaction() aufgerufen)
+            conn.rollback()
+        return [f"EXPLAIN fehlgeschlagen: {e}"]
+    finally:
+        cursor.close()
+
+class _Measured:
+    """Misst eine Anweisung für query_metrics; der Aufrufer setzt `rows`
     
-    # Konvertiere ? Platzhalter zu %s für PostgreSQL
-    query_modified = query
-    if USE_POSTGRESQL and params:
-        query_modified = query.replace("?", "%s")
+    conn=None verzichtet auf EXPLAIN (z.B. mitten in einer PostgreSQL-Transaktion,
+    die ein fehlgeschlagenes EXPLAIN abbrechen würde).
+    """
     
-    if params:
-        cursor.execute(query_modified, params)
-    else:
-        cursor.execute(query_modified)
+    __slots__ = ("conn", "query", "params", "rows", "site", "started")
     
-    conn.commit()
+    def __init__(self, conn, query: str, params):
+        self.conn = conn
+        self.query = query
+        self.params = params
+        self.rows = 0
+    
+    def __enter__(self):
+        self.site = _call_site() if DB_METRICS else None
+        self.started = time.perf_counter()
+        return self
     
-    # Versuche die ID zu bekommen
+    def __exit__(self, exc_type, exc, tb):
+        if DB_METRICS:
+            explain = None
+            if DB_SLOW_QUERY_EXPLAIN and self.conn is not None and exc_type is None:
+                explain = lambda: _explain(self.conn, self.query, self.params)
+            # GeneratorExit: iter_query wurde vorzeitig geschlossen, kein Fehler der Abfrage
+            failed = exc_type is not None and not issubclass(exc_type, GeneratorExit)
+            query_metrics.record(self.query, time.perf_counter() - self.started, self.rows, self.site,
+                                 failed=failed, explain=explain)
+        return False
+
+def _adapt_placeholders(query: str, params) -> str:
+    """Konvertiert ? Platzhalter zu %s für PostgreSQL"""
+    if USE_POSTGRESQL and params:
+        return query.replace("?", "%s")
+    return query
+
+def _last_insert_id(cursor, query: str) -> int:
+    """Ermittelt die ID der zuletzt eingefügten Zeile"""
     last_id = None
     
     if USE_POSTGRESQL:
         # PostgreSQL: Versuche LASTVAL() für INSERT-Anweisungen
-        if "INSERT" in query.upper():
+        if query.lstrip()[:6].upper() == "INSERT":
+            # LASTVAL schlägt fehl, wenn in der Sitzung noch keine Sequenz benutzt wurde (z.B. INSERT in
+            # eine Tabelle ohne SERIAL-Spalte); ohne Savepoint wäre danach die ganze Transaktion abgebrochen
+            cursor.execute("SAVEPOINT last_insert_id")
             try:
                 cursor.execute("SELECT LASTVAL()")
                 result = cursor.fetchone()
                 last_id = result['lastval'] if isinstance(result, dict) else result[0]
-            except:
+                cursor.execute("RELEASE SAVEPOINT last_insert_id")
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT last_insert_id")
                 last_id = 0
         elif "UPDATE" in query.upper() or "DELETE" in query.upper():
             # Für UPDATE/DELETE geben wir 0 zurück
@@ -583,5 +1155,178 @@ def execute_update(query: str, params: tuple = None) -> int:
         # SQLite: lastrowid funktioniert für INSERT
         last_id = cursor.lastrowid if cursor.lastrowid else 0
     
-    conn.close()
     return last_id if last_id is not None else 0
+
+def _executemany(cursor, query: str, params_list: List[tuple]) -> int:
+    """Führt eine Anweisung für viele Parameter-Tupel aus und gibt die Anzahl betroffener Zeilen zurück"""
+    if not params_list:
+        return 0
+    query = _adapt_placeholders(query, params_list[0])
+    if USE_POSTGRESQL:
+        # execute_batch bündelt viele Anweisungen in wenige Round-Trips
+        from psycopg2.extras import execute_batch
+        execute_batch(cursor, query, params_list, page_size=500)
+        return len(params_list)
+    cursor.executemany(query, params_list)
+    return cursor.rowcount
+
+class Transaction:
+    """Unit-of-Work: mehrere Anweisungen auf einer Verbindung mit genau einem Commit"""
+    
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = get_cursor(conn)
+        self.writes = []  # Schreibanweisungen, deren Cache-Einträge nach dem Commit verfallen
+        # Ein fehlgeschlagenes EXPLAIN würde eine PostgreSQL-Transaktion abbrechen
+        self._explain_conn = None if USE_POSTGRESQL else conn
+    
+    def query(self, query: str, params: tuple = None) -> List[Dict]:
+        """Führt eine Abfrage innerhalb der Transaktion aus"""
+        with _Measured(self._explain_conn, query, params) as measured:
+            if params:
+                self.cursor.execute(_adapt_placeholders(query, params), params)
+            else:
+                self.cursor.execute(query)
+            results = [dict(row) for row in self.cursor.fetchall()]
+            measured.rows = len(results)
+        return results
+    
+    def execute(self, query: str, params: tuple = None) -> int:
+        """Führt ein UPDATE/INSERT aus und gibt die ID der eingefügten Zeile zurück"""
+        with _Measured(self._explain_conn, query, params) as measured:
+            if params:
+                self.cursor.execute(_adapt_placeholders(query, params), params)
+            else:
+                self.cursor.execute(query)
+            measured.rows = self.cursor.rowcount
+        self.writes.append(query)
+        return _last_insert_id(self.cursor, query)
+    
+    def executemany(self, query: str, params_list: List[tuple]) -> int:
+        """Führt eine Anweisung für viele Parameter-Tupel aus (Bulk-Insert/-Update)"""
+        self.writes.append(query)
+        # Ohne EXPLAIN: der Plan einer Sammelanweisung hängt nicht an einzelnen Parametern
+        with _Measured(None, query, None) as measured:
+            measured.rows = _executemany(self.cursor, query, list(params_list))
+        return measured.rows
+
+@contextmanager
+def transaction(immediate: bool = False):
+    """Context-Manager für atomare Schreibvorgänge
+    
+    Alle Anweisungen laufen auf einer Verbindung; Commit am Ende, Rollback bei Fehlern.
+    immediate=True reserviert bei SQLite sofort die Schreibsperre (BEGIN IMMEDIATE).
+    
+        with transaction() as tx:
+            sale_id = tx.execute("INSERT INTO sales ...", (...))
+            tx.executemany("INSERT INTO sale_items ...", rows)
+    """
+    with pooled_connection() as conn:
+        tx = Transaction(conn)
+        try:
+            if not USE_POSTGRESQL:
+                # Explizites BEGIN, damit auch Lesezugriffe und DDL Teil der Transaktion sind
+                tx.cursor.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            yield tx
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            tx.cursor.close()
+            for query in tx.writes:
+                query_cache.invalidate_for(query)
+
+def execute_query(query: str, params: tuple = None) -> List[Dict]:
+    """Führt eine SQL-Abfrage aus und gibt Ergebnisse als Liste von Dictionaries zurück
+    
+    Abfragen, die nur Stammdaten-Tabellen (DB_CACHE_TABLES) lesen, werden gecacht.
+    """
+    tables = query_cache.cacheable_tables(query)
+    if tables:
+        key = (query, tuple(params) if params else None)
+        cached = query_cache.get(key)
+        if cached is not None:
+            if DB_METRICS:
+                query_metrics.record_cache_hit(query)
+            # Kopien, damit Aufrufer den Cache nicht verändern
+            return [dict(row) for row in cached]
+        generation = query_cache.generation(tables)
+    
+    sql = _adapt_placeholders(query, params)
+    
+    with pooled_connection() as conn:
+        cursor = get_cursor(conn)
+        with _Measured(conn, query, params) as measured:
+            if params:
+                cursor.execute(sql, params)
+            else:
+                cursor.execute(sql)
+            
+            results = [dict(row) for row in cursor.fetchall()]
+            measured.rows = len(results)
+        cursor.close()
+    
+    if tables:
+        query_cache.put(key, tables, generation, [dict(row) for row in results])
+    
+    return results
+
+def execute_update(query: str, params: tuple = None) -> int:
+    """Führt ein UPDATE/INSERT aus und gibt die ID der eingefügten Zeile zurück"""
+    with pooled_connection() as conn:
+        cursor = get_cursor(conn)
+        with _Measured(conn, query, params) as measured:
+            if params:
+                cursor.execute(_adapt_placeholders(query, params), params)
+            else:
+                cursor.execute(query)
+            
+            conn.commit()
+            measured.rows = cursor.rowcount
+        last_id = _last_insert_id(cursor, query)
+        cursor.close()
+    
+    query_cache.invalidate_for(query)
+    return last_id
+
+def execute_many(query: str, params_list: List[tuple]) -> int:
+    """Führt eine Anweisung für viele Parameter-Tupel in einer Transaktion aus"""
+    with transaction() as tx:
+        return tx.executemany(query, params_list)
+
+def iter_query(query: str, params: tuple = None, batch_size: int = 1000) -> Iterator[Dict]:
+    """Führt eine Abfrage aus und liefert die Zeilen einzeln, ohne alles in den Speicher zu laden
+    
+    PostgreSQL verwendet einen serverseitigen (benannten) Cursor, SQLite fetchmany().
+    Die Verbindung bleibt ausgecheckt, bis der Generator erschöpft oder geschlossen ist.
+    """
+    sql = _adapt_placeholders(query, params)
+    
+    with pooled_connection() as conn:
+        if USE_POSTGRESQL:
+            from psycopg2.extras import RealDictCursor
+            cursor = conn.cursor(name=f"iter_{id(conn)}_{time.monotonic_ns()}", cursor_factory=RealDictCursor)
+            cursor.itersize = batch_size
+        else:
+            cursor = conn.cursor()
+        # Gemessen wird nur die Datenbankzeit (execute/fetchmany), nicht die Verarbeitung beim Aufrufer
+        measured = _Measured(None, query, params)
+        try:
+            with measured:
+                if params:
+                    cursor.execute(sql, params)
+                else:
+                    cursor.execute(sql)
+                
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    measured.rows += len(rows)
+                    paused = time.perf_counter()
+                    for row in rows:
+                        yield dict(row)
+                    measured.started += time.perf_counter() - paused
+        finally:
+            cursor.close()
@@ -0,0 +1,177 @@
+"""
+Ausführungsschicht für Datenbankarbeit in der API
+Blockierende Abfragen laufen auf einem begrenzten Thread-Pool statt auf der Event-Loop;
+ist auch die Warteschlange voll, wird die Anfrage sofort abgelehnt statt unbegrenzt zu stauen.
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator
+
+from database import DB_POOL_MAX_SIZE
+
+# Gleichzeitige Antwort-Streams (Exporte), die jeweils eine Verbindung bis zum letzten Byte halten
+DB_STREAM_LIMIT = int(os.getenv("DB_STREAM_LIMIT", str(max(1, DB_POOL_MAX_SIZE // 5))))
+# Standard: die übrigen Datenbankverbindungen, damit weder Thread noch Stream auf den Pool wartet
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(max(1, DB_POOL_MAX_SIZE - DB_STREAM_LIMIT))))
+DB_EXECUTOR_QUEUE = int(os.getenv("DB_EXECUTOR_QUEUE", "100"))  # wartende Aufträge bis zur Ablehnung
+
+class DatabaseBusyError(RuntimeError):
+    """Alle Threads sind belegt und die Warteschlange ist voll"""
+
+class _Stream:
+    """Iterator um einen Antwort-Stream; gibt seinen Stream-Platz genau einmal wieder frei
+
+    Starlette verwirft den Iterator bei Verbindungsabbruch ohne close(). Dann meldet ein
+    Finalizer den Platz nur in einer Deque als frei (ohne Sperre: die Garbage Collection kann
+    in einem Thread laufen, der _lock gerade hält); verrechnet wird beim nächsten open_stream().
+    """
+
+    def __init__(self, executor: "DBExecutor", rows: Iterator):
+        self._executor = executor
+        self._rows = rows
+        # Genau einer von close() (detach) und Finalizer (Aufruf) gewinnt
+        self._finalizer = weakref.finalize(self, executor._dropped_streams.append, 1)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._rows)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._finalizer.detach() is None:
+            return
+        try:
+            # Schließt den Generator, damit iter_query seine Verbindung zurückgibt
+            close = getattr(self._rows, "close", None)
+            if close is not None:
+                close()
+        finally:
+            with self._executor._lock:
+                self._executor.streams -= 1
+
+class DBExecutor:
+    """Thread-Pool mit `workers` Threads und höchstens `max_queue` wartenden Aufträgen
+
+    Dazu höchstens `max_streams` Antwort-Streams, die außerhalb des Pools (im Thread-Pool von
+    Starlette) über eine eigene Verbindung iterieren.
+    """
+
+    def __init__(self, workers: int = DB_EXECUTOR_WORKERS, max_queue: int = DB_EXECUTOR_QUEUE,
+                 max_streams: int = DB_STREAM_LIMIT):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.max_streams = max(1, max_streams)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="db")
+        # Ein Platz pro laufendem oder wartendem Auftrag; freigegeben erst, wenn der Thread fertig ist
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._dropped_streams = deque()  # Plätze verworfener Streams, siehe _Stream
+        self._lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.streams = 0
+        self.streams_rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _run(self, fn: Callable, submitted: float):
+        waited = time.monotonic() - submitted
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Führt fn(*args, **kwargs) auf dem Pool aus; wirft DatabaseBusyError bei voller Warteschlange
+
+        Wird der Aufrufer abgebrochen (Client getrennt), läuft die Abfrage zu Ende und belegt
+        ihren Platz bis dahin, damit die Grenze auch dann gilt.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise DatabaseBusyError(
+                f"Datenbank ausgelastet ({self.workers} Threads, {self.max_queue} wartende Aufträge)"
+            )
+        with self._lock:
+            self.queued += 1
+        try:
+            future = self._executor.submit(self._run, functools.partial(fn, *args, **kwargs), time.monotonic())
+        except Exception:
+            with self._lock:
+                self.queued -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    def open_stream(self, rows: Iterable) -> Iterator:
+        """Belegt einen Stream-Platz für rows; wirft DatabaseBusyError, wenn alle belegt sind
+
+        Der Platz wird frei, sobald der Stream erschöpft, fehlgeschlagen oder geschlossen ist.
+        """
+        rows = iter(rows)
+        with self._lock:
+            self._collect_dropped_streams()
+            if self.streams >= self.max_streams:
+                self.streams_rejected += 1
+                raise DatabaseBusyError(f"Zu viele laufende Exporte ({self.max_streams} gleichzeitig)")
+            self.streams += 1
+        return _Stream(self, rows)
+
+    def _collect_dropped_streams(self):
+        """Verrechnet die Plätze verworfener Streams (nur unter self._lock)"""
+        while self._dropped_streams:
+            self._dropped_streams.popleft()
+            self.streams -= 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._collect_dropped_streams()
+            started = self.completed + self.running
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'running': self.running,
+                'queued': self.queued,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'streams': self.streams,
+                'max_streams': self.max_streams,
+                'streams_rejected': self.streams_rejected,
+                'avg_wait_ms': round(self._wait_total / started * 1000, 2) if started else 0.0,
+                'max_wait_ms': round(self._wait_max * 1000, 2),
+            }
+
+db_executor = DBExecutor()
+
+async def run_db(fn: Callable, *args, **kwargs):
+    """Führt blockierende Datenbankarbeit auf dem DB-Thread-Pool aus"""
+    return await db_executor.run(fn, *args, **kwargs)
+
+def open_db_stream(rows: Iterable) -> Iterator:
+    """Meldet einen Antwort-Stream an, der beim Iterieren eine Datenbankverbindung hält"""
+    return db_executor.open_stream(rows)
+
+def get_db_executor_stats() -> Dict:
+    """Gibt Auslastung und Wartezeiten des DB-Thread-Pools zurück"""
+    return db_executor.stats()
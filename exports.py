@@ -0,0 +1,289 @@
+"""
+Streaming-Exporte für die Buchhaltung: Verkäufe (eine Zeile pro Position) und Termine
+Zeilen kommen über iter_query (fetchmany bzw. serverseitiger Cursor auf PostgreSQL) und werden
+stückweise als CSV, NDJSON oder Parquet geschrieben – konstanter Speicher unabhängig vom Zeitraum.
+
+Aufruf:
+    python exports.py sales 2024-01 umsatz_januar.csv
+    python exports.py appointments 2024-01-01 2024-03-31 termine_q1.parquet
+    python exports.py sales 2024-01 - 2 > standort2.csv     (Standort als letztes Argument)
+"""
+import csv
+import io
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from database import iter_query
+
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))  # Puffer pro gesendetem Stück
+EXPORT_PARQUET_ROW_GROUP = int(os.getenv("EXPORT_PARQUET_ROW_GROUP", "10000"))  # Zeilen pro Row Group
+FORMATS = ("csv", "ndjson", "parquet")
+MEDIA_TYPES = {
+    'csv': "text/csv; charset=utf-8",
+    'ndjson': "application/x-ndjson",
+    'parquet': "application/vnd.apache.parquet",
+}
+
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+
+class ExportError(ValueError):
+    """Ungültige Exportanfrage (Art, Format, Zeitraum, fehlendes pyarrow)"""
+
+# Spalten pro Export: (Name, Typ) – der Typ bestimmt das Parquet-Schema
+SALES_COLUMNS = [
+    ('sale_id', 'int'), ('sale_date', 'str'), ('sale_time', 'str'),
+    ('location_id', 'int'), ('location_name', 'str'),
+    ('customer_id', 'int'), ('customer_name', 'str'), ('payment_method', 'str'),
+    ('sale_total', 'float'), ('sale_discount', 'float'),
+    ('item_type', 'str'), ('item_id', 'int'), ('item_name', 'str'),
+    ('quantity', 'int'), ('unit_price', 'float'), ('line_total', 'float'),
+]
+
+APPOINTMENT_COLUMNS = [
+    ('appointment_id', 'int'), ('appointment_date', 'str'), ('appointment_time', 'str'),
+    ('duration', 'int'), ('status', 'str'),
+    ('customer_id', 'int'), ('customer_name', 'str'),
+    ('service_id', 'int'), ('service_name', 'str'), ('service_price', 'float'),
+    ('employee_id', 'int'), ('employee_name', 'str'),
+    ('group_size', 'int'), ('notes', 'str'),
+]
+
+def iter_sales(start_date: str, end_date: str, location_id: Optional[int] = None) -> Iterator[Dict]:
+    """Verkaufspositionen im Zeitraum (Verkäufe ohne Positionen mit leeren Positionsspalten)"""
+    where, params = "s.sale_date BETWEEN ? AND ?", [start_date, end_date]
+    if location_id is not None:
+        where += " AND s.location_id = ?"
+        params.append(location_id)
+    return iter_query(f"""
+        SELECT s.id as sale_id, s.sale_date, s.sale_time, s.location_id, l.name as location_name,
+               s.customer_id, c.first_name || ' ' || c.last_name as customer_name, s.payment_method,
+               s.total_amount as sale_total, s.discount as sale_discount,
+               si.item_type, si.item_id, si.item_name, si.quantity, si.price as unit_price,
+               si.quantity * si.price as line_total
+        FROM sales s
+        LEFT JOIN sale_items si ON si.sale_id = s.id
+        LEFT JOIN customers c ON s.customer_id = c.id
+        LEFT JOIN locations l ON s.location_id = l.id
+        WHERE {where}
+        ORDER BY s.sale_date, s.sale_time, s.id, si.id
+    """, tuple(params))
+
+def iter_appointments(start_date: str, end_date: str) -> Iterator[Dict]:
+    """Termine im Zeitraum mit Kunde, Service und Mitarbeiter"""
+    return iter_query("""
+        SELECT a.id as appointment_id, a.appointment_date, a.appointment_time, a.duration, a.status,
+               a.customer_id, c.first_name || ' ' || c.last_name as customer_name,
+               a.service_id, s.name as service_name, s.price as service_price,
+               a.employee_id, e.first_name || ' ' || e.last_name as employee_name,
+               a.group_size, a.notes
+        FROM appointments a
+        LEFT JOIN customers c ON a.customer_id = c.id
+        LEFT JOIN services s ON a.service_id = s.id
+        LEFT JOIN employees e ON a.employee_id = e.id
+        WHERE a.appointment_date BETWEEN ? AND ?
+        ORDER BY a.appointment_date, a.appointment_time, a.id
+    """, (start_date, end_date))
+
+EXPORTS = {
+    'sales': SALES_COLUMNS,
+    'appointments': APPOINTMENT_COLUMNS,
+}
+
+# --- Schreiben ---
+
+def _buffered(pieces: Iterator[bytes], size: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    """Fasst viele kleine Stücke zu Blöcken von etwa `size` Bytes zusammen"""
+    buffer, length = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield b"".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+def stream_csv(rows: Iterator[Dict], columns: List[Tuple[str, str]]) -> Iterator[bytes]:
+    names = [name for name, _ in columns]
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def lines():
+        writer.writerow(names)
+        for row in rows:
+            writer.writerow([row.get(name) for name in names])
+            if out.tell() >= 4096:
+                yield out.getvalue().encode("utf-8")
+                out.seek(0)
+                out.truncate()
+        yield out.getvalue().encode("utf-8")  # Rest bzw. nur die Kopfzeile
+    yield from _buffered(lines())
+
+def stream_ndjson(rows: Iterator[Dict], columns: List[Tuple[str, str]]) -> Iterator[bytes]:
+    names = [name for name, _ in columns]
+    yield from _buffered(
+        (json.dumps({name: row.get(name) for name in names}, default=str, ensure_ascii=False) + "\n").encode("utf-8")
+        for row in rows
+    )
+
+class _ParquetSink(io.RawIOBase):
+    """Sammelt, was der Parquet-Writer schreibt, bis es weitergereicht wird"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_parquet(rows: Iterator[Dict], columns: List[Tuple[str, str]],
+                   row_group_size: int = EXPORT_PARQUET_ROW_GROUP) -> Iterator[bytes]:
+    """Schreibt eine Row Group pro `row_group_size` Zeilen und gibt sie sofort weiter"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    names = [name for name, _ in columns]
+    sink = _ParquetSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+
+    batch = []
+    for row in rows:
+        batch.append({name: row.get(name) for name in names})
+        if len(batch) >= row_group_size:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            batch = []
+            yield sink.drain()
+    if batch:
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    writer.close()
+    yield sink.drain()
+
+def gzip_stream(chunks: Iterator[bytes], level: int = 6) -> Iterator[bytes]:
+    """Komprimiert einen Byte-Strom fortlaufend im gzip-Format"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip-Header
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+_WRITERS = {'csv': stream_csv, 'ndjson': stream_ndjson, 'parquet': stream_parquet}
+
+# --- Ablauf ---
+
+def resolve_range(month: Optional[str] = None, start_date: Optional[str] = None,
+                  end_date: Optional[str] = None) -> Tuple[str, str]:
+    """Zeitraum aus Monat (YYYY-MM) oder Von/Bis (YYYY-MM-DD, Bis standardmäßig heute)"""
+    try:
+        if month:
+            if not _MONTH_RE.match(month):
+                raise ValueError
+            first = datetime.strptime(month + "-01", "%Y-%m-%d")
+            last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            return first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")
+        if not start_date:
+            raise ExportError("Zeitraum fehlt: month (YYYY-MM) oder start_date angeben")
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+        end = datetime.strptime(end_date, "%Y-%m-%d") if end_date else datetime.now()
+    except ValueError as e:
+        if isinstance(e, ExportError):
+            raise
+        raise ExportError("Datum im Format YYYY-MM-DD bzw. Monat als YYYY-MM angeben")
+    if end < start:
+        raise ExportError("end_date liegt vor start_date")
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+def export(kind: str, format: str, start_date: str, end_date: str, location_id: Optional[int] = None,
+           gzip: bool = False) -> Iterator[bytes]:
+    """Gibt den Export als Byte-Strom zurück
+
+    Art, Format und Filter werden sofort geprüft (ExportError), die Abfrage startet erst beim
+    Iterieren – so kann die API vor dem ersten Byte noch mit 400 antworten.
+    """
+    if kind not in EXPORTS:
+        raise ExportError(f"Unbekannter Export: {kind} (erlaubt: {', '.join(EXPORTS)})")
+    if format not in FORMATS:
+        raise ExportError(f"Unbekanntes Format: {format} (erlaubt: {', '.join(FORMATS)})")
+    if format == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet-Export benötigt pyarrow (pip install pyarrow)")
+    if kind == "appointments" and location_id is not None:
+        raise ExportError("Termine sind keinem Standort zugeordnet")
+
+    def rows():
+        if kind == "sales":
+            return iter_sales(start_date, end_date, location_id)
+        return iter_appointments(start_date, end_date)
+
+    def chunks():
+        yield from _WRITERS[format](rows(), EXPORTS[kind])
+
+    return gzip_stream(chunks()) if gzip else chunks()
+
+def export_filename(kind: str, format: str, start_date: str, end_date: str,
+                    location_id: Optional[int] = None, gzip: bool = False) -> str:
+    location = f"_standort{location_id}" if location_id is not None else ""
+    return f"{kind}_{start_date}_{end_date}{location}.{format}{'.gz' if gzip else ''}"
+
+def guess_format(path: str) -> Tuple[str, bool]:
+    """Format und gzip aus der Dateiendung (.csv, .ndjson/.jsonl, .parquet, jeweils optional .gz)"""
+    compressed = path.endswith(".gz")
+    name = path[:-3] if compressed else path
+    if name.endswith(".parquet"):
+        return "parquet", compressed
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson", compressed
+    return "csv", compressed
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) < 3 or args[0] not in EXPORTS:
+        print(f"Verwendung: python exports.py {{{'|'.join(EXPORTS)}}} (YYYY-MM | VON BIS) DATEI|- [STANDORT]")
+        sys.exit(1)
+    kind = args.pop(0)
+    try:
+        if _MONTH_RE.match(args[0]):
+            start, end = resolve_range(month=args.pop(0))
+        else:
+            start, end = resolve_range(start_date=args.pop(0), end_date=args.pop(0))
+        path = args.pop(0)
+        location = int(args.pop(0)) if args else None
+        format, compressed = guess_format(path)
+        stream = export(kind, format, start, end, location, compressed)
+    except (ExportError, ValueError, IndexError) as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    started, written = time.monotonic(), 0
+    out = sys.stdout.buffer if path == "-" else open(path, "wb")
+    try:
+        for chunk in stream:
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    elapsed = time.monotonic() - started
+    print(f"{kind} {start} bis {end}: {written / 1024 / 1024:.1f} MB in {elapsed:.1f} s", file=sys.stderr)
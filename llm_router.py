@@ -0,0 +1,277 @@
+"""
+Provider-Routing für den AI Assistant
+Circuit Breaker pro LLM-Provider, Latenzmessung und optionales Hedging:
+antwortet der erste Provider nicht innerhalb seiner p95-Latenz, startet parallel der nächste.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Awaitable, Callable, Dict, List, Optional
+
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))  # Fehler in Folge bis "offen"
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))  # Sekunden bis zum Probeaufruf
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))  # Sekunden
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "3"))  # ohne genug Messwerte
+LATENCY_WINDOW = 100
+LATENCY_MIN_SAMPLES = 5
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class NoProviderAvailableError(RuntimeError):
+    """Kein Provider ist konfiguriert oder alle Circuit Breaker sind offen"""
+
+class AllProvidersFailedError(RuntimeError):
+    """Alle versuchten Provider sind fehlgeschlagen (errors: Name -> Exception)"""
+
+    def __init__(self, errors: Dict[str, Exception]):
+        self.errors = errors
+        super().__init__("; ".join(f"{name}: {type(e).__name__}: {e}" for name, e in errors.items()))
+
+class CircuitBreaker:
+    """Geschlossen -> nach `failure_threshold` Fehlern in Folge offen -> nach `reset_timeout`
+    halb offen (genau ein Probeaufruf) -> bei Erfolg wieder geschlossen, sonst erneut offen"""
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, reset_timeout: float = LLM_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """True, wenn ein Aufruf erlaubt ist (im halb offenen Zustand nur einer gleichzeitig)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probe_running = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probe_running:
+                self._probe_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._probe_running = False
+
+    def release(self):
+        """Gibt einen Probeaufruf frei, der weder Erfolg noch Fehler war (z.B. Abbruch durch den Client)"""
+        with self._lock:
+            self._probe_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._probe_running = False
+
+class Provider:
+    """Ein LLM-Backend: call(prompt, model) liefert den Text oder wirft bei Fehlern,
+    acall(prompt, model) ist die optionale asyncio-Variante"""
+
+    def __init__(self, name: str, call: Callable[[str, str], str],
+                 enabled: Callable[[], bool] = lambda: True, breaker: Optional[CircuitBreaker] = None,
+                 acall: Optional[Callable[[str, str], Awaitable[str]]] = None):
+        self.name = name
+        self.call = call
+        self.acall = acall
+        self.enabled = enabled
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)  # Sekunden erfolgreicher Aufrufe
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            if ok:
+                self._latencies.append(latency)
+            else:
+                self.failures += 1
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Latenz-Perzentil der letzten erfolgreichen Aufrufe (None bei zu wenigen Messwerten)"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def hedge_delay(self) -> float:
+        """Wartezeit, bevor parallel der nächste Provider gestartet wird"""
+        p95 = self.percentile(0.95)
+        return LLM_HEDGE_DEFAULT_DELAY if p95 is None else max(LLM_HEDGE_MIN_DELAY, p95)
+
+    def stats(self) -> Dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            'name': self.name,
+            'state': self.breaker.state,
+            'consecutive_failures': self.breaker.consecutive_failures,
+            'calls': self.calls,
+            'failures': self.failures,
+            'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+class LLMRouter:
+    """Verteilt Anfragen in fester Reihenfolge auf Provider, deren Circuit Breaker geschlossen ist"""
+
+    def __init__(self, providers: List[Provider], max_workers: int = 8):
+        self.providers = providers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+
+    def candidates(self) -> List[Provider]:
+        """Konfigurierte Provider in Reihenfolge (offene Breaker werden erst beim Aufruf geprüft)"""
+        return [p for p in self.providers if p.enabled()]
+
+    def _timed_call(self, provider: Provider, prompt: str, model: str) -> str:
+        started = time.monotonic()
+        try:
+            result = provider.call(prompt, model)
+        except Exception:
+            provider.record(time.monotonic() - started, ok=False)
+            raise
+        provider.record(time.monotonic() - started, ok=True)
+        return result
+
+    def complete(self, prompt: str, model: str, hedge: Optional[bool] = None) -> str:
+        """Gibt die erste erfolgreiche Antwort zurück; wirft NoProviderAvailableError/AllProvidersFailedError
+
+        hedge=None übernimmt LLM_HEDGE.
+        """
+        if hedge is None:
+            hedge = LLM_HEDGE
+        providers = self.candidates()
+        if hedge and len(providers) > 1:
+            return self._hedged(providers, prompt, model)
+        return self._sequential(providers, prompt, model)
+
+    def _sequential(self, providers: List[Provider], prompt: str, model: str) -> str:
+        errors = {}
+        for provider in providers:
+            # allow() erst direkt vor dem Aufruf, sonst bliebe ein halb offener Probeaufruf reserviert
+            if not provider.breaker.allow():
+                continue
+            try:
+                return self._timed_call(provider, prompt, model)
+            except Exception as e:
+                errors[provider.name] = e
+        if not errors:
+            raise NoProviderAvailableError("Kein LLM-Provider verfügbar")
+        raise AllProvidersFailedError(errors)
+
+    def _hedged(self, providers: List[Provider], prompt: str, model: str) -> str:
+        """Startet den nächsten Provider, wenn der laufende seine p95-Latenz überschreitet oder fehlschlägt
+
+        Verlierer laufen im Hintergrund zu Ende (HTTP-Aufrufe lassen sich nicht abbrechen),
+        ihre Latenz und Fehler fließen trotzdem in Statistik und Circuit Breaker ein.
+        """
+        errors = {}
+        pending = {}  # Future -> Provider
+        remaining = list(providers)
+
+        def launch() -> Optional[float]:
+            """Startet den nächsten erlaubten Provider und gibt seine Hedge-Deadline zurück"""
+            while remaining:
+                provider = remaining.pop(0)
+                if provider.breaker.allow():
+                    pending[self._executor.submit(self._timed_call, provider, prompt, model)] = provider
+                    return time.monotonic() + provider.hedge_delay()
+            return None
+
+        deadline = launch()
+        if deadline is None:
+            raise NoProviderAvailableError("Kein LLM-Provider verfügbar")
+        while pending:
+            timeout = max(0.0, deadline - time.monotonic()) if remaining else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    errors[provider.name] = e
+            # Deadline überschritten oder alle laufenden fehlgeschlagen: nächsten Provider dazunehmen
+            if remaining and (not done or not pending):
+                deadline = launch() or deadline
+        raise AllProvidersFailedError(errors)
+
+    # --- asyncio ---
+
+    async def _atimed_call(self, provider: Provider, prompt: str, model: str) -> str:
+        started = time.monotonic()
+        try:
+            result = await provider.acall(prompt, model)
+        except asyncio.CancelledError:
+            # Abbruch (Client weg oder Hedge verloren) ist kein Fehler des Providers
+            provider.breaker.release()
+            raise
+        except Exception:
+            provider.record(time.monotonic() - started, ok=False)
+            raise
+        provider.record(time.monotonic() - started, ok=True)
+        return result
+
+    async def acomplete(self, prompt: str, model: str, hedge: Optional[bool] = None) -> str:
+        """Wie complete(), aber mit den acall-Funktionen der Provider auf der Event-Loop
+
+        Beim Hedging werden verlorene Aufrufe abgebrochen statt im Hintergrund weiterzulaufen.
+        """
+        if hedge is None:
+            hedge = LLM_HEDGE
+        providers = [p for p in self.candidates() if p.acall is not None]
+        errors = {}
+        pending = {}  # Task -> Provider
+        remaining = list(providers)
+
+        def launch() -> Optional[float]:
+            while remaining:
+                provider = remaining.pop(0)
+                if provider.breaker.allow():
+                    task = asyncio.ensure_future(self._atimed_call(provider, prompt, model))
+                    pending[task] = provider
+                    return time.monotonic() + provider.hedge_delay()
+            return None
+
+        deadline = launch()
+        if deadline is None:
+            raise NoProviderAvailableError("Kein LLM-Provider verfügbar")
+        try:
+            while pending:
+                timeout = max(0.0, deadline - time.monotonic()) if hedge and remaining else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        errors[provider.name] = e
+                # Ohne Hedging erst nach einem Fehler, mit Hedging auch nach Ablauf der Deadline
+                if remaining and (not pending or (hedge and not done)):
+                    deadline = launch() or deadline
+        finally:
+            for task in pending:
+                task.cancel()
+        if not errors:
+            raise NoProviderAvailableError("Kein LLM-Provider verfügbar")
+        raise AllProvidersFailedError(errors)
+
+    def stats(self) -> List[Dict]:
+        return [provider.stats() for provider in self.providers]
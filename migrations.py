@@ -0,0 +1,197 @@
+"""
+Versionierte Schema-Migrationen für das CRM-System
+Jede Migration läuft genau einmal; der Stand wird in der Tabelle schema_version gespeichert.
+"""
+from typing import Callable, List, Optional, Tuple
+from database import USE_POSTGRESQL, Transaction, execute_query, transaction
+
+# Beliebige, aber feste Kennung für den PostgreSQL Advisory-Lock während der Migration
+MIGRATION_LOCK_ID = 73274201
+
+def column_exists(tx: Transaction, table: str, column: str) -> bool:
+    """Prüft ob eine Spalte existiert"""
+    if USE_POSTGRESQL:
+        rows = tx.query("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = ? AND column_name = ?
+        """, (table, column))
+        return bool(rows)
+    rows = tx.query(f"PRAGMA table_info({table})")
+    return any(row['name'] == column for row in rows)
+
+def add_column(tx: Transaction, table: str, column: str, definition: str):
+    """Fügt eine Spalte hinzu, falls sie noch nicht existiert"""
+    if USE_POSTGRESQL:
+        definition = definition.replace("TEXT", "VARCHAR")
+        tx.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+    elif not column_exists(tx, table, column):
+        tx.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def create_index(tx: Transaction, name: str, table: str, columns: List[str],
+                 include: Optional[List[str]] = None, where: Optional[str] = None):
+    """Legt einen (optional abdeckenden) Index an
+
+    include: Zusatzspalten, damit die Abfrage ohne Tabellenzugriff beantwortet werden kann.
+    PostgreSQL nutzt dafür INCLUDE, SQLite hängt sie als weitere Indexspalten an.
+    """
+    if USE_POSTGRESQL:
+        sql = f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+        if include:
+            sql += f" INCLUDE ({', '.join(include)})"
+    else:
+        sql = f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns + (include or []))})"
+    if where:
+        sql += f" WHERE {where}"
+    tx.execute(sql)
+
+# --- Migrationen ---
+
+def _appointment_columns(tx: Transaction):
+    """Spalten für Mitarbeiter, Serien, Gruppen und Erinnerungen (ältere Datenbanken)"""
+    add_column(tx, "appointments", "employee_id", "INTEGER")
+    add_column(tx, "appointments", "is_recurring", "INTEGER DEFAULT 0")
+    add_column(tx, "appointments", "recurring_pattern", "TEXT")
+    add_column(tx, "appointments", "parent_appointment_id", "INTEGER")
+    add_column(tx, "appointments", "group_size", "INTEGER DEFAULT 1")
+    add_column(tx, "appointments", "reminder_sent", "INTEGER DEFAULT 0")
+
+def _query_indexes(tx: Transaction):
+    """Indizes für die häufigsten Abfragen in booking_system, api und den Streamlit-Seiten"""
+    # Verfügbarkeit, Tageskalender, Mitarbeiterplan, Tagesstatistik
+    create_index(tx, "idx_appointments_date_employee", "appointments",
+                 ["appointment_date", "employee_id"],
+                 include=["appointment_time", "duration", "status"])
+    # Terminlisten sortiert nach Datum und Uhrzeit
+    create_index(tx, "idx_appointments_date_time", "appointments",
+                 ["appointment_date", "appointment_time"])
+    # Erinnerungen und Wartelisten
+    create_index(tx, "idx_appointments_status", "appointments",
+                 ["status", "reminder_sent", "appointment_date"])
+    create_index(tx, "idx_appointments_service", "appointments", ["service_id", "appointment_date"])
+    create_index(tx, "idx_appointments_customer", "appointments", ["customer_id"])
+    create_index(tx, "idx_appointments_parent", "appointments", ["parent_appointment_id"])
+
+    # Umsatzstatistiken und Verkaufslisten
+    create_index(tx, "idx_sales_date", "sales", ["sale_date", "sale_time"],
+                 include=["total_amount", "discount"])
+    create_index(tx, "idx_sales_customer", "sales", ["customer_id"])
+
+    create_index(tx, "idx_sale_items_sale", "sale_items", ["sale_id"])
+    create_index(tx, "idx_sale_items_item", "sale_items", ["item_type", "item_id"])
+
+    # Kundensuche nach E-Mail und alphabetische Kundenlisten
+    create_index(tx, "idx_customers_email", "customers", ["email"])
+    create_index(tx, "idx_customers_name", "customers", ["last_name", "first_name"])
+
+    create_index(tx, "idx_reviews_appointment", "reviews", ["appointment_id"])
+
+def _customer_keyset_index(tx: Transaction):
+    """Index für Keyset-Pagination der Kundenliste (Name, Vorname, ID)"""
+    tx.execute("DROP INDEX IF EXISTS idx_customers_name")
+    create_index(tx, "idx_customers_name_id", "customers", ["last_name", "first_name", "id"])
+
+def _customer_updated_index(tx: Transaction):
+    """Index für das inkrementelle Nachladen des Kunden-Suchindex"""
+    create_index(tx, "idx_customers_updated", "customers", ["updated_at"])
+
+def _daily_sales_rollup(tx: Transaction):
+    """Standort pro Verkauf und Tages-Rollup für Umsatzauswertungen (inkl. Backfill)"""
+    from analytics import create_sales_rollup_table, rebuild_sales_rollup
+    add_column(tx, "sales", "location_id", "INTEGER")
+    create_sales_rollup_table(tx)
+    rebuild_sales_rollup(tx)
+
+def _daily_service_rollup(tx: Transaction):
+    """Tageskennzahlen pro Service (inkl. Backfill aus sale_items)"""
+    from analytics import create_service_rollup_table, rebuild_service_rollup
+    create_service_rollup_table(tx)
+    rebuild_service_rollup(tx)
+
+def _customer_stats(tx: Transaction):
+    """Kennzahlen pro Kunde (Besuche, Umsatz, RFM) inkl. Backfill aus sales"""
+    from analytics import create_customer_stats_table, rebuild_customer_stats
+    create_customer_stats_table(tx)
+    rebuild_customer_stats(tx)
+    create_index(tx, "idx_customer_stats_spent", "customer_stats", ["total_spent"])
+    create_index(tx, "idx_customer_stats_last_visit", "customer_stats", ["last_visit"])
+
+def _import_lookup_indexes(tx: Transaction):
+    """Indizes für den Dublettenabgleich beim Massenimport (E-Mail ohne Groß-/Kleinschreibung, Telefon)"""
+    from customer_search import PHONE_KEY_SQL
+    create_index(tx, "idx_customers_email_lower", "customers", ["LOWER(email)"])
+    create_index(tx, "idx_customers_phone_key", "customers", [PHONE_KEY_SQL])
+
+# Geordnete Liste aller Migrationen: (Version, Beschreibung, Funktion)
+# Neue Migrationen nur hinten anhängen, bestehende nie ändern
+MIGRATIONS: List[Tuple[int, str, Callable[[Transaction], None]]] = [
+    (1, "Terminspalten für Serien, Gruppen und Erinnerungen", _appointment_columns),
+    (2, "Indizes für häufige Abfragen", _query_indexes),
+    (3, "Keyset-Index für die Kundenliste", _customer_keyset_index),
+    (4, "Index auf customers.updated_at für die Kundensuche", _customer_updated_index),
+    (5, "Tages-Rollup für Umsätze", _daily_sales_rollup),
+    (6, "Tages-Rollup pro Service", _daily_service_rollup),
+    (7, "Kundenkennzahlen und RFM-Scores", _customer_stats),
+    (8, "Indizes für den Dublettenabgleich beim Import", _import_lookup_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def _ensure_version_table(tx: Transaction):
+    if USE_POSTGRESQL:
+        tx.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description VARCHAR,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    else:
+        tx.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+def _current_version(tx: Transaction) -> int:
+    rows = tx.query("SELECT MAX(version) as version FROM schema_version")
+    return (rows[0]['version'] or 0) if rows else 0
+
+def get_schema_version() -> int:
+    """Gibt die aktuell angewendete Schema-Version zurück (0 = keine Migrationen)"""
+    with transaction() as tx:
+        _ensure_version_table(tx)
+        return _current_version(tx)
+
+def is_schema_current() -> bool:
+    """True, wenn alle Migrationen angewendet sind (reine Leseabfrage, legt nichts an)"""
+    try:
+        rows = execute_query("SELECT MAX(version) as version FROM schema_version")
+    except Exception:
+        # Tabelle fehlt noch (neue Datenbank)
+        return False
+    return bool(rows) and (rows[0]['version'] or 0) >= LATEST_VERSION
+
+def run_migrations() -> List[int]:
+    """Wendet alle ausstehenden Migrationen in Reihenfolge an und gibt ihre Versionen zurück
+
+    Läuft in einer einzigen Transaktion mit Schreibsperre, damit parallel startende
+    Prozesse (z.B. mehrere Worker) Migrationen nicht doppelt ausführen.
+    """
+    applied = []
+    with transaction(immediate=True) as tx:
+        if USE_POSTGRESQL:
+            tx.query("SELECT pg_advisory_xact_lock(?)", (MIGRATION_LOCK_ID,))
+        _ensure_version_table(tx)
+        current = _current_version(tx)
+
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            migrate(tx)
+            tx.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                       (version, description))
+            applied.append(version)
+
+    return applied
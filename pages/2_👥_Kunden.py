@@ -1,6 +1,9 @@
 import streamlit as st
 import pandas as pd
 from database import execute_query, execute_update
+from customers import list_customers
+from customer_search import refresh_customer
+from crm_retrieval import refresh_record
 from utils.styles import apply_custom_styles, navbar_component
 
 # Apply Styles
@@ -8,16 +11,48 @@ apply_custom_styles()
 navbar_component()
 st.title("👥 Kundenverwaltung")
 
+PAGE_SIZE = 50
+
 # Helper Functions
-def get_customers():
-    return execute_query("SELECT * FROM customers ORDER BY last_name, first_name")
+def get_customers(search=None, after=None):
+    """Eine Seite Kunden (serverseitig gefiltert) und der Cursor der nächsten Seite"""
+    return list_customers(PAGE_SIZE, after, search, columns="*")
+
+def get_loyalty_customers():
+    return execute_query("""
+        SELECT first_name, last_name, loyalty_points FROM customers
+        WHERE loyalty_points > 0
+        ORDER BY loyalty_points DESC
+        LIMIT 100
+    """)
 
 # Tabs
 tab1, tab2, tab3 = st.tabs(["Kundenliste", "Neuer Kunde", "Treueprogramm"])
 
 # --- TAB 1: LIST ---
 with tab1:
-    customers = get_customers()
+    search = st.text_input("🔍 Suche (Name, E-Mail, Telefon)", key="customer_search")
+    
+    # Cursor-Stapel für Vor/Zurück; neue Suche beginnt wieder auf Seite 1
+    if st.session_state.get('customer_search_last') != search:
+        st.session_state.customer_cursors = [None]
+        st.session_state.customer_search_last = search
+    cursors = st.session_state.setdefault('customer_cursors', [None])
+    
+    customers, next_cursor = get_customers(search, cursors[-1])
+    
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("◀ Zurück", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col_page:
+        st.caption(f"Seite {len(cursors)}")
+    with col_next:
+        if st.button("Weiter ▶", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+    
     if customers:
         df = pd.DataFrame(customers)
         # Display specific columns
@@ -71,6 +106,8 @@ with tab1:
                         WHERE id = ?
                     """, (new_first_name, new_last_name, new_email, new_phone, 
                           new_address, new_notes, customer_id))
+                    refresh_customer(customer_id)
+                    refresh_record('customer', customer_id)
                     st.success("Kunde erfolgreich aktualisiert!")
                     st.rerun()
         st.markdown("</div>", unsafe_allow_html=True)
@@ -100,11 +137,13 @@ with tab2:
         submitted = st.form_submit_button("✅ Kunde speichern")
         if submitted:
             if first_name and last_name:
-                execute_update("""
+                new_id = execute_update("""
                     INSERT INTO customers (first_name, last_name, email, phone, address, birthdate, notes)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
                 """, (first_name, last_name, email or None, phone or None, 
                       address or None, str(birthdate) if birthdate else None, notes or None))
+                refresh_customer(new_id)
+                refresh_record('customer', new_id)
                 st.success("Kunde erfolgreich angelegt!")
                 st.rerun()
             else:
@@ -114,38 +153,36 @@ with tab2:
 # --- TAB 3: LOYALTY ---
 with tab3:
     st.subheader("🏆 Treueprogramm Übersicht")
-    customers = get_customers()
-    if customers:
-        df_loyalty = pd.DataFrame(customers)
-        df_loyalty = df_loyalty[df_loyalty['loyalty_points'] > 0].sort_values('loyalty_points', ascending=False)
+    loyalty_customers = get_loyalty_customers()
+    if loyalty_customers:
+        df_loyalty = pd.DataFrame(loyalty_customers)
         
-        if not df_loyalty.empty:
-            st.dataframe(
-                df_loyalty[['first_name', 'last_name', 'loyalty_points']], 
-                use_container_width=True, 
-                hide_index=True,
-                column_config={
-                    "loyalty_points": st.column_config.ProgressColumn(
-                        "Punkte",
-                        format="%d",
-                        min_value=0,
-                        max_value=1000,
-                    ),
-                }
-            )
-            
-            # Top Customers Cards
-            st.markdown("### Top Kunden")
-            cols = st.columns(3)
-            for idx, row in enumerate(df_loyalty.head(3).itertuples()):
-                with cols[idx]:
-                    st.markdown(f"""
-                        <div class="css-card" style="text-align: center;">
-                            <div style="font-size: 2rem;">👑</div>
-                            <div style="font-weight: bold; margin-top: 0.5rem;">{row.first_name} {row.last_name}</div>
-                            <div style="color: #3b82f6; font-size: 1.5rem; font-weight: bold;">{row.loyalty_points} Pkt</div>
-                        </div>
-                    """, unsafe_allow_html=True)
-            
-        else:
-            st.info("Noch keine Treuepunkte vergeben")
+        st.dataframe(
+            df_loyalty[['first_name', 'last_name', 'loyalty_points']], 
+            use_container_width=True, 
+            hide_index=True,
+            column_config={
+                "loyalty_points": st.column_config.ProgressColumn(
+                    "Punkte",
+                    format="%d",
+                    min_value=0,
+                    max_value=1000,
+                ),
+            }
+        )
+        
+        # Top Customers Cards
+        st.markdown("### Top Kunden")
+        cols = st.columns(3)
+        for idx, row in enumerate(df_loyalty.head(3).itertuples()):
+            with cols[idx]:
+                st.markdown(f"""
+                    <div class="css-card" style="text-align: center;">
+                        <div style="font-size: 2rem;">👑</div>
+                        <div style="font-weight: bold; margin-top: 0.5rem;">{row.first_name} {row.last_name}</div>
+                        <div style="color: #3b82f6; font-size: 1.5rem; font-weight: bold;">{row.loyalty_points} Pkt</div>
+                    </div>
+                """, unsafe_allow_html=True)
+        
+    else:
+        st.info("Noch keine Treuepunkte vergeben")
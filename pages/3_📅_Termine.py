@@ -3,11 +3,13 @@ import pandas as pd
 from datetime import datetime, timedelta, time
 from database import execute_query, execute_update, get_connection
 from utils.styles import apply_custom_styles, navbar_component
+from utils.customer_picker import customer_picker
 from booking_system import (
-    get_available_time_slots, check_availability, 
-    get_weekly_calendar, get_employee_schedule
+    get_available_time_slots, check_availability, create_appointment,
+    get_weekly_calendar, get_employee_schedule, BookingConflictError
 )
 from simplybook_features import create_recurring_appointments, create_group_booking
+from availability import OPENING_TIME, CLOSING_TIME, SLOT_MINUTES
 
 # Apply Styles
 apply_custom_styles()
@@ -15,9 +17,6 @@ navbar_component()
 st.title("📅 Terminbuchung")
 
 # Helper Functions
-def get_customers():
-    return execute_query("SELECT * FROM customers ORDER BY last_name, first_name")
-
 def get_services():
     return execute_query("SELECT * FROM services WHERE active = 1 ORDER BY category, name")
 
@@ -74,9 +73,9 @@ with tab1:
                     with cols[idx + 1]:
                         st.markdown(f"**{emp['first_name']}**")
                 
-                # Time slots 9:00 - 18:00
-                current = datetime.combine(selected_date, time(9, 0))
-                end = datetime.combine(selected_date, time(18, 0))
+                # Time slots (Öffnungszeiten aus availability)
+                current = datetime.combine(selected_date, datetime.strptime(OPENING_TIME, "%H:%M").time())
+                end = datetime.combine(selected_date, datetime.strptime(CLOSING_TIME, "%H:%M").time())
                 
                 while current < end:
                     slot_time = current.time()
@@ -108,7 +107,7 @@ with tab1:
                                         </div>
                                     """, unsafe_allow_html=True)
                     
-                    current += timedelta(minutes=30)
+                    current += timedelta(minutes=SLOT_MINUTES)
             else:
                 st.info("Keine Mitarbeiter angelegt. Zeige Listenansicht.")
                 df = pd.DataFrame(appointments)
@@ -130,7 +129,6 @@ with tab2:
     st.markdown("<div class='css-card'>", unsafe_allow_html=True)
     st.subheader("Termin buchen")
     
-    customers = get_customers()
     services = get_services()
     employees = execute_query("SELECT * FROM employees WHERE active = 1")
     
@@ -200,12 +198,7 @@ with tab2:
                 new_customer_data = {}
                 
                 if customer_method == "Bestandskunde":
-                    if customers:
-                         c_options = {f"{c['first_name']} {c['last_name']}": c['id'] for c in customers}
-                         c_name = st.selectbox("Kunde auswählen", list(c_options.keys()))
-                         customer_id = c_options[c_name]
-                    else:
-                        st.warning("Keine Bestandskunden gefunden.")
+                    customer_id = customer_picker("Kunde auswählen", key="booking_customer")
                 else:
                     col_c1, col_c2 = st.columns(2)
                     with col_c1:
@@ -229,8 +222,12 @@ with tab2:
                                 INSERT INTO customers (first_name, last_name, email, phone)
                                 VALUES (?, ?, ?, ?)
                             """, (new_first_name, new_last_name, new_email, new_phone))
+                        elif customer_id is None:
+                            st.error("Bitte einen Kunden suchen und auswählen.")
+                            st.stop()
                         
-                        # Final Availability Check
+                        # Vorabprüfung für eine schnelle Meldung; verbindlich reservieren erst die
+                        # Buchungsfunktionen in ihrer Transaktion (BookingConflictError unten)
                         is_avail, msg = check_availability(date_str, selected_time, employee_id, selected_service['duration'] or 60)
                         
                         if is_avail:
@@ -245,12 +242,8 @@ with tab2:
                                 create_group_booking([customer_id], selected_service['id'], date_str, selected_time, employee_id)
                                 msg_success = "Gruppenbuchung erstellt!"
                             else:
-                                execute_update("""
-                                    INSERT INTO appointments (customer_id, service_id, employee_id, 
-                                                            appointment_date, appointment_time, duration, notes, status, group_size)
-                                    VALUES (?, ?, ?, ?, ?, ?, ?, 'geplant', ?)
-                                """, (customer_id, selected_service['id'], employee_id, 
-                                      date_str, selected_time, selected_service['duration'], notes, group_size))
+                                create_appointment(customer_id, selected_service['id'], date_str, selected_time,
+                                                   employee_id, selected_service['duration'] or 60, notes, group_size)
                                 msg_success = "Termin gebucht!"
                             
                             st.success(f"✅ {msg_success}")
@@ -259,6 +252,8 @@ with tab2:
                             st.rerun()
                         else:
                             st.error(f"❌ {msg}")
+                    except BookingConflictError as e:
+                        st.error(f"❌ {e}")
                     except Exception as e:
                         st.error(f"Fehler: {e}")
             
@@ -1,8 +1,9 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
-from database import execute_query, execute_update
+from database import execute_query
+from sales_system import create_sale
 from utils.styles import apply_custom_styles, navbar_component
+from utils.customer_picker import customer_picker
 
 # Apply Styles
 apply_custom_styles()
@@ -10,9 +11,6 @@ navbar_component()
 st.title("💰 Kasse")
 
 # Helper Functions
-def get_customers():
-    return execute_query("SELECT * FROM customers ORDER BY last_name, first_name")
-
 def get_services():
     return execute_query("SELECT * FROM services WHERE active = 1 ORDER BY category, name")
 
@@ -31,19 +29,11 @@ with col_selection:
     st.markdown("<div class='css-card'>", unsafe_allow_html=True)
     st.subheader("Artikel hinzufügen")
     
-    customers = get_customers()
     services = get_services()
     products = get_products()
     
     # Customer Selection
-    if customers:
-        customer_options = {f"{c['first_name']} {c['last_name']}": c['id'] for c in customers}
-        customer_options["Laufkunde"] = None
-        selected_customer_name = st.selectbox("Kunde", list(customer_options.keys()))
-        customer_id = customer_options[selected_customer_name]
-    else:
-        st.warning("Keine Kunden gefunden.")
-        customer_id = None
+    customer_id = customer_picker("Kunde", key="pos_customer", none_option="Laufkunde")
 
     st.markdown("---")
     
@@ -142,30 +132,7 @@ with col_cart:
         
         if st.button("💳 Bezahlen & Abschließen", type="primary", use_container_width=True):
             try:
-                now = datetime.now()
-                sale_id = execute_update("""
-                    INSERT INTO sales (customer_id, sale_date, sale_time, total_amount, 
-                                     payment_method, discount, loyalty_points_used)
-                    VALUES (?, ?, ?, ?, ?, ?, 0)
-                """, (customer_id, now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S"), 
-                      final_total, payment_method, discount))
-                
-                # Items
-                for item in st.session_state.cart:
-                    execute_update("""
-                        INSERT INTO sale_items (sale_id, item_type, item_id, item_name, quantity, price)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (sale_id, item['type'], item['id'], item['name'], item['quantity'], item['price']))
-                    
-                    # Stock Update
-                    if item['type'] == 'product':
-                         execute_update("UPDATE products SET stock_quantity = stock_quantity - ? WHERE id = ?", (item['quantity'], item['id']))
-
-                # Loyalty Points (1 Point per 10€)
-                if customer_id:
-                    points = int(final_total / 10)
-                    if points > 0:
-                        execute_update("UPDATE customers SET loyalty_points = loyalty_points + ? WHERE id = ?", (points, customer_id))
+                create_sale(customer_id, st.session_state.cart, payment_method, discount)
                 
                 # Reset Cart
                 st.session_state.cart = []
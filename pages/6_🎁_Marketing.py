@@ -4,7 +4,10 @@ from datetime import datetime, timedelta
 import random
 import string
 from database import execute_query, execute_update
+from customer_search import refresh_customer
+from crm_retrieval import refresh_record
 from utils.styles import apply_custom_styles, navbar_component
+from utils.customer_picker import customer_picker
 
 # Apply Styles
 apply_custom_styles()
@@ -12,8 +15,12 @@ navbar_component()
 st.title("🎁 Marketing & Gutscheine")
 
 # Helper Functions
-def get_customers():
-    return execute_query("SELECT * FROM customers ORDER BY last_name, first_name")
+def get_loyalty_customers():
+    return execute_query("""
+        SELECT first_name, last_name, loyalty_points FROM customers
+        ORDER BY loyalty_points DESC
+        LIMIT 100
+    """)
 
 # Tabs
 tab1, tab2 = st.tabs(["Gutscheine", "Treuepunkte"])
@@ -26,17 +33,12 @@ with tab1:
         st.markdown("<div class='css-card'>", unsafe_allow_html=True)
         st.subheader("Gutschein erstellen")
         
-        customers = get_customers()
-        c_opts = {f"{c['first_name']} {c['last_name']}": c['id'] for c in customers}
-        c_opts["Allgemein (Ungebunden)"] = None
-        
-        selected_customer = st.selectbox("Für Kunde", list(c_opts.keys()))
+        customer_id = customer_picker("Für Kunde", key="voucher_customer", none_option="Allgemein (Ungebunden)")
         amount = st.number_input("Betrag (€)", 10.0, 500.0, 50.0, step=5.0)
         valid_until = st.date_input("Gültig bis", value=datetime.now() + timedelta(days=365))
         
         if st.button("🎁 Erstellen", type="primary"):
             code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-            customer_id = c_opts[selected_customer]
             
             execute_update("""
                 INSERT INTO vouchers (code, customer_id, amount, valid_until)
@@ -79,9 +81,9 @@ with tab1:
 with tab2:
     st.subheader("Treuepunkte Verwaltung")
     
-    if customers:
-        df_loyalty = pd.DataFrame(customers)
-        df_loyalty = df_loyalty.sort_values('loyalty_points', ascending=False)
+    loyalty_customers = get_loyalty_customers()
+    if loyalty_customers:
+        df_loyalty = pd.DataFrame(loyalty_customers)
         
         st.dataframe(
             df_loyalty[['first_name', 'last_name', 'loyalty_points']], 
@@ -98,13 +100,17 @@ with tab2:
         
         st.markdown("<div class='css-card'>", unsafe_allow_html=True)
         st.subheader("Punkte manuell anpassen")
-        c_sel_name = st.selectbox("Kunde auswählen", list(c_opts.keys())[:-1]) # Remove Allgemein
-        c_sel_id = c_opts[c_sel_name]
+        c_sel_id = customer_picker("Kunde auswählen", key="points_customer")
         
         points_change = st.number_input("Punkte (+/-)", -500, 500, 0)
         
-        if st.button("💾 Speichern"):
-            execute_update("UPDATE customers SET loyalty_points = loyalty_points + ? WHERE id = ?", (points_change, c_sel_id))
+        if st.button("💾 Speichern", disabled=c_sel_id is None):
+            execute_update("""
+                UPDATE customers SET loyalty_points = loyalty_points + ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (points_change, c_sel_id))
+            refresh_customer(c_sel_id)
+            refresh_record('customer', c_sel_id)
             st.success("Punkte aktualisiert.")
             st.rerun()
         st.markdown("</div>", unsafe_allow_html=True)
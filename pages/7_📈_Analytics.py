@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from database import execute_query
+from analytics import (
+    days_ago, get_daily_revenue, get_revenue_by_payment_method, get_service_stats, get_top_customers
+)
 from utils.styles import apply_custom_styles, navbar_component
 
 # Apply Styles
@@ -22,13 +24,7 @@ with tab1:
         days_map = {"Letzte 7 Tage": 7, "Letzte 30 Tage": 30, "Letzte 90 Tage": 90, "Dieses Jahr": 365}
         days = days_map[date_range]
     
-    sales_data = execute_query("""
-        SELECT sale_date, SUM(total_amount - discount) as total, COUNT(*) as count
-        FROM sales
-        WHERE sale_date >= date('now', '-' || ? || ' days')
-        GROUP BY sale_date
-        ORDER BY sale_date
-    """, (days,))
+    sales_data = get_daily_revenue(days_ago(days))
     
     if sales_data:
         df = pd.DataFrame(sales_data)
@@ -58,21 +54,29 @@ with tab1:
         )
         st.plotly_chart(fig, use_container_width=True)
         st.markdown("</div>", unsafe_allow_html=True)
+        
+        # Zahlungsarten
+        payment_data = get_revenue_by_payment_method(days_ago(days))
+        if payment_data:
+            df_pay = pd.DataFrame(payment_data)
+            df_pay['payment_method'] = df_pay['payment_method'].replace('', 'Unbekannt')
+            st.dataframe(
+                df_pay,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "payment_method": "Zahlungsart",
+                    "total": st.column_config.NumberColumn("Umsatz", format="€%.2f"),
+                    "count": "Transaktionen"
+                }
+            )
     else:
         st.info("Keine Daten für diesen Zeitraum.")
 
 # --- TAB 2: SERVICES ---
 with tab2:
     st.subheader("Dienstleistungsanalyse")
-    service_stats = execute_query("""
-        SELECT s.name, s.category, COUNT(si.id) as count, SUM(si.price) as revenue
-        FROM sale_items si
-        JOIN services s ON si.item_id = s.id
-        WHERE si.item_type = 'service'
-        AND si.sale_id IN (SELECT id FROM sales WHERE sale_date >= date('now', '-30 days'))
-        GROUP BY s.id, s.name, s.category
-        ORDER BY count DESC
-    """)
+    service_stats = get_service_stats(days_ago(30))
     
     if service_stats:
         df = pd.DataFrame(service_stats)
@@ -95,36 +99,33 @@ with tab2:
             st.markdown("</div>", unsafe_allow_html=True)
             
         with col_t:
-             st.dataframe(df[['name', 'count', 'revenue']], use_container_width=True, hide_index=True)
+             st.dataframe(df[['name', 'count', 'revenue', 'avg_ticket']], use_container_width=True, hide_index=True,
+                          column_config={
+                              "name": "Service",
+                              "count": "Anzahl",
+                              "revenue": st.column_config.NumberColumn("Umsatz", format="€%.2f"),
+                              "avg_ticket": st.column_config.NumberColumn("Ø Bon", format="€%.2f")
+                          })
     else:
         st.info("Keine Daten.")
 
 # --- TAB 3: CUSTOMERS ---
 with tab3:
     st.subheader("Kundenanalyse (Top 20)")
-    customer_stats = execute_query("""
-        SELECT c.first_name || ' ' || c.last_name as name, 
-               COUNT(s.id) as visits,
-               SUM(s.total_amount - s.discount) as total_spent,
-               c.loyalty_points
-        FROM customers c
-        LEFT JOIN sales s ON c.id = s.customer_id
-        GROUP BY c.id, c.first_name, c.last_name, c.loyalty_points
-        HAVING visits > 0
-        ORDER BY total_spent DESC
-        LIMIT 20
-    """)
+    customer_stats = get_top_customers(20)
     
     if customer_stats:
         df = pd.DataFrame(customer_stats)
         st.dataframe(
-            df, 
+            df[['name', 'visits', 'total_spent', 'avg_ticket', 'last_visit', 'loyalty_points']], 
             use_container_width=True, 
             hide_index=True,
             column_config={
                 "name": "Kunde",
                 "visits": "Besuche",
                 "total_spent": st.column_config.NumberColumn("Gesamtausgaben", format="€%.2f"),
+                "avg_ticket": st.column_config.NumberColumn("Ø Bon", format="€%.2f"),
+                "last_visit": "Letzter Besuch",
                 "loyalty_points": "Punkte"
             }
         )
@@ -0,0 +1,179 @@
+"""
+Antwort-Cache für den AI Assistant
+Wiederholte Fragen (gleiche Frage nach Normalisierung, gleiches Modell, unveränderte
+CRM-Daten) werden aus dem Cache beantwortet statt neu generiert.
+"""
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", "600"))  # Sekunden
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "256"))
+# Optionale Datei, damit der Cache Neustarts übersteht (leer = nur im Speicher)
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "").strip()
+# Sekunden zwischen erster Änderung und Speichern; weitere Antworten in der Zeit gehen in dieselbe Datei
+AI_CACHE_SAVE_DELAY = float(os.getenv("AI_CACHE_SAVE_DELAY", "5"))
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_prompt(text: str) -> str:
+    """Kleinschreibung ohne Akzente, Satzzeichen und doppelte Leerzeichen
+    ('Wie viele Termine heute?' == 'wie viele  termine heute')"""
+    text = (text or "").lower().replace("ß", "ss")
+    text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return _WHITESPACE_RE.sub(" ", _PUNCTUATION_RE.sub(" ", text)).strip()
+
+def make_key(prompt: str, model: str, context: Optional[str] = None) -> str:
+    """Cache-Schlüssel aus normalisierter Frage, Modell und Hash des CRM-Kontexts"""
+    context_hash = hashlib.sha256((context or "").encode("utf-8")).hexdigest()
+    raw = f"{model}\0{normalize_prompt(prompt)}\0{context_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Thread-sicherer LRU-Cache für AI-Antworten mit TTL und optionaler JSON-Datei
+
+    Ablaufzeiten sind Unix-Zeitstempel, damit sie auch nach dem Laden aus der Datei gelten.
+    Die Datei wird verzögert (save_delay) und beim Beenden geschrieben, nicht bei jedem put().
+    """
+
+    def __init__(self, ttl: float = AI_CACHE_TTL, max_entries: int = AI_CACHE_MAX_ENTRIES,
+                 path: Optional[str] = AI_CACHE_PATH or None, save_delay: float = AI_CACHE_SAVE_DELAY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.save_delay = save_delay
+        self._entries = OrderedDict()  # Schlüssel -> (Ablaufzeit, Antwort)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # nur ein Schreibvorgang gleichzeitig (gemeinsame .tmp-Datei)
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.saves = 0
+        if self.path:
+            self._load()
+            atexit.register(self.flush)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if self.path:
+                self._schedule_save()
+        if self.path and self.save_delay <= 0:
+            self.flush()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path:
+                self._schedule_save()
+        if self.path and self.save_delay <= 0:
+            self.flush()
+
+    def _schedule_save(self):
+        """Markiert den Cache als geändert und startet den Speicher-Timer (nur unter self._lock)"""
+        self._dirty = True
+        if self._timer is None and self.save_delay > 0:
+            self._timer = threading.Timer(self.save_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Schreibt ausstehende Änderungen sofort (Timer, Herunterfahren)
+
+        Unter der Sperre wird nur eine Kopie der Einträge gezogen; Serialisieren und Schreiben
+        laufen ohne sie, damit get() und put() nicht auf die Platte warten.
+        """
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                timer, self._timer = self._timer, None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                entries = [[key, expires, response] for key, (expires, response) in self._entries.items()]
+            if timer is not None:
+                timer.cancel()
+            if self._save(entries):
+                with self._lock:
+                    self.saves += 1
+            else:
+                # Beim nächsten put() oder flush() erneut versuchen
+                with self._lock:
+                    self._dirty = True
+
+    def _load(self):
+        """Liest noch gültige Einträge aus der Datei (fehlende oder defekte Datei = leerer Cache)"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, expires, response in entries[-self.max_entries:]:
+            if expires > now:
+                self._entries[key] = (expires, response)
+
+    def _save(self, entries: list) -> bool:
+        """Schreibt den Cache atomar (temporäre Datei + Umbenennen); Fehler nur protokollieren"""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            print(f"AI-Cache konnte nicht gespeichert werden: {e}")
+            return False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'ttl': self.ttl,
+                'persistent': bool(self.path),
+                'saves': self.saves,
+                'pending_save': self._dirty,
+            }
+
+response_cache = ResponseCache()
+
+def get_response_cache_stats() -> Dict:
+    """Gibt Hit/Miss-Zähler des AI-Antwort-Caches zurück"""
+    return response_cache.stats()
@@ -0,0 +1,49 @@
+"""
+Kassen- und Verkaufsfunktionen
+"""
+from datetime import datetime
+from typing import List, Dict, Optional
+from database import transaction
+from analytics import add_sale_to_rollup, add_services_to_rollup, add_sale_to_customer_stats
+
+def create_sale(customer_id: Optional[int], items: List[Dict], payment_method: str,
+                discount: float = 0.0, location_id: Optional[int] = None) -> int:
+    """Bucht einen Verkauf atomar: Verkauf, Positionen, Lagerbestand, Treuepunkte und Tages-Rollup
+
+    items: Liste von Dictionaries mit 'type' ('service'/'product'), 'id', 'name', 'quantity', 'price'
+    """
+    now = datetime.now()
+    sale_date = now.strftime("%Y-%m-%d")
+    total = sum(item['price'] * item['quantity'] for item in items)
+
+    with transaction() as tx:
+        sale_id = tx.execute("""
+            INSERT INTO sales (customer_id, sale_date, sale_time, total_amount,
+                              payment_method, discount, loyalty_points_used, location_id)
+            VALUES (?, ?, ?, ?, ?, ?, 0, ?)
+        """, (customer_id, sale_date, now.strftime("%H:%M:%S"),
+              total, payment_method, discount, location_id))
+
+        tx.executemany("""
+            INSERT INTO sale_items (sale_id, item_type, item_id, item_name, quantity, price)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(sale_id, item['type'], item['id'], item['name'], item['quantity'], item['price'])
+              for item in items])
+
+        # Lagerbestand reduzieren
+        tx.executemany("UPDATE products SET stock_quantity = stock_quantity - ? WHERE id = ?",
+                       [(item['quantity'], item['id']) for item in items if item['type'] == 'product'])
+
+        # Treuepunkte (1 Punkt pro 10€)
+        if customer_id:
+            points = int((total - discount) / 10)
+            if points > 0:
+                tx.execute("UPDATE customers SET loyalty_points = loyalty_points + ? WHERE id = ?",
+                           (points, customer_id))
+
+        add_sale_to_rollup(tx, sale_date, location_id, payment_method, total, discount)
+        add_services_to_rollup(tx, sale_date, location_id, items)
+        if customer_id:
+            add_sale_to_customer_stats(tx, customer_id, sale_date, total - discount)
+
+    return sale_id
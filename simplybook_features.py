@@ -3,7 +3,8 @@ SimplyBook.me ähnliche Features
 """
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
-from database import execute_query, execute_update
+from database import execute_query, execute_update, transaction
+from booking_system import BookingConflictError, create_appointment, reserve_slot
 import re
 
 def create_recurring_appointments(customer_id: int, service_id: int, start_date: str, 
@@ -23,53 +24,56 @@ def create_recurring_appointments(customer_id: int, service_id: int, start_date:
     
     parent_id = None
     
-    for i in range(count):
-        date_str = current_date.strftime("%Y-%m-%d")
-        
-        # Erstelle Termin
-        apt_id = execute_update("""
-            INSERT INTO appointments (customer_id, service_id, employee_id, 
-                                    appointment_date, appointment_time, duration,
-                                    is_recurring, recurring_pattern, parent_appointment_id)
-            VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)
-        """, (customer_id, service_id, employee_id, date_str, current_time, 
-              duration, pattern, parent_id))
-        
-        if i == 0:
-            parent_id = apt_id
-            # Aktualisiere parent_appointment_id für den ersten Termin
-            execute_update("UPDATE appointments SET parent_appointment_id = ? WHERE id = ?", 
-                         (apt_id, apt_id))
-        
-        appointment_ids.append(apt_id)
-        
-        # Berechne nächstes Datum
-        if pattern == 'daily':
-            current_date += timedelta(days=1)
-        elif pattern == 'weekly':
-            current_date += timedelta(weeks=1)
-        elif pattern == 'monthly':
-            # Einfache Monatsberechnung
-            if current_date.month == 12:
-                current_date = current_date.replace(year=current_date.year + 1, month=1)
-            else:
-                current_date = current_date.replace(month=current_date.month + 1)
+    # Die ganze Serie wird atomar mit einem Commit angelegt; jeder Termin reserviert sein
+    # Zeitfenster wie create_appointment (wirft BookingConflictError, dann wird nichts gebucht)
+    with transaction(immediate=True) as tx:
+        for i in range(count):
+            date_str = current_date.strftime("%Y-%m-%d")
+            try:
+                reserve_slot(tx, date_str, current_time, employee_id, duration)
+            except BookingConflictError as e:
+                raise BookingConflictError(f"{date_str} {current_time}: {e}") from e
+            
+            # Erstelle Termin
+            apt_id = tx.execute("""
+                INSERT INTO appointments (customer_id, service_id, employee_id, 
+                                        appointment_date, appointment_time, duration,
+                                        is_recurring, recurring_pattern, parent_appointment_id)
+                VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)
+            """, (customer_id, service_id, employee_id, date_str, current_time, 
+                  duration, pattern, parent_id))
+            
+            if i == 0:
+                parent_id = apt_id
+                # Aktualisiere parent_appointment_id für den ersten Termin
+                tx.execute("UPDATE appointments SET parent_appointment_id = ? WHERE id = ?", 
+                           (apt_id, apt_id))
+            
+            appointment_ids.append(apt_id)
+            
+            # Berechne nächstes Datum
+            if pattern == 'daily':
+                current_date += timedelta(days=1)
+            elif pattern == 'weekly':
+                current_date += timedelta(weeks=1)
+            elif pattern == 'monthly':
+                # Einfache Monatsberechnung
+                if current_date.month == 12:
+                    current_date = current_date.replace(year=current_date.year + 1, month=1)
+                else:
+                    current_date = current_date.replace(month=current_date.month + 1)
     
     return appointment_ids
 
 def create_group_booking(customer_ids: List[int], service_id: int, date: str, 
                          time: str, employee_id: Optional[int]) -> int:
-    """Erstellt eine Gruppenbuchung für mehrere Kunden"""
+    """Erstellt eine Gruppenbuchung für mehrere Kunden (wirft BookingConflictError bei belegtem Zeitfenster)"""
     service = execute_query("SELECT duration FROM services WHERE id = ?", (service_id,))
     duration = service[0]['duration'] if service else 60
     
-    # Erstelle einen Haupttermin
-    main_apt_id = execute_update("""
-        INSERT INTO appointments (customer_id, service_id, employee_id, 
-                                appointment_date, appointment_time, duration,
-                                group_size, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, 'geplant')
-    """, (customer_ids[0], service_id, employee_id, date, time, duration, len(customer_ids)))
+    # Erstelle einen Haupttermin (Zeitfenster atomar reserviert)
+    main_apt_id = create_appointment(customer_ids[0], service_id, date, time, employee_id, duration,
+                                     group_size=len(customer_ids))
     
     # Erstelle zusätzliche Termine für andere Gruppenmitglieder (optional)
     # Oder speichere alle Kunden-IDs in einem separaten Feld
@@ -0,0 +1,22 @@
+"""
+Gemeinsame Fixtures: jede Test-Datenbank ist eine frische SQLite-Datei im tmp-Verzeichnis
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Initialisierte SQLite-Datenbank (Tabellen, Migrationen, Stammdaten) für einen Test"""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "test.db"))
+    database.close_pool()
+    database.query_cache.clear()
+    database.init_database()
+    yield database
+    database.close_pool()
+    database.query_cache.clear()
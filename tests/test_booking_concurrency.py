@@ -0,0 +1,98 @@
+"""
+Parallele Buchungen desselben Zeitfensters: genau eine darf gelingen (BEGIN IMMEDIATE / Advisory-Lock)
+"""
+import threading
+
+import pytest
+
+from booking_system import BookingConflictError, create_appointment, create_online_booking
+
+THREADS = 16
+DATE = "2031-03-04"
+
+def _run_parallel(book, count: int = THREADS):
+    """Startet `count` Buchungen gleichzeitig (Barrier) und sammelt Termin-IDs bzw. Fehler"""
+    barrier = threading.Barrier(count)
+    results, errors = [], []
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results.append(book(i))
+        except BookingConflictError:
+            errors.append("conflict")
+        except Exception as e:  # z.B. "database is locked" wäre ein Fehler der Sperrlogik
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+def _active_bookings(db):
+    query = "SELECT * FROM appointments WHERE appointment_date = ? AND employee_id = 1 AND status != 'abgesagt'"
+    return db.execute_query(query, (DATE,))
+
+@pytest.mark.parametrize("round_", range(3))
+def test_same_slot_booked_exactly_once(db, round_):
+    results, errors = _run_parallel(
+        lambda i: create_appointment(1, 1, DATE, "10:00", 1, 60, notes=f"Thread {i}"))
+
+    assert len(results) == 1
+    assert errors == ["conflict"] * (THREADS - 1)
+    assert [row['id'] for row in _active_bookings(db)] == results
+
+def test_overlapping_slots_booked_exactly_once(db):
+    # 10:00, 10:30, 11:00 ... mit je 90 Minuten überschneiden sich paarweise mit 10:00 bis 11:00
+    times = ["10:00", "10:30", "11:00", "10:15"] * 4
+    results, errors = _run_parallel(
+        lambda i: create_appointment(1, 1, DATE, times[i], 1, 90), count=len(times))
+
+    bookings = _active_bookings(db)
+    assert len(results) == len(bookings) == 1
+    assert all(error == "conflict" for error in errors)
+
+def test_online_bookings_same_slot_booked_exactly_once(db):
+    results, errors = _run_parallel(lambda i: create_online_booking(
+        {'first_name': "Gast", 'last_name': str(i), 'email': f"gast{i}@example.com"},
+        1, DATE, "14:00", 1))
+
+    assert len(results) == 1
+    assert errors == ["conflict"] * (THREADS - 1)
+    # Verlierer legen auch keinen Kunden an (Rollback der ganzen Transaktion)
+    assert len(db.execute_query("SELECT id FROM customers WHERE email LIKE 'gast%'")) == 1
+
+def test_group_bookings_same_slot_booked_exactly_once(db):
+    from simplybook_features import create_group_booking
+
+    results, errors = _run_parallel(lambda i: create_group_booking([1, 2], 1, DATE, "15:00", 1))
+
+    assert len(results) == 1
+    assert errors == ["conflict"] * (THREADS - 1)
+    assert [(row['id'], row['group_size']) for row in _active_bookings(db)] == [(results[0], 2)]
+
+def test_recurring_series_booked_all_or_nothing(db):
+    from simplybook_features import create_recurring_appointments
+
+    results, errors = _run_parallel(
+        lambda i: create_recurring_appointments(1, 1, DATE, "16:00", 1, "weekly", 3))
+
+    assert len(results) == 1 and len(results[0]) == 3
+    assert errors == ["conflict"] * (THREADS - 1)
+    # Verlierer hinterlassen keine Teilserie
+    rows = db.execute_query("SELECT id FROM appointments WHERE employee_id = 1 AND appointment_time = '16:00'")
+    assert sorted(row['id'] for row in rows) == sorted(results[0])
+
+def test_api_create_appointment_rejects_double_booking(db):
+    from fastapi.testclient import TestClient
+    import api
+
+    payload = {"customer_id": 1, "service_id": 1, "employee_id": 1,
+               "appointment_date": DATE, "appointment_time": "11:00"}
+    with TestClient(api.app) as client:
+        responses, _ = _run_parallel(lambda i: client.post("/api/appointments", json=payload), count=8)
+
+    assert sorted(r.status_code for r in responses) == [200] + [409] * 7
+    assert len(_active_bookings(db)) == 1
@@ -0,0 +1,36 @@
+"""
+Kaltstart der API (Vercel): Importzeit und keine schweren Module beim Import
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Vorher ~1,2 s (pandas, requests, httpx, AI-Stack), jetzt ~0,6 s auf 1 vCPU
+IMPORT_BUDGET_SECONDS = 1.0
+# Dürfen erst in den Routen bzw. Seiten geladen werden, die sie brauchen
+LAZY_MODULES = ("pandas", "numpy", "requests", "httpx", "ai_assistant")
+
+_PROBE = f"""
+import json, sys, time
+sys.path.insert(0, {ROOT!r})
+start = time.perf_counter()
+import api
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+def _import_api(tmp_path) -> dict:
+    """Importiert api in einem frischen Interpreter und gibt Dauer und geladene Module zurück"""
+    result = subprocess.run([sys.executable, "-c", _PROBE], cwd=tmp_path, capture_output=True,
+                            text=True, timeout=60, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_import_api_skips_heavy_modules(tmp_path):
+    assert _import_api(tmp_path)["loaded"] == []
+
+def test_import_api_within_budget(tmp_path):
+    # Bester von drei Läufen, damit ein kurz ausgelasteter Rechner den Test nicht kippt
+    best = min(_import_api(tmp_path)["seconds"] for _ in range(3))
+    assert best < IMPORT_BUDGET_SECONDS, f"import api dauerte {best:.2f} s (Budget {IMPORT_BUDGET_SECONDS} s)"
@@ -0,0 +1,48 @@
+"""
+BM25-Index des AI Assistant: Termin-Dokumente und begrenztes Wachstum bei Änderungen
+"""
+from datetime import datetime
+
+import crm_retrieval
+from crm_retrieval import RetrievalIndex
+
+def test_appointment_document_contains_employee_name(db):
+    employee = db.execute_query("SELECT id, first_name, last_name FROM employees ORDER BY id LIMIT 1")[0]
+    customer_id = db.execute_update(
+        "INSERT INTO customers (first_name, last_name) VALUES (?, ?)", ("Mira", "Sommer"))
+    appointment_id = db.execute_update("""
+        INSERT INTO appointments (customer_id, service_id, employee_id, appointment_date,
+                                  appointment_time, duration, status)
+        VALUES (?, 1, ?, ?, '10:00', 60, 'geplant')
+    """, (customer_id, employee['id'], datetime.now().strftime("%Y-%m-%d")))
+
+    index = RetrievalIndex()
+    index.refresh(force=True)
+    texts = [text for _, kind, record_id, text in index.search(f"Termin {employee['last_name']}")
+             if kind == 'appointment' and record_id == appointment_id]
+    assert texts and f"bei {employee['first_name']} {employee['last_name']}" in texts[0]
+
+def test_updates_do_not_grow_index(monkeypatch):
+    monkeypatch.setattr(crm_retrieval, "COMPACT_MIN_DEAD", 50)
+    index = RetrievalIndex()
+    for customer_id in range(200):
+        index.upsert('customer', customer_id, f"Kunde #{customer_id}: Anna Muster{customer_id}, 0 Treuepunkte")
+    for version in range(1, 20):
+        for customer_id in range(200):
+            index.upsert('customer', customer_id,
+                         f"Kunde #{customer_id}: Anna Muster{customer_id}, {version} Treuepunkte")
+
+    assert len(index) == 200
+    # Höchstens ein Viertel gelöschte Dokumente bleibt liegen, bevor kompaktiert wird
+    assert len(index._docs) <= 250
+    assert len(index._postings["treuepunkt"]) <= 250
+    results = index.search("Muster7 19 Treuepunkte")
+    assert results[0][1:3] == ('customer', 7)
+    assert "19 Treuepunkte" in results[0][3]
+
+def test_removed_documents_are_not_found():
+    index = RetrievalIndex()
+    index.upsert('product', 1, "Produkt #1: Haaröl")
+    index.upsert('product', 2, "Produkt #2: Haarspray")
+    index.remove('product', 1)
+    assert [record_id for _, _, record_id, _ in index.search("Haaröl Produkt")] == [2]
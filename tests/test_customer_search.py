@@ -0,0 +1,77 @@
+"""
+Kundensuche: Abgleich des Index mit Löschungen anderer Prozesse
+"""
+import customer_search
+from customer_search import CustomerSearchIndex
+
+def _add_customers(db, count, last_name="Muster"):
+    for i in range(count):
+        db.execute_update("INSERT INTO customers (first_name, last_name, email) VALUES (?, ?, ?)",
+                          (f"Kunde{i}", last_name, f"kunde{i}.{last_name.lower()}@example.com"))
+
+def test_refresh_drops_customers_deleted_elsewhere(db, monkeypatch):
+    """Direkt in der Datenbank gelöschte Kunden verschwinden spätestens beim nächsten Abgleich"""
+    _add_customers(db, 5)
+    index = CustomerSearchIndex()
+    index.refresh(force=True)
+    assert len(index.search("muster")) == 5
+
+    # Löschung durch einen anderen Prozess: kein refresh_customer()-Aufruf
+    db.execute_update("DELETE FROM customers WHERE first_name IN ('Kunde1', 'Kunde3')")
+    index.refresh(force=True)
+    assert len(index.search("muster")) == 5  # Abgleich noch nicht fällig
+
+    monkeypatch.setattr(customer_search, "SEARCH_RECONCILE_SECONDS", 0)
+    index.refresh(force=True)
+    assert sorted(c['first_name'] for c in index.search("muster")) == ["Kunde0", "Kunde2", "Kunde4"]
+    assert index.search("kunde1.muster@example.com") == []
+    assert len(index) == 3
+
+def test_bulk_delete_keeps_remaining_customers_searchable(db):
+    """Viele Löschungen auf einmal filtern die Paarliste; übrige Kunden bleiben auffindbar"""
+    _add_customers(db, 100, "Alt")
+    _add_customers(db, 10, "Neu")
+    index = CustomerSearchIndex()
+    index.refresh(force=True)
+
+    db.execute_update("DELETE FROM customers WHERE last_name = 'Alt'")
+    assert index.reconcile() == 100
+    assert index.search("alt") == []
+    assert len(index.search("neu", limit=20)) == 10
+    assert index.search("kunde7.neu@example.com")[0]['first_name'] == "Kunde7"
+    assert len(index._keys) == len(index._ids) == sum(
+        len(index._tokens(*fields)[1]) for fields in index._customers.values())
+    assert index.reconcile() == 0
+
+STAMP = "2031-01-01 10:00:00"
+
+def test_refresh_sees_updates_in_same_second(db):
+    """Änderung eines anderen Prozesses mit demselben updated_at wie der letzte Stand wird gefunden"""
+    _add_customers(db, 3)
+    db.execute_update("UPDATE customers SET updated_at = ?", (STAMP,))
+    index = CustomerSearchIndex()
+    index.refresh(force=True)
+
+    # Gleiche Sekunde: updated_at bleibt STAMP, kein refresh_customer()
+    db.execute_update("UPDATE customers SET last_name = 'Neumann', updated_at = ? WHERE first_name = 'Kunde1'",
+                      (STAMP,))
+    index.refresh(force=True)
+    assert [c['first_name'] for c in index.search("neumann")] == ["Kunde1"]
+    assert [c['first_name'] for c in index.search("muster")] == ["Kunde0", "Kunde2"]
+
+def test_settled_second_is_not_reread(db, monkeypatch):
+    """Ist die Sekunde abgeschlossen, liest der Refresh ihre Zeilen nicht bei jeder Suche erneut"""
+    _add_customers(db, 20)
+    db.execute_update("UPDATE customers SET updated_at = ?", (STAMP,))
+    index = CustomerSearchIndex()
+    assert index.refresh(force=True) == 20
+    assert index.refresh(force=True) == 20  # Sekunde noch offen: erneut gelesen
+
+    monkeypatch.setattr(customer_search, "UPDATED_AT_SETTLE", 0)
+    assert index.refresh(force=True) == 20  # letzter Durchlauf mit '>=', danach abgeschlossen
+    assert index.refresh(force=True) == 0
+
+    db.execute_update("UPDATE customers SET first_name = 'Zora', updated_at = ? WHERE first_name = 'Kunde5'",
+                      ("2031-01-01 10:00:01",))
+    assert index.refresh(force=True) == 1
+    assert [c['first_name'] for c in index.search("zora")] == ["Zora"]
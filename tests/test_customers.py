@@ -0,0 +1,91 @@
+"""
+Kundenliste der API: Spaltenumfang und Pagination
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+def test_api_customers_keeps_all_columns(db):
+    """/api/customers liefert weiterhin alle Kundenspalten, nur seitenweise"""
+    import api
+
+    for i in range(3):
+        db.execute_update("""
+            INSERT INTO customers (first_name, last_name, email, address, notes)
+            VALUES (?, ?, ?, ?, ?)
+        """, (f"Anna{i}", "Muster", f"anna{i}@example.com", "Hauptstr. 1", "mag Tee"))
+
+    with TestClient(api.app) as client:
+        response = client.get("/api/customers", params={"limit": 2})
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) == 2
+        assert {"address", "notes", "updated_at"} <= page[0].keys()
+        assert page[0]["address"] == "Hauptstr. 1" and page[0]["notes"] == "mag Tee"
+
+        rest = client.get("/api/customers", params={"limit": 2, "after": response.headers["X-Next-Cursor"]})
+        assert [c["first_name"] for c in page + rest.json()] == ["Anna0", "Anna1", "Anna2"]
+
+def test_export_streams_are_limited(db, monkeypatch):
+    """Laufende Exporte belegen Stream-Plätze; ist alles belegt, antwortet die API mit 503"""
+    import api
+    from db_executor import DBExecutor
+
+    executor = DBExecutor(workers=2, max_queue=2, max_streams=1)
+    monkeypatch.setattr("db_executor.db_executor", executor)
+    db.execute_update("INSERT INTO customers (first_name, last_name) VALUES ('Anna', 'Muster')")
+
+    with TestClient(api.app) as client:
+        # Ein laufender Export belegt den einzigen Platz
+        running = executor.open_stream(iter([]))
+        busy = client.get("/api/customers/export")
+        assert busy.status_code == 503 and busy.headers["Retry-After"] == "1"
+
+        running.close()
+        response = client.get("/api/customers/export")
+        assert response.status_code == 200
+        assert [c["first_name"] for c in response.json()] == ["Anna"]
+        assert client.get("/api/export/sales", params={"month": "2031-03"}).status_code == 200
+
+    # Platz nach dem letzten Byte wieder frei
+    assert executor.stats()["streams"] == 0
+    assert executor.stats()["streams_rejected"] == 1
+
+def test_stream_slot_released_when_closed_early(db):
+    """Abgebrochene oder nie gestartete Streams geben Platz und Verbindung frei"""
+    from customers import iter_customers
+    from db_executor import DBExecutor, DatabaseBusyError
+
+    executor = DBExecutor(workers=1, max_queue=0, max_streams=1)
+    for i in range(3):
+        db.execute_update("INSERT INTO customers (first_name, last_name) VALUES (?, 'Muster')", (f"K{i}",))
+
+    stream = executor.open_stream(iter_customers())
+    next(stream)
+    with pytest.raises(DatabaseBusyError):
+        executor.open_stream(iter_customers())
+    stream.close()
+    assert executor.stats()["streams"] == 0
+
+    # Nie iteriert und ohne close() verworfen (Client vor dem ersten Byte getrennt)
+    executor.open_stream(iter_customers())
+    assert executor.stats()["streams"] == 0
+    executor.open_stream(iter_customers()).close()
+
+def test_dropped_stream_never_takes_executor_lock():
+    """Wird ein Stream eingesammelt, während derselbe Thread _lock hält, darf nichts blockieren"""
+    import threading
+    from db_executor import DBExecutor
+
+    executor = DBExecutor(workers=1, max_queue=0, max_streams=1)
+
+    def drop_under_lock():
+        stream = executor.open_stream(iter([1, 2]))
+        with executor._lock:
+            del stream  # Finalizer läuft hier, wie bei einer GC mitten in open_stream()
+
+    worker = threading.Thread(target=drop_under_lock, daemon=True)
+    worker.start()
+    worker.join(timeout=5)
+    assert not worker.is_alive(), "Finalizer hat auf _lock gewartet (Deadlock)"
+    assert executor.stats()["streams"] == 0
+    executor.open_stream(iter([])).close()
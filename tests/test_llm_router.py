@@ -0,0 +1,226 @@
+"""
+LLM-Router gegen lokale Stub-Server: langsame und fehlerhafte Provider, Circuit Breaker, Hedging
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+import requests
+
+import llm_router
+from llm_router import AllProvidersFailedError, CircuitBreaker, LLMRouter, Provider
+
+class StubLLM:
+    """HTTP-Server auf einem freien Port: antwortet nach `delay` Sekunden mit `status` und {"response": text}"""
+
+    def __init__(self, text: str, status: int = 200, delay: float = 0.0):
+        self.text, self.status, self.delay = text, status, delay
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self):
+                stub.hits += 1
+                time.sleep(stub.delay)
+                body = json.dumps({"response": stub.text, "models": []}).encode()
+                try:
+                    self.send_response(stub.status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client hat nach Timeout/Abbruch bereits aufgelegt
+
+            def do_GET(self):
+                self._reply()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self._reply()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def call(self, prompt: str, model: str, timeout: float = 2.0) -> str:
+        response = requests.post(f"{self.url}/api/generate", json={"prompt": prompt}, timeout=timeout)
+        response.raise_for_status()
+        return response.json()["response"]
+
+    async def acall(self, prompt: str, model: str, timeout: float = 2.0) -> str:
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            response = await client.post(f"{self.url}/api/generate", json={"prompt": prompt})
+        response.raise_for_status()
+        return response.json()["response"]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stubs():
+    created = []
+
+    def make(*args, **kwargs):
+        stub = StubLLM(*args, **kwargs)
+        created.append(stub)
+        return stub
+    yield make
+    for stub in created:
+        stub.close()
+
+def _provider(name, stub, breaker=None, timeout=2.0):
+    return Provider(name, lambda prompt, model: stub.call(prompt, model, timeout),
+                    breaker=breaker or CircuitBreaker(failure_threshold=2, reset_timeout=0.3),
+                    acall=lambda prompt, model: stub.acall(prompt, model, timeout))
+
+def test_failing_provider_falls_back_and_opens_breaker(stubs):
+    broken, cloud = stubs("kaputt", status=500), stubs("von der Cloud")
+    router = LLMRouter([_provider("Ollama", broken), _provider("Cloud", cloud)])
+
+    for _ in range(4):
+        assert router.complete("Hallo", "m", hedge=False) == "von der Cloud"
+    # Nach zwei Fehlern in Folge ist der Breaker offen: Ollama wird nicht mehr angefragt
+    assert broken.hits == 2
+    assert router.providers[0].breaker.state == llm_router.OPEN
+
+def test_breaker_half_open_probe_recovers(stubs):
+    flaky, cloud = stubs("wieder da", status=500), stubs("von der Cloud")
+    router = LLMRouter([_provider("Ollama", flaky), _provider("Cloud", cloud)])
+    router.complete("a", "m", hedge=False)
+    router.complete("b", "m", hedge=False)
+    assert router.providers[0].breaker.state == llm_router.OPEN
+
+    flaky.status = 200
+    time.sleep(0.35)
+    assert router.complete("c", "m", hedge=False) == "wieder da"
+    assert router.providers[0].breaker.state == llm_router.CLOSED
+
+def test_hung_provider_times_out_to_fallback(stubs):
+    hung, cloud = stubs("zu spät", delay=1.5), stubs("von der Cloud")
+    router = LLMRouter([_provider("Ollama", hung, timeout=0.3), _provider("Cloud", cloud)])
+    started = time.monotonic()
+    assert router.complete("Hallo", "m", hedge=False) == "von der Cloud"
+    assert time.monotonic() - started < 1.0
+    assert router.providers[0].failures == 1
+
+def test_hedging_starts_fallback_for_slow_provider(stubs, monkeypatch):
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_DEFAULT_DELAY", 0.2)
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_MIN_DELAY", 0.1)
+    slow, fast = stubs("langsam", delay=1.5), stubs("schnell")
+    router = LLMRouter([_provider("Ollama", slow), _provider("Cloud", fast)])
+    started = time.monotonic()
+    assert router.complete("Hallo", "m", hedge=True) == "schnell"
+    assert time.monotonic() - started < 1.0
+    assert slow.hits == 1 and fast.hits == 1
+
+def test_async_hedging_cancels_slow_provider(stubs, monkeypatch):
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_DEFAULT_DELAY", 0.2)
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_MIN_DELAY", 0.1)
+    slow, fast = stubs("langsam", delay=1.5), stubs("schnell")
+    router = LLMRouter([_provider("Ollama", slow), _provider("Cloud", fast)])
+
+    started = time.monotonic()
+    assert asyncio.run(router.acomplete("Hallo", "m", hedge=True)) == "schnell"
+    assert time.monotonic() - started < 1.0
+    # Abgebrochener Verlierer zählt nicht als Fehler und hält keinen Probeaufruf fest
+    assert router.providers[0].failures == 0
+    assert router.providers[0].breaker.allow()
+
+def test_all_failing_raises_with_every_error(stubs):
+    first, second = stubs("x", status=500), stubs("y", status=503)
+    router = LLMRouter([_provider("Ollama", first), _provider("Cloud", second)])
+    with pytest.raises(AllProvidersFailedError) as error:
+        router.complete("Hallo", "m", hedge=False)
+    assert set(error.value.errors) == {"Ollama", "Cloud"}
+
+def test_api_chat_reaches_fallback_when_ollama_is_down(db, stubs, monkeypatch):
+    """Ausgefallenes Ollama darf die API nicht vor dem Router abweisen"""
+    from fastapi.testclient import TestClient
+    import ai_assistant
+    import api
+
+    ollama_down, cloud = stubs("kaputt", status=503), stubs("Antwort aus der Cloud")
+    monkeypatch.setattr(ai_assistant, "OLLAMA_BASE_URL", ollama_down.url)
+    monkeypatch.setattr(ai_assistant, "USE_CLOUD_API", False)
+    monkeypatch.setitem(ai_assistant._ollama_health, "expires", 0.0)
+    router = LLMRouter([
+        Provider("Ollama", lambda prompt, model: "nie", enabled=ai_assistant._ollama_enabled),
+        _provider("Cloud", cloud),
+    ])
+    monkeypatch.setattr(ai_assistant, "llm_router", router)
+    monkeypatch.setitem(ai_assistant._STREAMS, "Cloud", lambda prompt, model: iter([cloud.call(prompt, model)]))
+    api.response_cache.clear()
+
+    with TestClient(api.app) as client:
+        response = client.post("/api/ai/chat", json={"message": "Wie viele Kunden?"}).json()
+        assert response == {"response": "Antwort aus der Cloud"}
+
+        stream = client.post("/api/ai/chat/stream", json={"message": "Umsatz heute?"}).text
+        assert '"token": "Antwort aus der Cloud"' in stream
+
+def test_ollama_enabled_reads_cached_status_only(stubs, monkeypatch):
+    """enabled() läuft in acomplete auf der Event-Loop und darf deshalb nie per HTTP prüfen"""
+    import ai_assistant
+
+    ollama = stubs("ok", delay=0.5)
+    monkeypatch.setattr(ai_assistant, "OLLAMA_BASE_URL", ollama.url)
+    monkeypatch.setattr(ai_assistant, "USE_CLOUD_API", False)
+    monkeypatch.setitem(ai_assistant._ollama_health, "available", True)
+    monkeypatch.setitem(ai_assistant._ollama_health, "expires", 0.0)  # Cache abgelaufen
+
+    assert [p.name for p in ai_assistant.llm_router.candidates()][:1] == ["Ollama"]
+    assert ollama.hits == 0
+
+def test_api_stays_responsive_during_long_generations(db, monkeypatch):
+    """Laufende AI-Generierungen dürfen andere Endpunkte (hier /api/services) nicht aufhalten"""
+    import ai_assistant
+    import api
+
+    generation = 1.0
+
+    async def slow_generate(prompt, model):
+        await asyncio.sleep(generation)
+        return "fertig"
+
+    def blocking_generate(prompt, model):
+        raise AssertionError("Die API muss den asynchronen Pfad nutzen")
+
+    monkeypatch.setattr(ai_assistant, "USE_CLOUD_API", True)
+    monkeypatch.setattr(ai_assistant, "llm_router",
+                        LLMRouter([Provider("Langsam", blocking_generate, acall=slow_generate)]))
+    api.response_cache.clear()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=10) as client:
+            started = time.perf_counter()
+            chats = [asyncio.create_task(client.post("/api/ai/chat", json={"message": f"Frage {i}"}))
+                     for i in range(4)]
+            await asyncio.sleep(0.2)  # Generierungen laufen
+
+            latencies = []
+            for _ in range(5):
+                begin = time.perf_counter()
+                response = await client.get("/api/services")
+                latencies.append(time.perf_counter() - begin)
+                assert response.status_code == 200 and response.json()
+            services_done = time.perf_counter() - started
+
+            answers = [(await chat).json() for chat in chats]
+            return latencies, services_done, answers, time.perf_counter() - started
+
+    latencies, services_done, answers, total = asyncio.run(scenario())
+    assert answers == [{"response": "fertig"}] * 4
+    assert max(latencies) < 0.25, f"/api/services brauchte bis zu {max(latencies):.2f} s"
+    assert services_done < generation  # beantwortet, während die Generierungen noch liefen
+    assert total < 2 * generation  # die vier Generierungen liefen parallel, nicht nacheinander
@@ -0,0 +1,38 @@
+"""
+Stammdaten-Cache: nur Abfragen cachen, deren gelesene Tabellen vollständig erkannt werden
+"""
+import pytest
+
+from database import QueryCache
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM services WHERE active = 1 ORDER BY category, name",
+    "SELECT s.name, e.first_name FROM services s JOIN employees e ON e.id = s.id WHERE s.id IN (1, 2)",
+    "SELECT COALESCE(name, ''), price FROM products ORDER BY category, name",
+])
+def test_reference_table_queries_are_cached(query):
+    assert QueryCache().cacheable_tables(query)
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM services s, appointments a WHERE a.service_id = s.id",
+    "SELECT * FROM services s,appointments a WHERE a.service_id = s.id",
+    "SELECT s.* FROM services s JOIN employees e ON e.id = s.id, appointments a WHERE a.service_id = s.id",
+    "SELECT name FROM services WHERE id IN (SELECT service_id FROM appointments)",
+    "SELECT * FROM (SELECT * FROM services) s",
+    "SELECT *, (SELECT COUNT(*) FROM appointments) AS n FROM services",
+])
+def test_queries_with_hidden_tables_are_not_cached(query):
+    assert QueryCache().cacheable_tables(query) is None
+
+def test_comma_join_sees_writes_to_other_table(db):
+    """Schreibzugriffe auf appointments müssen beim nächsten Lesen eines Komma-Joins sichtbar sein"""
+    query = """
+        SELECT COUNT(*) as n FROM services s, appointments a
+        WHERE a.service_id = s.id AND a.appointment_date = ?
+    """
+    assert db.execute_query(query, ("2031-05-05",))[0]['n'] == 0
+    db.execute_update("""
+        INSERT INTO appointments (customer_id, service_id, appointment_date, appointment_time, duration)
+        VALUES (1, 1, '2031-05-05', '10:00', 30)
+    """)
+    assert db.execute_query(query, ("2031-05-05",))[0]['n'] == 1
@@ -0,0 +1,151 @@
+"""
+Die häufigsten Abfragen (booking_system, api, Streamlit-Seiten) dürfen keine Haupttabelle
+vollständig scannen – geprüft über EXPLAIN QUERY PLAN gegen das migrierte Schema.
+"""
+import re
+
+import pytest
+
+HOT_TABLES = {"appointments", "sales", "sale_items", "customers"}
+
+# (Herkunft, SQL, Parameter) – SQL wie in der jeweiligen Funktion
+HOT_QUERIES = [
+    ("availability.load_day (check_availability, reserve_slot)", """
+        SELECT employee_id, appointment_time, duration
+        FROM appointments
+        WHERE appointment_date = ?
+        AND status != 'abgesagt'
+    """, ("2024-01-01",)),
+    ("availability.load_range (find_next_available_slots)", """
+        SELECT appointment_date, employee_id, appointment_time, duration
+        FROM appointments
+        WHERE appointment_date BETWEEN ? AND ?
+        AND status != 'abgesagt'
+    """, ("2024-01-01", "2024-01-14")),
+    ("booking_system.get_week_view", """
+        SELECT a.id, a.appointment_date, a.appointment_time, a.duration, a.status,
+               a.customer_id, a.service_id, a.employee_id,
+               c.first_name || ' ' || c.last_name as customer_name,
+               s.name as service_name, e.first_name || ' ' || e.last_name as employee_name
+        FROM appointments a
+        LEFT JOIN customers c ON a.customer_id = c.id
+        LEFT JOIN services s ON a.service_id = s.id
+        LEFT JOIN employees e ON a.employee_id = e.id
+        WHERE a.appointment_date BETWEEN ? AND ?
+        ORDER BY a.appointment_date, a.employee_id, a.appointment_time
+    """, ("2024-01-01", "2024-01-07")),
+    ("booking_system.get_employee_schedule", """
+        SELECT a.*, c.first_name || ' ' || c.last_name as customer_name,
+               s.name as service_name, s.duration, s.price
+        FROM appointments a
+        LEFT JOIN customers c ON a.customer_id = c.id
+        LEFT JOIN services s ON a.service_id = s.id
+        WHERE a.employee_id = ? AND a.appointment_date = ?
+        ORDER BY a.appointment_time
+    """, (1, "2024-01-01")),
+    ("booking_system.create_online_booking", "SELECT id FROM customers WHERE email = ?",
+     ("anna@example.com",)),
+    ("booking_system.get_upcoming_appointments", """
+        SELECT a.*, c.first_name || ' ' || c.last_name as customer_name,
+               c.phone, c.email, s.name as service_name, s.price,
+               e.first_name || ' ' || e.last_name as employee_name
+        FROM appointments a
+        LEFT JOIN customers c ON a.customer_id = c.id
+        LEFT JOIN services s ON a.service_id = s.id
+        LEFT JOIN employees e ON a.employee_id = e.id
+        WHERE a.appointment_date >= date('now')
+        AND a.appointment_date <= ?
+        AND a.status != 'abgesagt'
+        ORDER BY a.appointment_date, a.appointment_time
+    """, ("2024-12-31",)),
+    ("api.get_appointments (Datum) / pages/3_Termine", """
+        SELECT a.*, c.first_name || ' ' || c.last_name as customer_name,
+               s.name as service_name, e.first_name || ' ' || e.last_name as employee_name
+        FROM appointments a
+        LEFT JOIN customers c ON a.customer_id = c.id
+        LEFT JOIN services s ON a.service_id = s.id
+        LEFT JOIN employees e ON a.employee_id = e.id
+        WHERE a.appointment_date = ?
+        ORDER BY a.appointment_time
+    """, ("2024-01-01",)),
+    ("api.get_appointments (neueste 50)", """
+        SELECT a.*, c.first_name || ' ' || c.last_name as customer_name,
+               s.name as service_name, e.first_name || ' ' || e.last_name as employee_name
+        FROM appointments a
+        LEFT JOIN customers c ON a.customer_id = c.id
+        LEFT JOIN services s ON a.service_id = s.id
+        LEFT JOIN employees e ON a.employee_id = e.id
+        ORDER BY a.appointment_date DESC, a.appointment_time DESC
+        LIMIT 50
+    """, ()),
+    ("api.get_sales", """
+        SELECT s.*, c.first_name || ' ' || c.last_name as customer_name
+        FROM sales s
+        LEFT JOIN customers c ON s.customer_id = c.id
+        WHERE s.sale_date >= date('now', '-' || ? || ' days')
+        ORDER BY s.sale_date DESC, s.sale_time DESC
+    """, (30,)),
+    ("pages/3_Termine Übersicht", """
+        SELECT a.appointment_date, a.appointment_time,
+               c.first_name || ' ' || c.last_name as customer,
+               s.name as service, e.first_name || ' ' || e.last_name as employee, a.status
+        FROM appointments a
+        LEFT JOIN customers c ON a.customer_id = c.id
+        LEFT JOIN services s ON a.service_id = s.id
+        LEFT JOIN employees e ON a.employee_id = e.id
+        WHERE a.appointment_date >= ?
+        ORDER BY a.appointment_date, a.appointment_time
+    """, ("2024-01-01",)),
+    ("simplybook_features.get_appointments_needing_reminder", """
+        SELECT a.*, c.first_name || ' ' || c.last_name as customer_name,
+               c.email, c.phone, s.name as service_name
+        FROM appointments a
+        LEFT JOIN customers c ON a.customer_id = c.id
+        LEFT JOIN services s ON a.service_id = s.id
+        WHERE a.status = 'geplant'
+        AND a.reminder_sent = 0
+        AND datetime(a.appointment_date || ' ' || a.appointment_time) <= datetime(?)
+        AND datetime(a.appointment_date || ' ' || a.appointment_time) > datetime('now')
+    """, ("2024-01-02 10:00",)),
+    ("simplybook_features.get_waitlist", """
+        SELECT a.*, c.first_name || ' ' || c.last_name as customer_name, c.phone, c.email
+        FROM appointments a
+        JOIN customers c ON a.customer_id = c.id
+        WHERE a.service_id = ?
+        AND a.appointment_date = ?
+        AND a.status = 'warteliste'
+        ORDER BY a.created_at
+    """, (1, "2024-01-01")),
+    ("dashboard_stats (Termine heute)", """
+        SELECT COUNT(*) FROM appointments WHERE appointment_date = ? AND status != 'abgesagt'
+    """, ("2024-01-01",)),
+    ("sales_system / Kasse: Positionen eines Verkaufs", "SELECT * FROM sale_items WHERE sale_id = ?", (1,)),
+    ("analytics: Verkäufe pro Produkt", """
+        SELECT item_id, SUM(quantity) FROM sale_items WHERE item_type = ? GROUP BY item_id
+    """, ("product",)),
+]
+
+def _full_scans(db, query, params):
+    """Tabellen, die laut Ausführungsplan vollständig gelesen werden"""
+    aliases = {alias.lower(): table.lower() for table, alias in
+               re.findall(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?!ON\b|WHERE\b|LEFT\b|JOIN\b|ORDER\b)(\w+))?",
+                          query, re.IGNORECASE)
+               if alias}
+    plan = db.execute_query("EXPLAIN QUERY PLAN " + query, params or None)
+    scans = []
+    for row in plan:
+        match = re.match(r"SCAN (\w+)(.*)", row['detail'])
+        # "SCAN x USING INDEX" läuft in Indexreihenfolge (z.B. ORDER BY ... LIMIT) und zählt nicht
+        if match and "USING" not in match.group(2):
+            table = aliases.get(match.group(1).lower(), match.group(1).lower())
+            if table in HOT_TABLES:
+                scans.append(row['detail'])
+    return scans
+
+@pytest.mark.parametrize("source,query,params", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_uses_index(db, source, query, params):
+    assert _full_scans(db, query, params) == []
+
+def test_detects_full_scan(db):
+    """Gegenprobe: eine Abfrage ohne passenden Index wird erkannt"""
+    assert _full_scans(db, "SELECT * FROM appointments a WHERE a.notes = ?", ("x",))
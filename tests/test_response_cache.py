@@ -0,0 +1,39 @@
+"""
+AI-Antwort-Cache: verzögertes, gebündeltes Speichern in die Datei
+"""
+import time
+
+from response_cache import ResponseCache
+
+def test_puts_are_batched_until_flush(tmp_path):
+    """put() schreibt nicht selbst; flush() speichert alle Änderungen in einem Durchgang"""
+    path = tmp_path / "ai_cache.json"
+    cache = ResponseCache(ttl=600, max_entries=100, path=str(path), save_delay=60)
+    for i in range(50):
+        cache.put(f"k{i}", f"Antwort {i}")
+    assert not path.exists()
+    assert cache.stats()["pending_save"] and cache.stats()["saves"] == 0
+
+    cache.flush()
+    cache.flush()  # nichts mehr ausstehend
+    assert cache.stats()["saves"] == 1 and not cache.stats()["pending_save"]
+
+    restored = ResponseCache(ttl=600, max_entries=100, path=str(path), save_delay=60)
+    assert restored.get("k0") == "Antwort 0" and restored.get("k49") == "Antwort 49"
+
+def test_timer_saves_once_per_burst(tmp_path):
+    """Viele Antworten kurz hintereinander landen mit einem einzigen Schreibvorgang in der Datei"""
+    path = tmp_path / "ai_cache.json"
+    cache = ResponseCache(ttl=600, max_entries=100, path=str(path), save_delay=0.2)
+    for i in range(20):
+        cache.put(f"k{i}", f"Antwort {i}")
+
+    deadline = time.monotonic() + 5
+    while cache.stats()["saves"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert cache.stats()["saves"] == 1
+    assert ResponseCache(path=str(path), save_delay=60).get("k19") == "Antwort 19"
+
+    cache.clear()
+    cache.flush()
+    assert ResponseCache(path=str(path), save_delay=60).get("k19") is None
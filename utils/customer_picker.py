@@ -0,0 +1,22 @@
+import streamlit as st
+from customer_search import search_customers
+
+def customer_picker(label="Kunde", key="customer", none_option=None, limit=20):
+    """Suchfeld + Trefferliste statt Selectbox über alle Kunden; gibt die Kunden-ID zurück"""
+    query = st.text_input(f"🔍 {label} suchen (Name, E-Mail, Telefon)", key=f"{key}_query")
+
+    options = {}
+    if none_option:
+        options[none_option] = None
+
+    if query.strip():
+        for c in search_customers(query, limit):
+            contact = c['email'] or c['phone'] or ""
+            options[f"{c['first_name']} {c['last_name']}" + (f" ({contact})" if contact else "") + f" #{c['id']}"] = c['id']
+        if len(options) == (1 if none_option else 0):
+            st.caption("Keine Treffer")
+
+    if not options:
+        return None
+    selected = st.selectbox(label, list(options.keys()), key=f"{key}_select")
+    return options[selected]